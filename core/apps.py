@@ -1,6 +1,10 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+    def ready(self) -> None:
+        from core import sqlite
+        connection_created.connect(sqlite.apply_pragmas, dispatch_uid='core.sqlite.apply_pragmas')
@@ -0,0 +1,74 @@
+import io
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from core.models import User
+from core.parsers import MessagePackParser
+from core.renderers import FastJSONRenderer, MessagePackRenderer
+from store.models import Collection, Customer, Order, OrderItem, Product
+from store.serializers import OrderSerializer, ProductSerializer
+
+
+def product_list(count):
+    collection = Collection(id=1, title='Outerwear')
+    return ProductSerializer([
+        Product(id=index, title=f'Product {index}', collection=collection, unit_price=Decimal('19.99') + index,
+                old_unit_price=Decimal('24.99') + index, stock=index % 120,
+                description='Water-resistant shell with taped seams and a packable hood.')
+        for index in range(1, count + 1)
+    ], many=True).data
+
+
+def order_list(count, items_per_order=5):
+    customer = Customer(id=1, user=User(id=1, first_name='Ada', last_name='Lovelace'))
+    orders = []
+    for index in range(1, count + 1):
+        order = Order(id=index, customer=customer, status=Order.STATUS_CONFIRM)
+        # Stand in for prefetch_related('items') without a database.
+        order._prefetched_objects_cache = {'items': [
+            OrderItem(id=index * items_per_order + item, order=order, product_id=item, title=f'Product {item}',
+                      unit_price=Decimal('9.95') * (item + 1), quantity=item % 3 + 1)
+            for item in range(items_per_order)
+        ]}
+        orders.append(order)
+    return OrderSerializer(orders, many=True).data
+
+
+class Command(BaseCommand):
+    help = 'Compare response size and encode time of the JSON, fast JSON and MessagePack renderers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=500)
+        parser.add_argument('--orders', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        payloads = {
+            f"{options['products']} products": product_list(options['products']),
+            f"{options['orders']} orders": order_list(options['orders']),
+        }
+        renderers = [JSONRenderer(), FastJSONRenderer(), MessagePackRenderer()]
+        for name, data in payloads.items():
+            self.stdout.write(name)
+            baseline = None
+            for renderer in renderers:
+                timings = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    body = renderer.render(data, renderer.media_type, {})
+                    timings.append(time.perf_counter() - start)
+                median = statistics.median(timings) * 1000
+                baseline = baseline or median
+                self.stdout.write(
+                    f'  {type(renderer).__name__:<20} {len(body):>9} bytes {median:>9.3f} ms '
+                    f'({baseline / median:.1f}x)'
+                )
+            # Fast JSON and a MessagePack round trip must give back what JSONRenderer sends.
+            expected = JSONRenderer().render(data)
+            decoded = MessagePackParser().parse(io.BytesIO(MessagePackRenderer().render(data)))
+            if FastJSONRenderer().render(data) != expected or JSONRenderer().render(decoded) != expected:
+                self.stdout.write(self.style.ERROR('  renderers disagree on this payload'))
@@ -0,0 +1,65 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Runs in a fresh interpreter: build the WSGI app, then serve one GET through it.
+SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+ready = time.perf_counter()
+modules = len(sys.modules)
+from wsgiref.util import setup_testing_defaults
+environ = {'PATH_INFO': sys.argv[1]}
+setup_testing_defaults(environ)
+status = []
+b''.join(application(environ, lambda code, headers, exc_info=None: status.append(code)))
+done = time.perf_counter()
+print(json.dumps({
+    'setup_ms': (ready - start) * 1000,
+    'first_response_ms': (done - ready) * 1000,
+    'modules_at_ready': modules,
+    'modules_after_response': len(sys.modules),
+    'status': status[0],
+}))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Measure cold start (imports and WSGI setup) and time to first response in fresh processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('settings_modules', nargs='*', default=['shopvelvet.settings', 'shopvelvet.settings_production'])
+        parser.add_argument('--path', default='/store/collections/')
+        parser.add_argument('--runs', type=int, default=5)
+
+    def handle(self, *args, **options):
+        for settings_module in options['settings_modules']:
+            env = {
+                **os.environ,
+                'DJANGO_SETTINGS_MODULE': settings_module,
+                'DJANGO_SECRET_KEY': os.environ.get('DJANGO_SECRET_KEY', settings.SECRET_KEY),
+                'DJANGO_ALLOWED_HOSTS': os.environ.get('DJANGO_ALLOWED_HOSTS', '127.0.0.1'),
+            }
+            results = []
+            for _ in range(options['runs']):
+                start = time.perf_counter()
+                output = subprocess.run([sys.executable, '-c', SCRIPT, options['path']], env=env,
+                                        cwd=settings.BASE_DIR, capture_output=True, text=True, check=True).stdout
+                results.append({**json.loads(output), 'process_ms': (time.perf_counter() - start) * 1000})
+
+            def median(key):
+                return statistics.median(result[key] for result in results)
+            self.stdout.write(
+                f"{settings_module}: process {median('process_ms'):.0f}ms, setup {median('setup_ms'):.0f}ms, "
+                f"first response {median('first_response_ms'):.0f}ms (HTTP {results[-1]['status']}), "
+                f"modules {results[-1]['modules_at_ready']} at ready / {results[-1]['modules_after_response']} after response "
+                f"[median of {len(results)}]"
+            )
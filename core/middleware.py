@@ -0,0 +1,165 @@
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+from django.utils.text import slugify
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+
+def get_setting(name, default):
+    return getattr(settings, 'PROFILING', {}).get(name, default)
+
+
+class StackSampler(threading.Thread):
+    """Samples another thread's Python stack into collapsed-stack counts."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    _active = 0
+    _active_lock = threading.Lock()
+    _switch_interval = sys.getswitchinterval()
+
+    def run(self):
+        # The sampler only runs when the GIL switches threads, every 5ms by default.
+        with self._active_lock:
+            StackSampler._active += 1
+            sys.setswitchinterval(min(self._switch_interval, self.interval))
+        try:
+            while not self._stopped.wait(self.interval):
+                frame = sys._current_frames().get(self.thread_id)
+                if frame is not None:
+                    self.stacks[self._collapse(frame)] += 1
+        finally:
+            with self._active_lock:
+                StackSampler._active -= 1
+                if not StackSampler._active:
+                    sys.setswitchinterval(self._switch_interval)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    @staticmethod
+    def _collapse(frame):
+        names = []
+        while frame is not None:
+            names.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+
+class QueryTimeline:
+    """`execute_wrapper` recording every query with its offset and duration."""
+
+    def __init__(self, alias, start):
+        self.alias = alias
+        self.start = start
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            finished = time.perf_counter()
+            self.queries.append({
+                'alias': self.alias,
+                'offset_ms': round((started - self.start) * 1000, 3),
+                'duration_ms': round((finished - started) * 1000, 3),
+                'sql': sql,
+            })
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a request when a staff user sends the `PROFILING['HEADER']`
+    header, or at random for `PROFILING['SAMPLE_RATE']` of requests. Collapsed
+    stacks (`.folded`, flamegraph.pl input) and a query timeline (`.sql.json`)
+    are written to `PROFILING['DIRECTORY']`, keeping the newest
+    `PROFILING['RETENTION']` profiles. Not installed unless
+    `PROFILING['ENABLED']` is set.
+    """
+
+    def __init__(self, get_response):
+        if not get_setting('ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.header = 'HTTP_' + get_setting('HEADER', 'X-Profile').upper().replace('-', '_')
+        self.sample_rate = get_setting('SAMPLE_RATE', 0.0)
+        self.interval = get_setting('INTERVAL', 0.001)
+        self.directory = Path(get_setting('DIRECTORY', settings.BASE_DIR / 'profiles'))
+        self.retention = get_setting('RETENTION', 50)
+
+    def __call__(self, request):
+        if not self._should_profile(request):
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        timelines = [QueryTimeline(alias, start) for alias in connections]
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        with ExitStack() as stack:
+            for timeline in timelines:
+                stack.enter_context(connections[timeline.alias].execute_wrapper(timeline))
+            sampler.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                sampler.stop()
+        elapsed = time.perf_counter() - start
+
+        name = f"{timezone.now():%Y%m%dT%H%M%S%f}-{request.method.lower()}-{slugify(request.path)[:80]}"
+        self._save(name, request, response, elapsed, sampler.stacks,
+                   [query for timeline in timelines for query in timeline.queries])
+        response['X-Profile-Id'] = name
+        return response
+
+    def _should_profile(self, request):
+        if self.header in request.META:
+            return self._is_staff(request)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _is_staff(self, request):
+        if request.user.is_authenticated:
+            return request.user.is_staff
+        api_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+        try:
+            return api_request.user.is_staff
+        except APIException:
+            return False
+
+    def _save(self, name, request, response, elapsed, stacks, queries):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / f'{name}.folded', 'w') as folded:
+            for collapsed, count in stacks.most_common():
+                folded.write(f'{collapsed} {count}\n')
+        with open(self.directory / f'{name}.sql.json', 'w') as timeline:
+            json.dump({
+                'method': request.method,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'elapsed_ms': round(elapsed * 1000, 3),
+                'sample_interval_ms': self.interval * 1000,
+                'query_count': len(queries),
+                'query_time_ms': round(sum(query['duration_ms'] for query in queries), 3),
+                'queries': queries,
+            }, timeline, indent=2)
+        profiles = sorted(self.directory.glob('*.folded'), reverse=True)
+        for stale in profiles[self.retention:]:
+            stale.unlink(missing_ok=True)
+            stale.with_suffix('.sql.json').unlink(missing_ok=True)
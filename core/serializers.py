@@ -1,5 +1,6 @@
 from djoser.serializers import UserCreateSerializer as BaseUserCreateSerializer
 from djoser.serializers import UserSerializer as BaseUserSerializer
+from rest_framework import serializers
 
 
 class UserCreateSerializer(BaseUserCreateSerializer):
@@ -10,4 +11,12 @@ class UserCreateSerializer(BaseUserCreateSerializer):
 
 class UserSerializer(BaseUserSerializer):
     class Meta(BaseUserSerializer.Meta):
-        fields = ['id', 'username', 'email', 'first_name', 'last_name']
\ No newline at end of file
+        fields = ['id', 'username', 'email', 'first_name', 'last_name']
+
+class BatchSubRequestSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=['GET'],default='GET')
+    path = serializers.RegexField(r'^/',max_length=2048)
+
+
+class BatchRequestSerializer(serializers.Serializer):
+    requests = BatchSubRequestSerializer(many=True,allow_empty=False,max_length=20)
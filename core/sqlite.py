@@ -0,0 +1,18 @@
+"""
+Pragmas from `SQLITE_PRAGMAS`, run on new SQLite connections while cart
+group commit (`CART_WRITES['GROUP_COMMIT']`) is on.
+
+With `synchronous=normal` a commit only appends to the WAL without waiting
+for fsync; the database stays consistent after a power loss, though the
+last commits may be lost. WAL itself is stored in the database file, so the
+cart writer switches to it once when it starts (`store.cart_writer`).
+"""
+from django.conf import settings
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite' or not getattr(settings, 'CART_WRITES', {}).get('GROUP_COMMIT', False):
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {name} = {value}')
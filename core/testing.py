@@ -0,0 +1,127 @@
+"""
+Test helpers for catching N+1 queries.
+
+`QueryCountTestCase.assertQueriesConstant` runs a request against one seeded
+row and against many, and fails when any statement runs more often the more
+rows there are, listing the repeated SQL with the code that issued it.
+"""
+import os
+import re
+import traceback
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import TestCase, override_settings
+
+ROW = r'\((?:%s, )*%s\)'
+VARYING = [
+    # Parts of a statement whose length follows the number of rows it handles.
+    (re.compile(r'IN \((?:%s, )*%s\)'), 'IN (...)'),
+    (re.compile(rf'VALUES {ROW}(?:, {ROW})*'), 'VALUES ...'),
+    (re.compile(r'SELECT (?:%s, )*%s(?: UNION ALL SELECT (?:%s, )*%s)*'), 'SELECT ...'),
+    (re.compile(r'CASE WHEN .*? ELSE'), 'CASE WHEN ... ELSE'),
+    # Short lists are often fetched whole, long ones a page at a time.
+    (re.compile(r' (?:LIMIT|OFFSET) \d+'), ''),
+    (re.compile(r'"?s\d+_x\d+"?'), 's?'),
+]
+
+
+def normalize(sql):
+    """SQL with row-count-dependent parts collapsed, so repeats of a statement compare equal."""
+    for pattern, replacement in VARYING:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+def describe_stack(stack, limit=3):
+    """
+    Where a query came from: the innermost `limit` frames of `stack` in the
+    project's own code, after the library frame that ran it, if any.
+    """
+    base, this = Path(settings.BASE_DIR), Path(__file__)
+    frames = []
+    for frame in reversed(stack):
+        path = Path(frame.filename)
+        if path == this or f'{os.sep}django{os.sep}db{os.sep}' in frame.filename:
+            continue
+        if base in path.parents and 'site-packages' not in path.parts:
+            frames.append(f'{path.relative_to(base)}:{frame.lineno} in {frame.name}')
+        elif not frames:
+            library = path.parts[path.parts.index('site-packages') + 1:] if 'site-packages' in path.parts else path.parts[-2:]
+            frames.append(f'{Path(*library)}:{frame.lineno} in {frame.name}')
+            limit += 1
+        if len(frames) == limit:
+            break
+    return ' <- '.join(frames)
+
+
+class QueryRecorder:
+    """`execute_wrapper` keeping each statement and where it was run from."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.locations = defaultdict(Counter)
+        self.examples = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        statement = normalize(sql)
+        self.counts[statement] += 1
+        self.locations[statement][describe_stack(traceback.extract_stack()[:-1])] += 1
+        self.examples.setdefault(statement, self._interpolate(sql, params) if not many else sql)
+        return execute(sql, params, many, context)
+
+    @staticmethod
+    def _interpolate(sql, params):
+        try:
+            return sql % tuple(map(repr, params or ()))
+        except (TypeError, ValueError):
+            return sql
+
+
+@override_settings(
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}},
+    CACHES={alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'} for alias in settings.CACHES},
+)
+class QueryCountTestCase(TestCase):
+    """
+    Runs with throttling off and every cache in memory, so repeated requests
+    are neither throttled nor served from files left by other runs.
+    """
+    rows = 5
+
+    def record_queries(self, seed, count, request, using):
+        # Each run starts from the same state and leaves nothing behind.
+        for cache in caches.all():
+            cache.clear()
+        with transaction.atomic(using=using):
+            seed(count)
+            recorder = QueryRecorder()
+            with connections[using].execute_wrapper(recorder):
+                response = request()
+            transaction.set_rollback(True, using=using)
+        status = getattr(response, 'status_code', None)
+        if status is not None and status >= 400:
+            self.fail(f'The request failed with {count} seeded rows: {status} {getattr(response, "data", "")}')
+        return recorder
+
+    def assertQueriesConstant(self, seed, request, rows=None, using=DEFAULT_DB_ALIAS):
+        """
+        Call `seed(1)` then `request()`, and again with `seed(rows)`, each in a
+        transaction that is rolled back. Fails if any statement runs more
+        often in the second run.
+        """
+        rows = rows or self.rows
+        one, many = (self.record_queries(seed, count, request, using) for count in (1, rows))
+        repeated = [statement for statement, count in many.counts.items() if count > one.counts[statement]]
+        if not repeated:
+            return
+        lines = [f'Queries grow with the number of rows: {sum(one.counts.values())} for 1 row, '
+                 f'{sum(many.counts.values())} for {rows}.']
+        for statement in repeated:
+            lines.append(f'  {many.counts[statement]}x (was {one.counts[statement]}x) {many.examples[statement]}')
+            for location, count in many.locations[statement].most_common(3):
+                lines.append(f'      {count}x from {location or "<outside the project>"}')
+        self.fail('\n'.join(lines))
@@ -1,3 +1,170 @@
-from django.test import TestCase
+import json
+import os
+import secrets
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, HttpResponseRedirect
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from core import sqlite
+from core.middleware import ProfilingMiddleware, StackSampler
+from core.models import User
+from core.testing import QueryCountTestCase
+from store.models import Collection
+from store.views import CollectionViewset
+
+
+class BatchViewTests(QueryCountTestCase):
+    def setUp(self):
+        self.api = APIClient()
+        Collection.objects.create(title='Shoes')
+
+    def batch(self, *paths):
+        response = self.api.post('/batch/', {'requests': [{'path': path} for path in paths]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return [(result['status'], result['body']) for result in response.data]
+
+    def test_runs_each_sub_request(self):
+        (collections, missing, not_api) = self.batch('/store/collections/', '/store/products/999999/', '/admin/')
+        self.assertEqual((collections[0], collections[1][0]['title']), (200, 'Shoes'))
+        self.assertEqual(missing[0], 404)
+        self.assertEqual(not_api, (404, {'detail': 'Not found.'}))
+
+    def test_sub_requests_share_the_batch_authentication(self):
+        user = User.objects.create_user('batch', 'batch@example.com', 'password')
+        self.api.force_authenticate(user)
+        [(status, body)] = self.batch('/store/addresses/')
+        self.assertEqual((status, body), (200, []))
+
+    def test_plain_django_responses(self):
+        responses = [HttpResponseRedirect('/store/products/'), HttpResponse('{"ok": true}', content_type='application/json'),
+                     HttpResponse('plain text', status=202)]
+        with mock.patch.object(CollectionViewset, 'list', side_effect=lambda *args, **kwargs: responses.pop(0)):
+            results = self.batch(*['/store/collections/'] * 3)
+        self.assertEqual(results, [(302, ''), (200, {'ok': True}), (202, 'plain text')])
+
+
+@override_settings(SQLITE_PRAGMAS={'synchronous': 'normal', 'busy_timeout': 5000})
+class SqlitePragmaTests(SimpleTestCase):
+    def pragmas(self):
+        connection = mock.MagicMock(vendor='sqlite')
+        sqlite.apply_pragmas(None, connection)
+        cursor = connection.cursor.return_value.__enter__.return_value
+        return [call.args[0] for call in cursor.execute.call_args_list]
+
+    @override_settings(CART_WRITES={'GROUP_COMMIT': False})
+    def test_connections_are_left_alone_without_group_commit(self):
+        self.assertEqual(self.pragmas(), [])
+
+    @override_settings(CART_WRITES={'GROUP_COMMIT': True})
+    def test_group_commit_applies_the_pragmas(self):
+        self.assertEqual(self.pragmas(), ['PRAGMA synchronous = normal', 'PRAGMA busy_timeout = 5000'])
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.staff = User.objects.create_user('profiler', 'profiler@example.com', 'password', is_staff=True)
+        self.user = User.objects.create_user('customer', 'customer@example.com', 'password')
+        Collection.objects.create(title='Shoes')
+
+    def profiling(self, **overrides):
+        return override_settings(PROFILING={'ENABLED': True, 'HEADER': 'X-Profile', 'SAMPLE_RATE': 0.0,
+                                            'DIRECTORY': self.directory, 'RETENTION': 50, **overrides})
+
+    def get(self, user=None, **headers):
+        # A fresh client, since the middleware reads its settings when it is loaded.
+        client = Client()
+        if user:
+            client.force_login(user)
+        return client.get('/store/collections/', **headers)
+
+    def profiles(self, suffix):
+        return sorted(path.name for path in self.directory.glob(f'*{suffix}'))
+
+    def test_not_installed_unless_enabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            ProfilingMiddleware(lambda request: HttpResponse())
+
+    def test_only_staff_can_ask_for_a_profile(self):
+        with self.profiling():
+            self.assertNotIn('X-Profile-Id', self.get(HTTP_X_PROFILE='1'))
+            self.assertNotIn('X-Profile-Id', self.get(self.user, HTTP_X_PROFILE='1'))
+            self.assertNotIn('X-Profile-Id', self.get(self.staff))
+            response = self.get(self.staff, HTTP_X_PROFILE='1')
+        name = response['X-Profile-Id']
+        self.assertEqual(self.profiles('.folded'), [f'{name}.folded'])
+        timeline = json.loads((self.directory / f'{name}.sql.json').read_text())
+        self.assertEqual((timeline['path'], timeline['status']), ('/store/collections/', 200))
+        self.assertEqual(timeline['query_count'], len(timeline['queries']))
+        self.assertTrue(any('"store_collection"' in query['sql'] for query in timeline['queries']))
+
+    def test_sample_rate(self):
+        with self.profiling(SAMPLE_RATE=0.25), mock.patch('core.middleware.random.random', side_effect=[0.2, 0.3]):
+            self.assertIn('X-Profile-Id', self.get())
+            self.assertNotIn('X-Profile-Id', self.get())
+        with self.profiling(), mock.patch('core.middleware.random.random', return_value=0.0):
+            self.assertNotIn('X-Profile-Id', self.get())
+
+    def test_old_profiles_are_pruned(self):
+        with self.profiling(RETENTION=2, SAMPLE_RATE=1.0):
+            names = [self.get()['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual(self.profiles('.folded'), [f'{name}.folded' for name in sorted(names)[1:]])
+        self.assertEqual(self.profiles('.sql.json'), [f'{name}.sql.json' for name in sorted(names)[1:]])
+
+    def test_sampler_collapses_the_target_stack(self):
+        done = threading.Event()
+        thread = threading.Thread(target=done.wait, args=(5,))
+        thread.start()
+        sampler = StackSampler(thread.ident, 0.001)
+        sampler.start()
+        time.sleep(0.05)
+        sampler.stop()
+        done.set()
+        thread.join()
+        self.assertTrue(sampler.stacks)
+        self.assertTrue(all(stack.startswith('threading:_bootstrap;') for stack in sampler.stacks))
+        self.assertTrue(all(stack.endswith('threading:wait') for stack in sampler.stacks))
+
+
+class SettingsProfileTests(SimpleTestCase):
+    def run_python(self, settings_module, *args):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings_module,
+               'DJANGO_SECRET_KEY': secrets.token_urlsafe(50), 'DJANGO_ALLOWED_HOSTS': 'example.com'}
+        result = subprocess.run([sys.executable, *args], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return result.stdout
+
+    def loaded_after_resolving(self, settings_module, path):
+        # A fresh interpreter, since this one has imported every urlconf already.
+        return set(json.loads(self.run_python(settings_module, '-c', (
+            'import json, sys, django; django.setup(); from django.urls import resolve; '
+            f'resolve({path!r}); print(json.dumps(sorted(sys.modules)))'
+        ))))
+
+    def test_store_urls_do_not_import_the_admin_or_debug_urlconfs(self):
+        for settings_module in ('shopvelvet.settings', 'shopvelvet.settings_production'):
+            with self.subTest(settings_module):
+                modules = self.loaded_after_resolving(settings_module, '/store/products/')
+                self.assertIn('store.urls', modules)
+                self.assertFalse(modules & {'shopvelvet.admin_urls', 'debug_toolbar.urls', 'tags.urls'})
+
+    def test_production_skips_admin_autodiscovery_and_the_toolbar(self):
+        modules = self.loaded_after_resolving('shopvelvet.settings_production', '/store/products/')
+        self.assertFalse(modules & {'store.admin', 'debug_toolbar'})
+        self.assertIn('store.admin', self.loaded_after_resolving('shopvelvet.settings_production', '/admin/'))
+
+    def test_production_settings_pass_the_deploy_checks(self):
+        self.run_python('shopvelvet.settings_production', 'manage.py', 'check', '--deploy', '--fail-level', 'ERROR')
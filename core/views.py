@@ -1,3 +1,75 @@
-from django.shortcuts import render
+import copy
+import json
+import time
+from urllib.parse import urlsplit
+
+from django.http import QueryDict
+from django.urls import Resolver404, resolve
+from django.utils.datastructures import MultiValueDict
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.serializers import BatchRequestSerializer
 
 # Create your views here.
+
+class BatchView(APIView):
+    """
+    Run several GET requests against the API views in-process and return all
+    results in one response. Sub-requests reuse the authentication of the
+    batch request and run on the same thread, so they share its DB connection.
+    """
+
+    def post(self, request):
+        serializer = BatchRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response([
+            self._dispatch(request, sub_request['method'], sub_request['path'])
+            for sub_request in serializer.validated_data['requests']
+        ])
+
+    def _dispatch(self, request, method, path):
+        url = urlsplit(path)
+        start = time.perf_counter()
+        try:
+            match = resolve(url.path, getattr(request, 'urlconf', None))
+            view_class = getattr(match.func, 'cls', None)
+            if view_class is None or not issubclass(view_class, APIView) or issubclass(view_class, BatchView):
+                raise Resolver404
+            response = match.func(self._build_request(request, method, url, match), *match.args, **match.kwargs)
+            status, body = response.status_code, self._body(response)
+        except Resolver404:
+            status, body = 404, {'detail': 'Not found.'}
+        return {
+            'path': path,
+            'status': status,
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 3),
+            'body': body,
+        }
+
+    def _body(self, response):
+        # Views may return plain Django responses (redirects, files) without `.data`.
+        if hasattr(response, 'data'):
+            return response.data
+        if response.streaming:
+            return None
+        content = response.content.decode(response.charset, errors='replace')
+        if response.get('Content-Type', '').startswith('application/json'):
+            try:
+                return json.loads(content)
+            except ValueError:
+                pass
+        return content
+
+    def _build_request(self, request, method, url, match):
+        sub_request = copy.copy(request._request)
+        sub_request.method = method
+        sub_request.path = sub_request.path_info = url.path
+        sub_request.META = {**request.META, 'REQUEST_METHOD': method, 'PATH_INFO': url.path, 'QUERY_STRING': url.query}
+        sub_request.GET = QueryDict(url.query)
+        sub_request._post, sub_request._files = QueryDict(), MultiValueDict()
+        sub_request.resolver_match = match
+        if request.user.is_authenticated:
+            sub_request._force_auth_user = request.user
+            sub_request._force_auth_token = request.auth
+        return sub_request
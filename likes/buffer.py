@@ -0,0 +1,141 @@
+"""
+Opt-in write coalescing for likes (`LIKES['BUFFERED_WRITES']`).
+
+Like and unlike intents are queued in process, keyed by
+`(user_id, content_type_id, object_id)`. A like followed by an unlike of the
+same object (or the reverse) cancels out before reaching the database, and
+intents that would not change whether the user likes the object are dropped,
+so callers only count a like or unlike that took effect. The
+queue is flushed when it reaches `BUFFER_SIZE` or `FLUSH_INTERVAL` seconds after
+the first queued intent, with one `bulk_create` and one `DELETE`. A flush
+that fails puts its intents back, behind any newer ones, and is retried on
+the next interval.
+"""
+import atexit
+import logging
+import threading
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+
+from likes.models import LikedItem
+
+LIKE = 'like'
+UNLIKE = 'unlike'
+
+logger = logging.getLogger(__name__)
+
+
+def get_setting(name, default):
+    return getattr(settings, 'LIKES', {}).get(name, default)
+
+
+def is_enabled():
+    return get_setting('BUFFERED_WRITES', False)
+
+
+class LikeBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._timer = None
+
+    def is_liked(self, user_id, content_type_id, object_id):
+        """Whether the user likes the object, counting intents not yet flushed."""
+        with self._lock:
+            intent = self._pending.get((user_id, content_type_id, object_id))
+        if intent is not None:
+            return intent == LIKE
+        return LikedItem.objects.filter(user_id=user_id, content_type_id=content_type_id, object_id=object_id).exists()
+
+    def like(self, user_id, content_type_id, object_id):
+        """Queue a like. Returns False if the user already likes the object."""
+        return self._add((user_id, content_type_id, object_id), LIKE)
+
+    def unlike(self, user_id, content_type_id, object_id):
+        """Queue an unlike. Returns False if the user does not like the object."""
+        return self._add((user_id, content_type_id, object_id), UNLIKE)
+
+    def _add(self, key, intent):
+        liked = self.is_liked(*key)
+        with self._lock:
+            if key in self._pending:
+                # Queued since the check above, or it was already.
+                liked = self._pending[key] == LIKE
+            if liked == (intent == LIKE):
+                return False
+            self._merge(key, intent)
+            full = len(self._pending) >= get_setting('BUFFER_SIZE', 500)
+            if not full:
+                self._schedule()
+        if full:
+            try:
+                self.flush()
+            except Exception:
+                # Already logged and queued again; the intent is not lost.
+                pass
+        return True
+
+    def _merge(self, key, intent):
+        # A like and an unlike of the same object cancel out, in either order.
+        if self._pending.get(key) not in (None, intent):
+            del self._pending[key]
+        else:
+            self._pending[key] = intent
+
+    def _schedule(self):
+        if self._timer is None and self._pending:
+            self._timer = threading.Timer(get_setting('FLUSH_INTERVAL', 1.0), self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            # Logged and queued again by flush.
+            pass
+        finally:
+            connection.close()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return 0, 0
+        likes = [key for key, intent in pending.items() if intent == LIKE]
+        unlikes = [key for key, intent in pending.items() if intent == UNLIKE]
+        try:
+            self._write(likes, unlikes)
+        except Exception:
+            logger.exception('Could not flush %d buffered like intents; queued them again.', len(pending))
+            with self._lock:
+                newer, self._pending = self._pending, {}
+                for key, intent in list(pending.items()) + list(newer.items()):
+                    self._merge(key, intent)
+                self._schedule()
+            raise
+        return len(likes), len(unlikes)
+
+    def _write(self, likes, unlikes):
+        with transaction.atomic():
+            if likes:
+                LikedItem.objects.bulk_create([
+                    LikedItem(user_id=user_id, content_type_id=content_type_id, object_id=object_id)
+                    for (user_id, content_type_id, object_id) in likes
+                ], ignore_conflicts=True)
+            if unlikes:
+                LikedItem.objects.filter(reduce(or_, [
+                    Q(user_id=user_id, content_type_id=content_type_id, object_id=object_id)
+                    for (user_id, content_type_id, object_id) in unlikes
+                ])).delete()
+
+
+buffer = LikeBuffer()
+atexit.register(buffer.flush)
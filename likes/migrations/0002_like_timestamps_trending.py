@@ -0,0 +1,32 @@
+# Generated by Django 3.2.22 on 2026-10-19 17:22
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('likes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='likeditem',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='TrendingCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('worker', models.CharField(max_length=64)),
+                ('bucket_start', models.DateTimeField(db_index=True)),
+                ('counts', models.JSONField(default=dict)),
+            ],
+            options={
+                'unique_together': {('worker', 'bucket_start')},
+            },
+        ),
+    ]
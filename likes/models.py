@@ -10,5 +10,13 @@ class LikedItem(models.Model):
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey()
+    created_at = models.DateTimeField(auto_now_add=True)
     class Meta:
         unique_together = ['user','content_type','object_id']
+
+class TrendingCheckpoint(models.Model):
+    worker = models.CharField(max_length=64)
+    bucket_start = models.DateTimeField(db_index=True)
+    counts = models.JSONField(default=dict)
+    class Meta:
+        unique_together = ['worker','bucket_start']
@@ -1,7 +1,10 @@
 
+from django.db import transaction
 from rest_framework import serializers
 
+from likes import buffer
 from likes.models import LikedItem
+from likes.trending import engine
 
 
 class LikedItemSerializer(serializers.ModelSerializer):
@@ -12,7 +15,18 @@ class LikedItemSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         user_id = self.context['user_id']
         object_id = validated_data['object_id']
+        content_type_id = validated_data['content_type'].id
+        if buffer.is_enabled():
+            if not buffer.buffer.like(user_id,content_type_id,object_id):
+                raise self._already_liked(object_id)
+            engine.record(content_type_id,object_id)
+            self.instance = LikedItem(user_id=user_id,**validated_data)
+            return self.instance
         (self.instance, created) = LikedItem.objects.get_or_create(user_id=user_id,**validated_data)
         if not created:
-            raise serializers.ValidationError({'error':f"You have already liked this object with ID {object_id}. You cannot like it again."})
-        return self.instance
\ No newline at end of file
+            raise self._already_liked(object_id)
+        transaction.on_commit(lambda: engine.record(content_type_id,object_id))
+        return self.instance
+
+    def _already_liked(self, object_id):
+        return serializers.ValidationError({'error':f"You have already liked this object with ID {object_id}. You cannot like it again."})
\ No newline at end of file
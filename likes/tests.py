@@ -1,3 +1,145 @@
-from django.test import TestCase
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.contenttypes.models import ContentType
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from core.models import User
+from core.testing import QueryCountTestCase
+from likes import buffer, trending
+from likes.models import LikedItem
+from store.models import Collection, Product
+
+
+class LikesQueryCountTests(QueryCountTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        cls.collection = Collection.objects.create(title='Collection')
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.staff)
+
+    def seed(self, count):
+        content_type = ContentType.objects.get_for_model(Product)
+        for index in range(count):
+            user = User.objects.create_user(f'user{index}', f'user{index}@example.com', 'password')
+            product = Product.objects.create(title=f'Product {index}', collection=self.collection, unit_price=10,
+                                             old_unit_price=12, stock=10, description='')
+            LikedItem.objects.create(user=user, content_type=content_type, object_id=product.id)
+
+    def test_like_list(self):
+        self.assertQueriesConstant(self.seed, lambda: self.api.get('/likes/likes/'))
+
+
+@override_settings(LIKES={'BUFFERED_WRITES': True, 'BUFFER_SIZE': 500, 'FLUSH_INTERVAL': 60})
+class LikeBufferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('liker', 'liker@example.com', 'password')
+        cls.content_type = ContentType.objects.get_for_model(Product)
+        collection = Collection.objects.create(title='Collection')
+        cls.products = [
+            Product.objects.create(title=f'Product {index}', collection=collection, unit_price=10, old_unit_price=12,
+                                   stock=10, description='')
+            for index in range(2)
+        ]
+
+    def setUp(self):
+        self.buffer = buffer.LikeBuffer()
+        self.addCleanup(self.buffer.flush)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def key(self, product):
+        return (self.user.id, self.content_type.id, product.id)
+
+    def test_buffered_likes_are_accepted_without_an_id(self):
+        with mock.patch.object(buffer, 'buffer', self.buffer):
+            response = self.api.post('/likes/likes/', {'object_id': self.products[0].id,
+                                                       'content_type': self.content_type.id})
+        self.assertEqual(response.status_code, 202)
+        self.assertNotIn('id', response.data)
+        self.assertTrue(self.buffer.is_liked(*self.key(self.products[0])))
+        self.assertFalse(LikedItem.objects.exists())
+
+    def test_failed_flush_queues_the_intents_again(self):
+        self.buffer.like(*self.key(self.products[0]))
+        self.buffer.like(*self.key(self.products[1]))
+        with mock.patch.object(self.buffer, '_write', side_effect=DatabaseError), self.assertLogs('likes.buffer'):
+            with self.assertRaises(DatabaseError):
+                self.buffer.flush()
+        # Newer intents win over the ones that failed to flush.
+        self.buffer.unlike(*self.key(self.products[1]))
+        self.assertEqual(self.buffer.flush(), (1, 0))
+        self.assertEqual(list(LikedItem.objects.values_list('object_id', flat=True)), [self.products[0].id])
+
+    def test_buffered_likes_can_be_unliked_before_a_flush(self):
+        product = self.products[0]
+        path = f'/likes/likes/object/?content_type={self.content_type.id}&object_id={product.id}'
+        with mock.patch.object(buffer, 'buffer', self.buffer), mock.patch.object(trending.engine, 'record') as record:
+            self.api.post('/likes/likes/', {'object_id': product.id, 'content_type': self.content_type.id})
+            self.assertEqual(self.api.delete(path).status_code, 204)
+            self.assertEqual(self.api.delete(path).status_code, 404)
+        self.assertEqual(record.call_args_list, [mock.call(self.content_type.id, product.id),
+                                                 mock.call(self.content_type.id, product.id, -1)])
+        self.assertEqual(self.buffer.flush(), (0, 0))
+
+    def test_repeated_unlikes_are_recorded_once(self):
+        item = LikedItem.objects.create(user=self.user, content_type=self.content_type, object_id=self.products[0].id)
+        with mock.patch.object(buffer, 'buffer', self.buffer), mock.patch.object(trending.engine, 'record') as record:
+            self.assertEqual(self.api.delete(f'/likes/likes/{item.id}/').status_code, 204)
+            # Not flushed yet, so the row is still there.
+            self.assertEqual(self.api.delete(f'/likes/likes/{item.id}/').status_code, 204)
+        record.assert_called_once_with(self.content_type.id, self.products[0].id, -1)
+        self.assertEqual(self.buffer.flush(), (0, 1))
+        self.assertFalse(LikedItem.objects.exists())
+
+    @override_settings(LIKES={'BUFFERED_WRITES': False})
+    def test_unlike_by_object_without_the_buffer(self):
+        product = self.products[1]
+        LikedItem.objects.create(user=self.user, content_type=self.content_type, object_id=product.id)
+        path = f'/likes/likes/object/?content_type={self.content_type.id}&object_id={product.id}'
+        self.assertEqual(self.api.delete(path).status_code, 204)
+        self.assertEqual(self.api.delete(path).status_code, 404)
+        self.assertEqual(self.api.delete('/likes/likes/object/?content_type=x').status_code, 400)
+        self.assertFalse(LikedItem.objects.exists())
+
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        self.now = 10 ** 6
+        self.engine = trending.TrendingEngine(clock=lambda: self.now)
+        self.content_type = ContentType.objects.get_for_model(Product)
+        collection = Collection.objects.create(title='Collection')
+        self.products = [
+            Product.objects.create(title=f'Product {index}', collection=collection, unit_price=10, old_unit_price=12,
+                                   stock=10, description='')
+            for index in range(3)
+        ]
+
+    def test_concurrent_requests_checkpoint_once(self):
+        barrier = threading.Barrier(8)
+        with mock.patch.object(self.engine, 'checkpoint') as checkpoint:
+            def request():
+                barrier.wait()
+                self.engine._maybe_checkpoint(self.now)
+            threads = [threading.Thread(target=request) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(checkpoint.call_count, 1)
+
+    def test_limit_is_clamped(self):
+        for count, product in enumerate(self.products, 1):
+            for _ in range(count):
+                self.engine.record(self.content_type.id, product.id)
+        with mock.patch('store.views.trending_engine', self.engine):
+            for limit, expected in (('-5', 1), ('0', 1), ('2', 2), ('1000', 3)):
+                response = self.client.get('/store/products/trending/', {'limit': limit})
+                self.assertEqual(len(response.data), expected)
+            self.assertEqual(response.data[0]['id'], self.products[2].id)
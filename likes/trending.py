@@ -0,0 +1,149 @@
+"""
+In-process trending scores for liked objects.
+
+Like/unlike events are counted in hourly buckets kept in memory for a sliding
+window; a bucket's weight halves every `HALF_LIFE` seconds. Each worker
+checkpoints its own buckets to `TrendingCheckpoint` and reads the other
+workers' rows back, so rankings cover every process without aggregating
+`LikedItem`. Rankings are recomputed at most every `REFRESH_SECONDS`, and a
+read only slices the cached list.
+"""
+import math
+import os
+import socket
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from django.db import transaction
+
+from likes.models import TrendingCheckpoint
+
+BUCKET_SECONDS = 3600
+WINDOW_BUCKETS = 24
+HALF_LIFE = 6 * 3600
+CHECKPOINT_SECONDS = 60
+REFRESH_SECONDS = 10
+MAX_RANKED = 100
+
+
+def _to_datetime(bucket):
+    return datetime.fromtimestamp(bucket, tz=timezone.utc)
+
+
+def _to_bucket(moment):
+    return int(moment.timestamp())
+
+
+class TrendingEngine:
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.worker = f'{socket.gethostname()}:{os.getpid()}'[:64]
+        self._lock = threading.Lock()
+        # Serializes checkpoints; held across the database writes, unlike `_lock`.
+        self._checkpoint_lock = threading.Lock()
+        self._own = defaultdict(Counter)
+        self._peers = defaultdict(Counter)
+        self._dirty = set()
+        self._ranking = {}
+        self._ranked_at = None
+        self._checkpointed_at = None
+        self._restored = False
+
+    def _current_bucket(self, now):
+        return int(now // BUCKET_SECONDS) * BUCKET_SECONDS
+
+    def record(self, content_type_id, object_id, delta=1):
+        now = self.clock()
+        bucket = self._current_bucket(now)
+        with self._lock:
+            self._own[bucket][f'{content_type_id}:{object_id}'] += delta
+            self._dirty.add(bucket)
+        self._maybe_checkpoint(now)
+
+    def top(self, content_type_id, k=10):
+        """Return up to `k` `(object_id, score)` pairs, highest score first."""
+        now = self.clock()
+        self._maybe_checkpoint(now)
+        with self._lock:
+            if self._ranked_at is None or now - self._ranked_at >= REFRESH_SECONDS:
+                self._rank(now)
+            return self._ranking.get(content_type_id, [])[:min(k, MAX_RANKED)]
+
+    def _rank(self, now):
+        current = self._current_bucket(now)
+        scores = Counter()
+        for buckets in (self._own, self._peers):
+            for bucket, counts in buckets.items():
+                weight = math.pow(0.5, (current - bucket) / HALF_LIFE)
+                for key, count in counts.items():
+                    scores[key] += count * weight
+        ranking = defaultdict(list)
+        for key, score in scores.most_common():
+            if score <= 0:
+                break
+            content_type_id, object_id = map(int, key.split(':'))
+            if len(ranking[content_type_id]) < MAX_RANKED:
+                ranking[content_type_id].append((object_id, score))
+        self._ranking = ranking
+        self._ranked_at = now
+
+    def _expire(self, now):
+        oldest = self._current_bucket(now) - (WINDOW_BUCKETS - 1) * BUCKET_SECONDS
+        for buckets in (self._own, self._peers):
+            for bucket in [bucket for bucket in buckets if bucket < oldest]:
+                del buckets[bucket]
+        self._dirty = {bucket for bucket in self._dirty if bucket >= oldest}
+        return oldest
+
+    def _maybe_checkpoint(self, now):
+        # Claimed under the lock, so concurrent requests do not checkpoint the same window.
+        with self._lock:
+            if self._checkpointed_at is not None and now - self._checkpointed_at < CHECKPOINT_SECONDS:
+                return
+            self._checkpointed_at = now
+        self.checkpoint()
+
+    def _restore(self):
+        # A restarted worker can reuse its predecessor's id (same host and pid),
+        # so pick up its rows instead of overwriting them.
+        rows = TrendingCheckpoint.objects.filter(worker=self.worker).values_list('bucket_start', 'counts')
+        with self._lock:
+            for bucket_start, counts in rows:
+                bucket = _to_bucket(bucket_start)
+                self._own[bucket].update(counts)
+                self._dirty.add(bucket)
+
+    def checkpoint(self):
+        """Write this worker's changed buckets and reload everyone else's."""
+        with self._checkpoint_lock:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        with self._lock:
+            restore, self._restored = not self._restored, True
+        if restore:
+            self._restore()
+        now = self.clock()
+        with self._lock:
+            oldest = self._expire(now)
+            dirty = {bucket: dict(self._own[bucket]) for bucket in self._dirty}
+            self._dirty = set()
+        with transaction.atomic():
+            for bucket, counts in dirty.items():
+                TrendingCheckpoint.objects.update_or_create(
+                    worker=self.worker, bucket_start=_to_datetime(bucket), defaults={'counts': counts}
+                )
+            TrendingCheckpoint.objects.filter(bucket_start__lt=_to_datetime(oldest)).delete()
+            rows = TrendingCheckpoint.objects.filter(bucket_start__gte=_to_datetime(oldest))\
+                .exclude(worker=self.worker).values_list('bucket_start', 'counts')
+            peers = defaultdict(Counter)
+            for bucket_start, counts in rows:
+                peers[_to_bucket(bucket_start)].update(counts)
+        with self._lock:
+            self._peers = peers
+            self._ranked_at = None
+
+
+engine = TrendingEngine()
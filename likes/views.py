@@ -1,8 +1,15 @@
+from django.db import transaction
 from django.db.models import Q
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
+from likes import buffer
 from likes.models import LikedItem
+from likes.trending import engine
 
 from .serializers import LikedItemSerializer
 
@@ -18,4 +25,39 @@ class LikedItemViewset(ModelViewSet):
     serializer_class = LikedItemSerializer
     
     def get_serializer_context(self):
-        return {'user_id':self.request.user.id}
\ No newline at end of file
+        return {'user_id':self.request.user.id}
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        if buffer.is_enabled():
+            # Queued but not saved yet, so there is no row id to return.
+            response.data.pop('id', None)
+            response.status_code = status.HTTP_202_ACCEPTED
+        return response
+
+    def perform_destroy(self, instance):
+        self.unlike(instance.user_id,instance.content_type_id,instance.object_id)
+
+    @action(detail=False, methods=['delete'], url_path='object')
+    def unlike_object(self, request):
+        """Unlike by `?content_type=&object_id=`, which also reaches likes still buffered."""
+        try:
+            content_type_id = int(request.query_params['content_type'])
+            object_id = int(request.query_params['object_id'])
+        except (KeyError, ValueError):
+            raise ValidationError({'error': 'Integer content_type and object_id are required.'})
+        if not self.unlike(request.user.id,content_type_id,object_id):
+            raise NotFound()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def unlike(self, user_id, content_type_id, object_id):
+        """Remove the like; trending only counts it if the like was there."""
+        if buffer.is_enabled():
+            if not buffer.buffer.unlike(user_id,content_type_id,object_id):
+                return False
+            engine.record(content_type_id,object_id,-1)
+            return True
+        deleted, _ = LikedItem.objects.filter(user_id=user_id,content_type_id=content_type_id,object_id=object_id).delete()
+        if deleted:
+            transaction.on_commit(lambda: engine.record(content_type_id,object_id,-1))
+        return bool(deleted)
\ No newline at end of file
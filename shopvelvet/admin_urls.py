@@ -0,0 +1,13 @@
+from django.contrib import admin
+from django.urls import path
+
+# Registers the ModelAdmins on first use when the admin app is installed as
+# SimpleAdminConfig (see settings_production); a no-op after AdminConfig.ready().
+admin.autodiscover()
+
+admin.site.site_header = 'Shopvelvet Admin'
+admin.site.site_title = 'Shopvelvet Admin'
+admin.site.index_title = 'Admin'
+urlpatterns = [
+    path('', admin.site.urls),
+]
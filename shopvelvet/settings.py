@@ -49,10 +49,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'store.middleware.CatalogSnapshotMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "debug_toolbar.middleware.DebugToolbarMiddleware",
@@ -89,6 +91,38 @@ DATABASES = {
     }
 }
 
+# Run on new SQLite connections while cart group commit is on (core.sqlite).
+SQLITE_PRAGMAS = {
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'cache_size': -16000,
+    'temp_store': 'memory',
+    'mmap_size': 134217728,
+}
+
+
+# Caches
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# 'carts' holds serialized cart snapshots (store.cart_cache) and 'addresses'
+# customers' address books (store.address_cache); they must be shared by every
+# worker so invalidations are seen everywhere.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'carts': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache' / 'carts',
+        'TIMEOUT': 24 * 60 * 60,
+    },
+    'addresses': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache' / 'addresses',
+        'TIMEOUT': 24 * 60 * 60,
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -143,6 +177,28 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'core.renderers.MessagePackRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'core.parsers.MessagePackParser',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'cart_create': '20/min',
+        'cart_retrieve': '600/min',
+        'catalog_list': '300/min',
+    },
+}
+
+# Token buckets shared by all workers on a host (store.throttling).
+THROTTLING = {
+    'PATH': BASE_DIR / '.cache' / 'throttle.buckets',
+    'SLOTS': 65536,
 }
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=2),
@@ -150,6 +206,54 @@ SIMPLE_JWT = {
     "AUTH_HEADER_TYPES": ('JWT',),
 }
 
+PROFILING = {
+    'ENABLED': False,
+    'HEADER': 'X-Profile',
+    'SAMPLE_RATE': 0.0,
+    'INTERVAL': 0.001,
+    'DIRECTORY': BASE_DIR / 'profiles',
+    'RETENTION': 50,
+}
+
+LIKES = {
+    'BUFFERED_WRITES': False,
+    'BUFFER_SIZE': 500,
+    'FLUSH_INTERVAL': 1.0,
+}
+
+# Group commit for CartItemViewset writes (store.cart_writer).
+CART_WRITES = {
+    'GROUP_COMMIT': False,
+    'WINDOW': 0.002,
+    'MAX_BATCH': 256,
+    'TIMEOUT': 10.0,
+}
+
+# In-process cache of the tags on each object (tags.object_tags).
+TAGS = {
+    'OBJECT_CACHE_SIZE': 10000,
+    'OBJECT_CACHE_TTL': 60,
+}
+
+# Membership tiers from confirmed order spend in a rolling window (store.membership).
+MEMBERSHIP = {
+    'WINDOW_DAYS': 365,
+    'SILVER_SPEND': 200,
+    'GOLD_SPEND': 1000,
+}
+
+# Precompressed anonymous catalog lists (store.snapshots); build them with
+# `manage.py build_catalog_snapshots` and keep them current with
+# `manage.py build_catalog_snapshots --watch`. Brotli files need the brotli package.
+CATALOG_SNAPSHOTS = {
+    'ENABLED': False,
+    'DIRECTORY': BASE_DIR / '.cache' / 'catalog',
+    'PAGE_SIZE': 50,
+    'GZIP_LEVEL': 9,
+    'BROTLI_QUALITY': 11,
+    'REFRESH_INTERVAL': 5,
+}
+
 DJOSER = {
     'SERIALIZERS':{
         'user': 'core.serializers.UserSerializer',
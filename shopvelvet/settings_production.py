@@ -0,0 +1,35 @@
+"""
+Production profile: `DJANGO_SETTINGS_MODULE=shopvelvet.settings_production`.
+
+Drops the dev-only debug toolbar and the browsable API renderer, and installs
+the admin without autodiscovery so ModelAdmins are only imported on the first
+/admin/ request.
+"""
+
+import os
+
+from shopvelvet.settings import *  # noqa: F401,F403
+from shopvelvet.settings import INSTALLED_APPS, MIDDLEWARE, REST_FRAMEWORK
+
+SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+
+DEBUG = False
+
+ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',')
+
+INSTALLED_APPS = [
+    'django.contrib.admin.apps.SimpleAdminConfig' if app == 'django.contrib.admin' else app
+    for app in INSTALLED_APPS if app != 'debug_toolbar'
+]
+
+MIDDLEWARE = [
+    middleware for middleware in MIDDLEWARE if not middleware.startswith('debug_toolbar.')
+]
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.FastJSONRenderer',
+        'core.renderers.MessagePackRenderer',
+    ),
+}
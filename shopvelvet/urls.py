@@ -1,15 +1,24 @@
-from django.contrib import admin
-from django.urls import include, path
+from django.conf import settings
+from django.urls import URLResolver
+from django.urls.resolvers import RoutePattern
+
+
+def lazy_include(route, urlconf_name, namespace=None):
+    """
+    Like path(route, include(urlconf_name)), but the URLconf module (and the
+    views it imports) is only imported when a URL under `route` is first resolved.
+    """
+    return URLResolver(RoutePattern(route, is_endpoint=False), urlconf_name, app_name=namespace, namespace=namespace)
 
-admin.site.site_header = 'Shopvelvet Admin'
-admin.site.site_title = 'Shopvelvet Admin'
-admin.site.index_title = 'Admin'
 urlpatterns = [
-    path("__debug__/", include("debug_toolbar.urls")),
-    path('admin/', admin.site.urls),
-    path('auth/', include('djoser.urls')),
-    path('auth/', include('djoser.urls.jwt')),
-    path('store/',include('store.urls')),
-    path('likes/',include('likes.urls')),
-    path('tags/',include('tags.urls')),
+    lazy_include('admin/', 'shopvelvet.admin_urls'),
+    lazy_include('auth/', 'djoser.urls'),
+    lazy_include('auth/', 'djoser.urls.jwt'),
+    lazy_include('store/', 'store.urls'),
+    lazy_include('likes/', 'likes.urls'),
+    lazy_include('tags/', 'tags.urls'),
+    lazy_include('batch/', 'core.urls'),
 ]
+
+if 'debug_toolbar' in settings.INSTALLED_APPS:
+    urlpatterns.insert(0, lazy_include('__debug__/', 'debug_toolbar.urls', namespace='djdt'))
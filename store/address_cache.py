@@ -0,0 +1,63 @@
+"""
+Cache of each customer's serialized address book in the `addresses` cache
+alias, keyed by customer id, next to each user's customer id (which never
+changes). A customer reading their addresses, or adding one, costs no query
+once both are cached.
+
+Address writes drop the book from `store.signals`, now and again after
+commit; so do changes to the user's name, which each address shows, and
+deleting the customer.
+"""
+from django.core.cache import caches
+from django.db import transaction
+
+from store.models import Address, Customer
+
+
+def _book_key(customer_id):
+    return f'addresses:customer:{customer_id}'
+
+
+def _customer_key(user_id):
+    return f'addresses:user:{user_id}'
+
+
+def get_customer_id(user_id):
+    """The id of the user's customer, or None if they have none."""
+    cache = caches['addresses']
+    customer_id = cache.get(_customer_key(user_id))
+    if customer_id is None:
+        customer_id = Customer.objects.filter(user_id=user_id).values_list('id',flat=True).first()
+        if customer_id is not None:
+            cache.set(_customer_key(user_id), customer_id)
+    return customer_id
+
+
+def get_addresses(customer_id):
+    """The customer's serialized addresses, loaded in one query on a miss."""
+    from store.serializers import AddressSerializer
+    cache = caches['addresses']
+    data = cache.get(_book_key(customer_id))
+    if data is None:
+        addresses = Address.objects.select_related('customer__user').filter(customer_id=customer_id).order_by('id')
+        data = AddressSerializer(addresses, many=True).data
+        cache.set(_book_key(customer_id), data)
+    return data
+
+
+def invalidate_addresses(customer_id):
+    # Dropped now and again after commit, so a read racing the transaction
+    # cannot leave a stale book behind.
+    caches['addresses'].delete(_book_key(customer_id))
+    transaction.on_commit(lambda: caches['addresses'].delete(_book_key(customer_id)))
+
+
+def invalidate_user(user_id):
+    customer_id = get_customer_id(user_id)
+    if customer_id is not None:
+        invalidate_addresses(customer_id)
+
+
+def forget_customer(user_id, customer_id):
+    caches['addresses'].delete_many([_customer_key(user_id), _book_key(customer_id)])
+    transaction.on_commit(lambda: caches['addresses'].delete_many([_customer_key(user_id), _book_key(customer_id)]))
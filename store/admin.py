@@ -1,12 +1,19 @@
 from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
+from django.db import transaction
 from django.db.models.aggregates import Count
 from django.http.request import HttpRequest
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.html import format_html
 from django.utils.http import urlencode
 
-from store.models import (Address, Cart, CartItem, Collection, Customer, Order,
-                          OrderItem, Product)
+from store import facets, orders
+from store.models import (Address, ArchivedOrder, ArchivedOrderItem, Cart,
+                          CartItem, Collection, Customer, Order, OrderItem,
+                          Product)
+from store.pagination import EstimatedCountPaginator
+from store.signals import stock_changed
 
 # Register your models here.
 
@@ -20,12 +27,8 @@ class StockStatusFilter(admin.SimpleListFilter):
             ('m','Medium'),
         ]
     def queryset(self, request, queryset):
-        if self.value() == 'l':
-            return queryset.filter(stock__lte=int(10))
-        if self.value() == 'm':
-            return queryset.filter(stock__gte=int(11),stock__lte=int(49))
-        if self.value() == 'h':
-            return queryset.filter(stock__gte=int(50))
+        if self.value() in {band for (band, *_) in facets.STOCK_BANDS}:
+            return queryset.filter(facets.stock_band_q(self.value()))
         
 class AnonymousCartFilter(admin.SimpleListFilter):
     title = 'customer'
@@ -41,6 +44,17 @@ class AnonymousCartFilter(admin.SimpleListFilter):
             return queryset.filter(customer__isnull=True)
         if self.value() == 'au':
             return queryset.filter(customer__isnull=False)
+
+class CustomerChangeList(ChangeList):
+    def get_results(self, request):
+        super().get_results(request)
+        customers = list(self.result_list)
+        orders_count = dict(
+            Order.objects.filter(customer__in=customers).order_by()
+            .values_list('customer').annotate(Count('id'))
+        )
+        for customer in customers:
+            customer.orders_count = orders_count.get(customer.id, 0)
     
 
 @admin.register(Customer)
@@ -48,19 +62,26 @@ class CustomerAdmin(admin.ModelAdmin):
     readonly_fields = ['user']
     list_display = ['id','first_name','last_name','phone','sex','membership','orders']
     list_editable = ['membership']
-    list_filter = ['birth_date','membership','sex']
+    list_filter = ['birth_date','membership','membership_locked','sex']
     ordering = ['user__first_name', 'user__last_name']
     search_fields = ['user__first_name','user__last_name','phone']
     list_select_related = ['user']
     list_per_page = 10
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
-    @admin.display(ordering='orders_count')
     def orders(self,customer):
         url = reverse('admin:store_order_changelist') + "?" + urlencode({'customer__id':str(customer.id)})
         return format_html("<a href='{}'>{}</a>",url,customer.orders_count)
     
-    def get_queryset(self, request: HttpRequest):
-        return super().get_queryset(request).annotate(orders_count=Count('order'))
+    def get_changelist(self, request: HttpRequest, **kwargs):
+        return CustomerChangeList
+
+    def save_model(self, request, obj, form, change):
+        # A tier picked by hand is kept by the membership recalculation.
+        if 'membership' in form.changed_data:
+            obj.membership_locked = True
+        super().save_model(request, obj, form, change)
 
 @admin.register(Collection)
 class CollectionAdmin(admin.ModelAdmin):
@@ -95,7 +116,10 @@ class ProductAdmin(admin.ModelAdmin):
  
     @admin.action(description='Clear stock')
     def clear_stock(self,request,queryset):
-        updated_count = queryset.update(stock=0)
+        with transaction.atomic():
+            stocks = dict(queryset.select_for_update().order_by().values_list('id','stock'))
+            updated_count = queryset.update(stock=0,update_at=timezone.now())
+            stock_changed.send(sender=Product,changes={product_id: -stock for product_id, stock in stocks.items()})
         self.message_user(request,f'{updated_count} products were successfully updated.',messages.ERROR)
 
 class CartItemInline(admin.TabularInline):
@@ -110,7 +134,9 @@ class CartAdmin(admin.ModelAdmin):
     inlines = [CartItemInline]
     list_filter = [AnonymousCartFilter,'created_at']
     list_per_page = 10
-    list_select_related = ['customer']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_select_related = ['customer__user']
     autocomplete_fields = ['customer']
 
     @admin.display(ordering='customer')
@@ -134,19 +160,71 @@ class OrderAdmin(admin.ModelAdmin):
     list_display = ['id','customer_name','status','created_at']
     list_filter = ['status','created_at','update_at']
     list_per_page = 10
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_select_related = ['customer__user']
+    actions = ['mark_confirmed','mark_failed']
 
     @admin.display(ordering='customer')
     def customer_name(self,order:Order):
         url = reverse('admin:store_customer_changelist') + '?' + urlencode({'id':str(order.customer.pk)})
         return format_html('<a href="{}">{}</a>',url,order.customer)
 
+    @admin.action(description='Mark selected pending orders as confirmed')
+    def mark_confirmed(self,request,queryset):
+        self._transition(request,queryset,Order.STATUS_CONFIRM)
+
+    @admin.action(description='Mark selected pending orders as failed and restore stock')
+    def mark_failed(self,request,queryset):
+        self._transition(request,queryset,Order.STATUS_FAILED)
+
+    def _transition(self,request,queryset,status):
+        outcomes = orders.transition_orders(queryset,status)
+        updated_count = sum(1 for (outcome, _) in outcomes.values() if outcome == orders.OUTCOME_UPDATED)
+        self.message_user(request,f'{updated_count} orders were successfully updated.',messages.SUCCESS)
+        if updated_count < len(outcomes):
+            self.message_user(request,f'{len(outcomes) - updated_count} orders were skipped because they are not pending.',messages.WARNING)
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    fields = ['product_id','title','unit_price','quantity']
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    inlines = [ArchivedOrderItemInline]
+    list_display = ['id','customer','status','created_at','archived_at']
+    list_filter = ['status','created_at']
+    list_per_page = 10
+    list_select_related = ['customer__user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 @admin.register(Address)
 class AddressAdmin(admin.ModelAdmin):
     list_display = ['id','customer_name','street','city','state','country',]
     autocomplete_fields = ['customer',]
     list_editable = ['street',]
-    list_filter = ['city','state','country']
+    list_filter = ['country','state','city']
+    list_select_related = ['customer__user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def customer_name(self,address:Address):
-        url = reverse('admin:store_customer_changelist') + '?' + urlencode({'id':address.customer.pk})
+        url = reverse('admin:store_customer_changelist') + '?' + urlencode({'id':address.customer_id})
         return format_html('<a href="{}">{}</a>',url,address.customer)
\ No newline at end of file
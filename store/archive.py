@@ -0,0 +1,72 @@
+"""
+Archival of cold orders. Confirmed and failed orders older than a cutoff are
+moved, with their items, from `store_order`/`store_orderitem` into
+`ArchivedOrder`/`ArchivedOrderItem` in bounded batches, one transaction per
+batch. They keep their ids, so they can be looked up under the same id.
+
+Orders inside the membership spend window are never archived, so
+`store.membership` only needs the hot tables.
+"""
+import calendar
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from store import membership
+from store.models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+BATCH_SIZE = 1000
+ARCHIVABLE_STATUSES = [Order.STATUS_CONFIRM, Order.STATUS_FAILED]
+
+
+def months_ago(moment, months):
+    month = moment.month - 1 - months
+    year, month = moment.year + month // 12, month % 12 + 1
+    return moment.replace(year=year, month=month, day=min(moment.day, calendar.monthrange(year, month)[1]))
+
+
+def get_cutoff(months, now=None):
+    now = now or timezone.now()
+    window = timedelta(days=membership.get_setting('WINDOW_DAYS', 365))
+    return min(months_ago(now, months), now - window)
+
+
+def archive_batch(cutoff, batch_size=BATCH_SIZE):
+    """Move up to `batch_size` archivable orders created before `cutoff`. Returns (orders, items) moved."""
+    with transaction.atomic():
+        orders = list(
+            Order.objects.select_for_update().filter(status__in=ARCHIVABLE_STATUSES, created_at__lt=cutoff)
+            .order_by('id')[:batch_size]
+        )
+        if not orders:
+            return 0, 0
+        order_ids = [order.id for order in orders]
+        items = list(OrderItem.objects.filter(order_id__in=order_ids))
+        ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(id=order.id, customer_id=order.customer_id, created_at=order.created_at,
+                          update_at=order.update_at, status=order.status)
+            for order in orders
+        ])
+        ArchivedOrderItem.objects.bulk_create([
+            ArchivedOrderItem(id=item.id, order_id=item.order_id, product_id=item.product_id, title=item.title,
+                              unit_price=item.unit_price, quantity=item.quantity)
+            for item in items
+        ])
+        OrderItem.objects.filter(order_id__in=order_ids).delete()
+        Order.objects.filter(id__in=order_ids).delete()
+    return len(orders), len(items)
+
+
+def archive_orders(months, batch_size=BATCH_SIZE, max_batches=None):
+    """Archive in batches until nothing older than the cutoff is left or `max_batches` ran."""
+    cutoff = get_cutoff(months)
+    totals = {'orders': 0, 'items': 0, 'batches': 0, 'cutoff': cutoff}
+    while max_batches is None or totals['batches'] < max_batches:
+        orders, items = archive_batch(cutoff, batch_size)
+        if not orders:
+            break
+        totals['orders'] += orders
+        totals['items'] += items
+        totals['batches'] += 1
+    return totals
@@ -0,0 +1,65 @@
+"""
+Write-through cache of serialized carts, keyed by the cart UUID, in the
+`carts` cache alias. Cart mutations refresh the snapshot once they commit;
+changes that bypass the views are caught by the signals in `store.signals`,
+which drop the snapshot so the next read rebuilds it.
+"""
+import uuid
+
+from django.core.cache import caches
+from django.db import transaction
+
+from store.models import Cart, CartItem
+
+
+def _key(cart_id):
+    return f'cart:{uuid.UUID(str(cart_id))}'
+
+
+def get_cart_data(cart_id):
+    try:
+        return caches['carts'].get(_key(cart_id))
+    except ValueError:
+        return None
+
+
+def set_cart_data(cart_id, data):
+    caches['carts'].set(_key(cart_id), data)
+
+
+def add_cart_data(cart_id, data):
+    """
+    Fill a miss from a read. Never replaces a snapshot, which may be a newer
+    one written by `refresh_cart` since the read.
+    """
+    caches['carts'].add(_key(cart_id), data)
+
+
+def _rebuild(cart_id):
+    from store.serializers import CartSerializer
+    try:
+        cart = Cart.objects.select_related('customer__user').prefetch_related('items__product').get(id=cart_id)
+    except Cart.DoesNotExist:
+        caches['carts'].delete(_key(cart_id))
+        return
+    set_cart_data(cart_id, CartSerializer(cart).data)
+
+
+def refresh_cart(cart_id):
+    """Rebuild the snapshot once the current transaction commits."""
+    transaction.on_commit(lambda: _rebuild(cart_id))
+
+
+def invalidate_cart(cart_id):
+    # Dropped now and again after commit, so a read racing the transaction
+    # cannot leave a stale snapshot behind.
+    caches['carts'].delete(_key(cart_id))
+    transaction.on_commit(lambda: caches['carts'].delete(_key(cart_id)))
+
+
+def invalidate_carts_with_product(product_id):
+    cart_ids = CartItem.objects.filter(product_id=product_id).values_list('cart_id', flat=True)
+    keys = [_key(cart_id) for cart_id in cart_ids]
+    if keys:
+        caches['carts'].delete_many(keys)
+        transaction.on_commit(lambda: caches['carts'].delete_many(keys))
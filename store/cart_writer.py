@@ -0,0 +1,146 @@
+"""
+Opt-in group commit for cart item writes (`CART_WRITES['GROUP_COMMIT']`).
+
+On SQLite every committed request waits for its own commit, which caps cart
+item writes at a few hundred per second. With group commit on, the adds,
+updates and deletes from `CartItemViewset` are handed to one writer thread.
+It gathers the writes that arrive within `WINDOW` seconds (at most
+`MAX_BATCH`), runs them in one transaction with a savepoint each, so a
+failing write does not undo the others, and answers the waiting requests
+once that transaction commits.
+
+Validation and reads stay on the request threads. A write made inside an
+open transaction runs inline, since the writer could not see its rows.
+
+On SQLite the writer switches the database to WAL when it starts, so reads
+carry on while a batch commits.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent import futures
+
+from django.conf import settings
+from django.db import connection, transaction
+from rest_framework.exceptions import APIException
+
+
+def get_setting(name, default):
+    return getattr(settings, 'CART_WRITES', {}).get(name, default)
+
+
+def is_enabled():
+    return get_setting('GROUP_COMMIT', False)
+
+
+class WriterBusy(APIException):
+    status_code = 503
+    default_detail = 'Cart writes are backed up, try again shortly.'
+    default_code = 'cart_writer_busy'
+
+
+class CartWriter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._pid = None
+        self.batches = 0
+        self.writes = 0
+
+    def submit(self, write):
+        """Run `write()` in the next batch and return its result once the batch commits."""
+        future = futures.Future()
+        self._start()
+        self._queue.put((write, future))
+        try:
+            return future.result(get_setting('TIMEOUT', 10.0))
+        except futures.TimeoutError:
+            if future.cancel():
+                raise WriterBusy()
+            # Already running, so it is about to commit.
+            return future.result()
+
+    def stop(self, timeout=5):
+        with self._lock:
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def _start(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked worker inherits the queue but not the thread.
+                self._queue = queue.SimpleQueue()
+                self._thread = None
+                self._pid = os.getpid()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='cart-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        try:
+            if connection.vendor == 'sqlite':
+                # WAL is kept in the database file, so switching once is enough.
+                with connection.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode = wal')
+            stopping = False
+            while not stopping:
+                batch = []
+                item = self._queue.get()
+                deadline = time.monotonic() + get_setting('WINDOW', 0.002)
+                max_batch = get_setting('MAX_BATCH', 256)
+                while True:
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+                    if len(batch) >= max_batch:
+                        break
+                    try:
+                        item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                self._commit(batch)
+        finally:
+            connection.close()
+
+    def _commit(self, batch):
+        batch = [(write, future) for (write, future) in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        outcomes = []
+        try:
+            with transaction.atomic():
+                for write, future in batch:
+                    try:
+                        with transaction.atomic():
+                            outcomes.append((future, write(), None))
+                    except Exception as error:
+                        outcomes.append((future, None, error))
+        except Exception as error:
+            # The commit failed, so none of the writes stuck.
+            outcomes = [(future, None, error) for (_, future) in batch]
+        finally:
+            connection.close_if_unusable_or_obsolete()
+        self.batches += 1
+        self.writes += len(batch)
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+writer = CartWriter()
+atexit.register(writer.stop)
+
+
+def write(func):
+    """Run `func()` through the writer when group commit is on, otherwise inline."""
+    if not is_enabled() or connection.in_atomic_block:
+        return func()
+    return writer.submit(func)
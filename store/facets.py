@@ -0,0 +1,205 @@
+"""
+Catalog facet counts: products per collection, price bucket and stock band.
+
+`ProductFacetCount` keeps one row per (collection, price bucket, stock band)
+combination, so every facet, with or without filters applied, is summed from
+that small table in one query instead of a COUNT per facet over
+`store_product`. Product saves and deletes are applied as deltas by
+`store.signals`, as are bulk stock updates through its `stock_changed`
+signal, and `rebuild` recomputes every row in one grouped pass.
+"""
+import bisect
+from collections import Counter
+from decimal import Decimal
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, F, Q, Value, When
+
+from store.models import Product, ProductFacetCount
+
+# Lower bound of each price bucket; the last one is open-ended. Run
+# `manage.py rebuild_facets` after changing them.
+PRICE_BUCKET_EDGES = [Decimal(edge) for edge in (0, 25, 50, 100, 250, 500)]
+
+# (band, label, lowest stock, highest stock), shared with the admin's StockStatusFilter.
+STOCK_BANDS = [
+    ('l', 'Low', None, 10),
+    ('m', 'Medium', 11, 49),
+    ('h', 'High', 50, None),
+]
+
+FACET_FIELDS = ('collection_id', 'unit_price', 'stock')
+
+
+def price_bucket(unit_price):
+    return max(bisect.bisect_right(PRICE_BUCKET_EDGES, unit_price) - 1, 0)
+
+
+def price_bucket_label(bucket):
+    low = PRICE_BUCKET_EDGES[bucket]
+    if bucket + 1 == len(PRICE_BUCKET_EDGES):
+        return f'{low:g}+'
+    return f'{low:g}-{PRICE_BUCKET_EDGES[bucket + 1]:g}'
+
+
+def stock_band(stock):
+    for band, _, low, high in STOCK_BANDS:
+        if high is None or stock <= high:
+            return band
+
+
+def price_bucket_q(bucket):
+    q = Q(unit_price__gte=PRICE_BUCKET_EDGES[bucket]) if bucket else Q()
+    if bucket + 1 < len(PRICE_BUCKET_EDGES):
+        q &= Q(unit_price__lt=PRICE_BUCKET_EDGES[bucket + 1])
+    return q
+
+
+def stock_band_q(band):
+    _, _, low, high = next(entry for entry in STOCK_BANDS if entry[0] == band)
+    q = Q(stock__gte=low) if low is not None else Q()
+    if high is not None:
+        q &= Q(stock__lte=high)
+    return q
+
+
+def cell(collection_id, unit_price, stock):
+    return (collection_id, price_bucket(unit_price), stock_band(stock))
+
+
+def product_cell(values):
+    """The facet row of a product instance or of a dict of its loaded values."""
+    if isinstance(values, dict):
+        return cell(*(values[field] for field in FACET_FIELDS))
+    return cell(*(getattr(values, field) for field in FACET_FIELDS))
+
+
+def apply_deltas(deltas):
+    """Add `{(collection_id, price_bucket, stock_band): delta}` to the stored counts."""
+    # Sorted, so concurrent writers lock rows in the same order.
+    for (collection_id, bucket, band), delta in sorted(deltas.items()):
+        if not delta:
+            continue
+        rows = ProductFacetCount.objects.filter(collection_id=collection_id, price_bucket=bucket, stock_band=band)
+        if rows.update(count=F('count') + delta):
+            continue
+        try:
+            with transaction.atomic():
+                ProductFacetCount.objects.create(collection_id=collection_id, price_bucket=bucket,
+                                                 stock_band=band, count=delta)
+        except IntegrityError:
+            # Created concurrently.
+            rows.update(count=F('count') + delta)
+
+
+def record_product_change(old_cell, new_cell):
+    if old_cell != new_cell:
+        deltas = Counter()
+        if old_cell:
+            deltas[old_cell] -= 1
+        if new_cell:
+            deltas[new_cell] += 1
+        apply_deltas(deltas)
+
+
+def record_stock_changes(changes):
+    """
+    Apply `{product_id: stock delta}` from a bulk UPDATE that bypassed the
+    model signals. Runs after the UPDATE, in the same transaction.
+    """
+    if not changes:
+        return
+    deltas = Counter()
+    for product_id, collection_id, unit_price, stock in Product.objects.filter(id__in=list(changes))\
+            .order_by().values_list('id', 'collection_id', 'unit_price', 'stock'):
+        old, new = cell(collection_id, unit_price, stock - changes[product_id]), cell(collection_id, unit_price, stock)
+        if old != new:
+            deltas[old] -= 1
+            deltas[new] += 1
+    apply_deltas(deltas)
+
+
+def grouped_counts(products):
+    """Count `products` per facet row in a single grouped query."""
+    buckets = Case(
+        *[When(unit_price__gte=edge, then=Value(bucket)) for bucket, edge in reversed(list(enumerate(PRICE_BUCKET_EDGES)))],
+        default=Value(0), output_field=models.PositiveSmallIntegerField(),
+    )
+    bands = Case(
+        *[When(stock__lte=high, then=Value(band)) for band, _, _, high in STOCK_BANDS if high is not None],
+        default=Value(STOCK_BANDS[-1][0]), output_field=models.CharField(),
+    )
+    return products.order_by().annotate(price_bucket=buckets, stock_band=bands)\
+        .values_list('collection_id', 'price_bucket', 'stock_band').annotate(Count('id'))
+
+
+def rebuild(product_model=Product, facet_model=ProductFacetCount):
+    """Recompute every facet row. Takes the models so migrations can call it."""
+    with transaction.atomic():
+        facet_model.objects.all().delete()
+        facet_model.objects.bulk_create([
+            facet_model(collection_id=collection_id, price_bucket=bucket, stock_band=band, count=count)
+            for collection_id, bucket, band, count in grouped_counts(product_model.objects.all())
+        ])
+
+
+def parse_filters(params):
+    """
+    Read `collection`, `price` (bucket labels such as `25-50`) and `stock`
+    (`l`, `m`, `h`) from query params; each accepts several comma-separated
+    values. Raises ValueError for unknown values.
+    """
+    def values(name):
+        return {value for param in params.getlist(name) for value in param.split(',') if value}
+
+    labels = {price_bucket_label(bucket): bucket for bucket in range(len(PRICE_BUCKET_EDGES))}
+    filters = {
+        'collection': {int(value) for value in values('collection')},
+        'price': {labels[value] for value in values('price') if value in labels},
+        'stock': values('stock'),
+    }
+    if len(filters['price']) != len(values('price')) or not filters['stock'] <= {band for band, *_ in STOCK_BANDS}:
+        raise ValueError
+    return filters
+
+
+def filter_products(queryset, filters):
+    if filters['collection']:
+        queryset = queryset.filter(collection_id__in=filters['collection'])
+    for name, to_q in (('price', price_bucket_q), ('stock', stock_band_q)):
+        if filters[name]:
+            q = Q()
+            for value in filters[name]:
+                q |= to_q(value)
+            queryset = queryset.filter(q)
+    return queryset
+
+
+def counts(filters):
+    """
+    Facet counts for the products matching `filters`. Each facet ignores its
+    own filter, so a sidebar shows how many products every other choice in
+    that facet would give.
+    """
+    collections, totals = {}, {'collection': Counter(), 'price': Counter(), 'stock': Counter()}
+    for collection_id, title, bucket, band, count in ProductFacetCount.objects.filter(count__gt=0)\
+            .values_list('collection_id', 'collection__title', 'price_bucket', 'stock_band', 'count'):
+        collections[collection_id] = title
+        row = {'collection': collection_id, 'price': bucket, 'stock': band}
+        for name in totals:
+            if all(not filters[other] or row[other] in filters[other] for other in totals if other != name):
+                totals[name][row[name]] += count
+    return {
+        'collection': [
+            {'value': collection_id, 'title': title, 'count': totals['collection'][collection_id]}
+            for collection_id, title in sorted(collections.items(), key=lambda collection: collection[1])
+        ],
+        'price': [
+            {'value': price_bucket_label(bucket), 'count': totals['price'][bucket]}
+            for bucket in range(len(PRICE_BUCKET_EDGES))
+        ],
+        'stock': [
+            {'value': band, 'title': label, 'count': totals['stock'][band]}
+            for band, label, _, _ in STOCK_BANDS
+        ],
+    }
@@ -0,0 +1,37 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from store import stock_feed
+
+
+class Command(BaseCommand):
+    help = (
+        'Apply a warehouse stock feed (one {"product_id": ..., "delta": ...} object or '
+        '"product_id,delta" pair per line) as relative stock updates.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Feed file, or - for standard input.')
+        parser.add_argument('--batch-id', required=True,
+                            help='Feed batch ID; records already applied under it are skipped.')
+        parser.add_argument('--chunk-size', type=int, default=stock_feed.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            report = stock_feed.apply_feed(options['batch_id'], sys.stdin, options['chunk_size'])
+        else:
+            with open(options['path']) as feed:
+                report = stock_feed.apply_feed(options['batch_id'], feed, options['chunk_size'])
+        for rejection in report['rejections']:
+            self.stdout.write(self.style.WARNING(
+                f"record {rejection['record']}: {rejection['reason']} "
+                f"(product {rejection['product_id']}, delta {rejection['delta']})"
+            ))
+        if report['duplicate']:
+            self.stdout.write(f"Batch {report['batch_id']} was already applied; nothing changed.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Batch {report['batch_id']}: {report['applied']} applied, {report['rejected']} rejected of "
+            f"{report['records']} records; processed {report['processed_now']} now in "
+            f"{report['elapsed_ms'] / 1000:.2f}s ({report['records_per_second'] or 0} records/s)."
+        ))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store import archive
+
+
+class Command(BaseCommand):
+    help = 'Move confirmed and failed orders older than --months into the archive tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=18)
+        parser.add_argument('--batch-size', type=int, default=archive.BATCH_SIZE)
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Stop after this many batches, to bound a single run.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        totals = archive.archive_orders(options['months'], options['batch_size'], options['max_batches'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {totals['orders']} orders ({totals['items']} items) created before "
+            f"{totals['cutoff']:%Y-%m-%d} in {totals['batches']} batches, {elapsed:.2f}s."
+        ))
@@ -0,0 +1,164 @@
+import logging
+import random
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import resolve
+from rest_framework.test import APIRequestFactory
+
+from store import cart_writer
+from store.models import Cart, CartItem, Collection, Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Add items to carts from concurrent threads through CartItemViewset against a throwaway '
+        'on-disk test database, once committing per request and once with group commit, and '
+        'compare throughput and latency.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='Clients, each with its own cart.')
+        parser.add_argument('--writes', type=int, default=100, help='Cart item adds per client.')
+        parser.add_argument('--products', type=int, default=20)
+        parser.add_argument('--window', type=float, default=None,
+                            help="Group commit window in seconds (default CART_WRITES['WINDOW']).")
+        parser.add_argument('--max-retries', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    factory = APIRequestFactory()
+
+    def handle(self, *args, **options):
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        setup_test_environment()
+        reports = []
+        with tempfile.TemporaryDirectory() as directory:
+            if connection.vendor == 'sqlite':
+                # Threads need a shared on-disk database, not the in-memory test default.
+                connection.settings_dict.setdefault('TEST', {})['NAME'] = str(Path(directory) / 'cart_writes.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                with override_settings(CACHES={
+                    **settings.CACHES,
+                    'carts': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench-carts'},
+                }):
+                    for group_commit in (False, True):
+                        writes = {**getattr(settings, 'CART_WRITES', {}), 'GROUP_COMMIT': group_commit}
+                        if options['window'] is not None:
+                            writes['WINDOW'] = options['window']
+                        with override_settings(CART_WRITES=writes):
+                            reports.append(self.run(options, group_commit))
+            finally:
+                cart_writer.writer.stop()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+        for report in reports:
+            self.print_report(report)
+        if len(reports) == 2 and reports[0]['rate']:
+            self.stdout.write(f"group commit: {reports[1]['rate'] / reports[0]['rate']:.2f}x the per-request throughput")
+        if any(report['failures'] or report['violations'] for report in reports):
+            raise CommandError('Cart write benchmark failed.')
+
+    def run(self, options, group_commit):
+        rng = random.Random(options['seed'])
+        collection = Collection.objects.create(title='Benchmark')
+        products = [
+            Product.objects.create(title=f'Benchmark product {index}', collection=collection, unit_price=10,
+                                   old_unit_price=10, description='', stock=1000)
+            for index in range(options['products'])
+        ]
+        carts = [Cart.objects.create() for _ in range(options['threads'])]
+        plans = [
+            [(rng.choice(products).id, rng.randint(1, 3)) for _ in range(options['writes'])]
+            for _ in carts
+        ]
+        stats = Counter()
+        latencies = []
+        failures = []
+        lock = threading.Lock()
+        batches, writes = cart_writer.writer.batches, cart_writer.writer.writes
+
+        def work(cart, plan):
+            path = f'/store/carts/{cart.id}/items/'
+            match = resolve(path)
+            try:
+                for product_id, quantity in plan:
+                    start = time.perf_counter()
+                    for attempt in range(options['max_retries'] + 1):
+                        request = self.factory.post(path, {'product_id': product_id, 'quantity': quantity}, format='json')
+                        try:
+                            response = match.func(request, *match.args, **match.kwargs)
+                        except OperationalError:
+                            # Lock contention ("database is locked") is retryable.
+                            with lock:
+                                stats['retry'] += 1
+                            time.sleep(random.uniform(0, 0.001 * 2 ** min(attempt, 6)))
+                            continue
+                        except Exception as error:
+                            with lock:
+                                failures.append(f'{path}: {type(error).__name__} {error}')
+                            break
+                        with lock:
+                            if response.status_code >= 300:
+                                failures.append(f'{path}: HTTP {response.status_code}')
+                            else:
+                                stats['ok'] += 1
+                                latencies.append(time.perf_counter() - start)
+                        break
+                    else:
+                        with lock:
+                            stats['gave_up'] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=work, args=(cart, plan)) for cart, plan in zip(carts, plans)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        violations = []
+        expected = Counter()
+        for cart, plan in zip(carts, plans):
+            for product_id, quantity in plan:
+                expected[(cart.id, product_id)] += quantity
+        stored = dict(((cart_id, product_id), total) for (cart_id, product_id, total) in CartItem.objects.filter(
+            cart__in=carts).order_by().values_list('cart_id', 'product_id').annotate(Sum('quantity')))
+        if stored != dict(expected) and not stats['gave_up']:
+            violations.append('stored cart quantities do not match the adds')
+        return {
+            'group_commit': group_commit, 'options': options, 'stats': stats, 'latencies': sorted(latencies),
+            'failures': failures, 'violations': violations, 'elapsed': elapsed, 'rate': stats['ok'] / elapsed,
+            'batches': cart_writer.writer.batches - batches, 'batched_writes': cart_writer.writer.writes - writes,
+        }
+
+    def print_report(self, report):
+        stats, options, latencies = report['stats'], report['options'], report['latencies']
+        mode = 'group commit' if report['group_commit'] else 'per-request commits'
+        self.stdout.write(
+            f"{mode}: {options['threads']} clients x {options['writes']} adds in {report['elapsed']:.2f}s, "
+            f"{report['rate']:,.0f} writes/s"
+        )
+        if latencies:
+            self.stdout.write(
+                f"  latency p50 {statistics.median(latencies) * 1000:.1f}ms, "
+                f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms; "
+                f"{stats['retry']} lock retries, {stats['gave_up']} gave up after {options['max_retries']}"
+            )
+        if report['batches']:
+            self.stdout.write(f"  {report['batches']} batches, {report['batched_writes'] / report['batches']:.1f} writes per batch")
+        for failure in report['failures'][:20]:
+            self.stdout.write(self.style.ERROR(f'failure: {failure}'))
+        for violation in report['violations']:
+            self.stdout.write(self.style.ERROR(f'invariant violated: {violation}'))
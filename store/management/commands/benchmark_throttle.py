@@ -0,0 +1,41 @@
+import multiprocessing
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from store.throttling import TokenBucketStore
+
+
+def _run(path, slots, calls, keys, worker):
+    store = TokenBucketStore(path, slots)
+    start = time.perf_counter()
+    for call in range(calls):
+        store.consume(f'bench:{worker}:{call % keys}', capacity=100, rate=10)
+    return time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-request overhead of the shared token-bucket throttle store.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=100000)
+        parser.add_argument('--keys', type=int, default=1000)
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--slots', type=int, default=65536)
+
+    def handle(self, *args, **options):
+        calls, keys, processes, slots = options['calls'], options['keys'], options['processes'], options['slots']
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'throttle.buckets'
+            elapsed = _run(path, slots, calls, keys, 0)
+            self.stdout.write(f'1 process: {elapsed / calls * 1e6:.2f}us per check, {calls / elapsed:,.0f} checks/s')
+
+            with multiprocessing.Pool(processes) as pool:
+                start = time.perf_counter()
+                pool.starmap(_run, [(path, slots, calls, keys, worker) for worker in range(processes)])
+                elapsed = time.perf_counter() - start
+            total = calls * processes
+            self.stdout.write(f'{processes} processes: {total / elapsed:,.0f} checks/s combined '
+                              f'({elapsed / calls * 1e6:.2f}us per check per process)')
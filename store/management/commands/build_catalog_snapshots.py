@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store import snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        'Render the anonymous catalog lists to precompressed snapshot files, or with --refresh/--watch '
+        're-render the pages touched by the changes queued since.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help='Remove the snapshots instead of building them.')
+        parser.add_argument('--refresh', action='store_true', help='Apply the queued changes once and exit.')
+        parser.add_argument('--watch', action='store_true',
+                            help="Apply the queued changes every CATALOG_SNAPSHOTS['REFRESH_INTERVAL'] seconds.")
+        parser.add_argument('--interval', type=float, default=None)
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            snapshots.clear()
+            self.stdout.write(self.style.SUCCESS('Removed the catalog snapshots.'))
+            return
+        if options['refresh'] or options['watch']:
+            interval = options['interval'] or snapshots.get_setting('REFRESH_INTERVAL', 5)
+            while True:
+                start = time.perf_counter()
+                pages = snapshots.refresh_dirty()
+                if pages:
+                    self.stdout.write(f'Refreshed {pages} snapshots in {time.perf_counter() - start:.2f}s.')
+                if not options['watch']:
+                    return
+                time.sleep(interval)
+        start = time.perf_counter()
+        pages = snapshots.build()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {pages} snapshots ({', '.join(snapshots.ENCODINGS)}) to {snapshots.get_directory()} in {elapsed:.2f}s."
+        ))
+        if not snapshots.enabled():
+            self.stdout.write(self.style.WARNING("CATALOG_SNAPSHOTS['ENABLED'] is off, so they are not served."))
@@ -0,0 +1,26 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from store.recommendations import rebuild_cooccurrence
+
+
+class Command(BaseCommand):
+    help = 'Rebuild "frequently bought together" neighbours from all order items.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        tracemalloc.start()
+        start = time.perf_counter()
+        stats = rebuild_cooccurrence(chunk_size=options['chunk_size'], batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt neighbours for {stats['products']} products from {stats['orders']} orders "
+            f"({stats['pairs']} distinct pairs) in {elapsed:.2f}s, peak memory {peak / 2**20:.1f} MiB."
+        ))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store import membership
+
+
+class Command(BaseCommand):
+    help = 'Recalculate customer membership tiers from confirmed order spend in the rolling window.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help='Only customers with orders changed since the last run.')
+        parser.add_argument('--chunk-size', type=int, default=membership.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        run = membership.recalculate(incremental=options['incremental'], chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - start
+        per_100k = elapsed * 100000 / run.customers if run.customers else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Incremental' if run.incremental else 'Full'} run: {run.changed} of {run.customers} customers "
+            f"changed tier in {elapsed:.2f}s ({per_100k:.1f}s per 100k customers)."
+        ))
@@ -0,0 +1,179 @@
+import functools
+import logging
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import resolve
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.models import User
+from store import facets
+from store.models import Collection, Order, OrderItem, Product, ProductFacetCount
+
+
+class Command(BaseCommand):
+    help = (
+        'Run concurrent add-to-cart and checkout requests through the store viewsets '
+        'against a throwaway test database, check stock and order invariants, and '
+        'report throughput and retry rates.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Customers, each with its own cart.')
+        parser.add_argument('--clients-per-cart', type=int, default=2,
+                            help='Threads sharing each cart, racing on the cart item uniqueness constraint.')
+        parser.add_argument('--rounds', type=int, default=20)
+        parser.add_argument('--products', type=int, default=3)
+        parser.add_argument('--stock', type=int, default=40)
+        parser.add_argument('--max-retries', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    factory = APIRequestFactory()
+
+    def handle(self, *args, **options):
+        # Expected 400s, retried lock errors and skipped co-occurrence updates
+        # would otherwise be logged per request.
+        for name in ('django.request', 'store.recommendations'):
+            logging.getLogger(name).setLevel(logging.CRITICAL)
+        setup_test_environment()
+        with tempfile.TemporaryDirectory() as directory:
+            if connection.vendor == 'sqlite':
+                # Threads need a shared on-disk database, not the in-memory test default.
+                connection.settings_dict.setdefault('TEST', {})['NAME'] = str(Path(directory) / 'stress.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                # Keep throwaway cart snapshots out of the shared file cache.
+                with override_settings(CACHES={
+                    **settings.CACHES,
+                    'carts': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'stress-carts'},
+                }):
+                    report = self.run(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+        self.print_report(report)
+        if report['failures'] or report['violations']:
+            raise CommandError('Checkout stress run failed.')
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        collection = Collection.objects.create(title='Stress')
+        products = [
+            Product.objects.create(title=f'Stress product {index}', collection=collection, unit_price=10,
+                                   old_unit_price=10, description='', stock=options['stock'])
+            for index in range(options['products'])
+        ]
+        users = [User.objects.create_user(f'stress{index}', f'stress{index}@example.com', 'stress')
+                 for index in range(options['workers'])]
+        clients = [user for user in users for _ in range(options['clients_per_cart'])]
+        plans = [
+            [(rng.choice(products).id, rng.randint(1, 3)) for _ in range(options['rounds'])]
+            for _ in clients
+        ]
+        stats = Counter()
+        failures = []
+        lock = threading.Lock()
+
+        def work(user, plan):
+            cart_id = user.customer.cart.id
+            send = functools.partial(self.request, user=user, max_retries=options['max_retries'],
+                                     stats=stats, failures=failures, lock=lock)
+            try:
+                for product_id, quantity in plan:
+                    send('post', f'/store/carts/{cart_id}/items/', {'product_id': product_id, 'quantity': quantity}, 'add')
+                    response = send('post', '/store/orders/', {}, 'checkout')
+                    if response is not None and response.status_code == 400 and 'stock' in str(response.data):
+                        # Out of stock: empty the cart and carry on.
+                        items = send('get', f'/store/carts/{cart_id}/items/', None, 'list')
+                        for item in items.data if items is not None else []:
+                            send('delete', f"/store/carts/{cart_id}/items/{item['id']}/", None, 'remove')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=work, args=(user, plan)) for user, plan in zip(clients, plans)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        violations = []
+        sold = dict(OrderItem.objects.values_list('product_id').annotate(Sum('quantity')))
+        for product in Product.objects.filter(id__in=[product.id for product in products]):
+            if options['stock'] - product.stock != sold.get(product.id, 0):
+                violations.append(f'{product}: stock {product.stock} but {sold.get(product.id, 0)} '
+                                  f'of {options["stock"]} sold')
+        stored = set(ProductFacetCount.objects.filter(count__gt=0).values_list('collection_id','price_bucket','stock_band','count'))
+        if stored != set(facets.grouped_counts(Product.objects.all())):
+            violations.append('facet counts do not match the products')
+        if Order.objects.filter(items__isnull=True).exists():
+            violations.append('orders without items exist')
+        if Order.objects.count() != stats['checkout_ok']:
+            violations.append(f"{Order.objects.count()} orders stored but {stats['checkout_ok']} checkouts succeeded")
+        return {'options': options, 'stats': stats, 'failures': failures, 'violations': violations, 'elapsed': elapsed}
+
+    def request(self, method, path, data, kind, user, max_retries, stats, failures, lock):
+        # Views are called directly rather than through the test client, whose
+        # exception capture is shared between threads.
+        match = resolve(path)
+        for attempt in range(max_retries + 1):
+            request = getattr(self.factory, method)(path, data, format='json')
+            force_authenticate(request, user)
+            try:
+                response = match.func(request, *match.args, **match.kwargs)
+            except OperationalError:
+                # Lock contention (e.g. "database is locked" on SQLite) is retryable.
+                with lock:
+                    stats[f'{kind}_retry'] += 1
+                time.sleep(random.uniform(0, 0.001 * 2 ** min(attempt, 6)))
+                continue
+            except Exception as error:
+                with lock:
+                    failures.append(f'{kind} {path}: {type(error).__name__} {error}')
+                return None
+            with lock:
+                if response.status_code >= 500:
+                    failures.append(f'{kind} {path}: HTTP {response.status_code}')
+                elif kind == 'checkout' and response.status_code >= 300:
+                    # Another client of the same cart may have checked it out already.
+                    stats['checkout_rejected' if 'stock' in str(response.data) else 'checkout_empty'] += 1
+                else:
+                    stats[f'{kind}_ok'] += 1
+            return response
+        with lock:
+            stats[f'{kind}_gave_up'] += 1
+        return None
+
+    def print_report(self, report):
+        stats, options, elapsed = report['stats'], report['options'], report['elapsed']
+        checkouts = stats['checkout_ok'] + stats['checkout_rejected'] + stats['checkout_empty']
+        retries = sum(stats[key] for key in stats if key.endswith('_retry'))
+        gave_up = sum(stats[key] for key in stats if key.endswith('_gave_up'))
+        requests = sum(stats.values()) - retries - gave_up
+        self.stdout.write(
+            f"{options['workers']} carts x {options['clients_per_cart']} clients x {options['rounds']} rounds "
+            f"on {options['products']} products "
+            f"(stock {options['stock']}) in {elapsed:.2f}s\n"
+            f"checkouts: {stats['checkout_ok']} confirmed, {stats['checkout_rejected']} rejected for stock, "
+            f"{stats['checkout_empty']} found the cart already checked out, "
+            f"{checkouts / elapsed:.1f}/s\n"
+            f"retries: {retries} over {requests} requests ({retries / max(requests, 1):.2f} per request), "
+            f"{gave_up} gave up after {options['max_retries']}; "
+            f"checkout {stats['checkout_retry']}, add {stats['add_retry']}, remove {stats['remove_retry'] + stats['list_retry']}"
+        )
+        for failure in report['failures'][:20]:
+            self.stdout.write(self.style.ERROR(f'failure: {failure}'))
+        for violation in report['violations']:
+            self.stdout.write(self.style.ERROR(f'invariant violated: {violation}'))
+        if not report['failures'] and not report['violations']:
+            self.stdout.write(self.style.SUCCESS('All invariants held.'))
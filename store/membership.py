@@ -0,0 +1,94 @@
+"""
+Membership tiers derived from confirmed order spend (`unit_price * quantity`
+of the order items) over the last `MEMBERSHIP['WINDOW_DAYS']` days.
+
+`recalculate` walks customers in keyset-ordered chunks, aggregates spend for
+each chunk in one query and `bulk_update`s only the customers whose tier
+changed. Incremental runs visit just the customers with orders placed or
+updated since the previous run, plus those whose confirmed orders have
+since aged out of the window. Customers whose tier staff set by hand
+(`membership_locked`) keep it.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import models
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from store.models import Customer, MembershipRecalculation, Order, OrderItem
+
+CHUNK_SIZE = 1000
+
+
+def get_setting(name, default):
+    return getattr(settings, 'MEMBERSHIP', {}).get(name, default)
+
+
+def tier_for_spend(spend):
+    if spend >= Decimal(get_setting('GOLD_SPEND', 1000)):
+        return Customer.MEMBERSHIP_GOLD
+    if spend >= Decimal(get_setting('SILVER_SPEND', 200)):
+        return Customer.MEMBERSHIP_SILVER
+    return Customer.MEMBERSHIP_BRONZE
+
+
+def _customer_chunks(chunk_size, since, window):
+    last_id = 0
+    while True:
+        if since is None:
+            ids = list(Customer.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+        else:
+            ids = list(
+                Order.objects.filter(
+                    Q(update_at__gte=since) |
+                    Q(status=Order.STATUS_CONFIRM, created_at__gte=since - window, created_at__lt=timezone.now() - window),
+                    customer_id__gt=last_id,
+                ).order_by('customer_id').values_list('customer_id', flat=True).distinct()[:chunk_size]
+            )
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def _spend(customer_ids, window_start):
+    return dict(
+        OrderItem.objects.filter(
+            order__customer_id__in=customer_ids,
+            order__status=Order.STATUS_CONFIRM,
+            order__created_at__gte=window_start,
+        ).order_by().values_list('order__customer_id').annotate(
+            spend=Sum(F('unit_price') * F('quantity'), output_field=models.DecimalField())
+        )
+    )
+
+
+def recalculate(incremental=False, chunk_size=CHUNK_SIZE):
+    """
+    Recalculate membership tiers and return the `MembershipRecalculation`
+    recorded for the run. An incremental run with no earlier run to start
+    from recalculates everyone.
+    """
+    window = timedelta(days=get_setting('WINDOW_DAYS', 365))
+    previous = MembershipRecalculation.objects.filter(finished_at__isnull=False).order_by('-started_at').first() \
+        if incremental else None
+    run = MembershipRecalculation.objects.create(started_at=timezone.now(), incremental=previous is not None)
+    since = previous.started_at if previous else None
+
+    for ids in _customer_chunks(chunk_size, since, window):
+        spend = _spend(ids, run.started_at - window)
+        changed = []
+        for customer in Customer.objects.filter(id__in=ids, membership_locked=False).only('id', 'membership'):
+            tier = tier_for_spend(spend.get(customer.id, Decimal(0)))
+            if customer.membership != tier:
+                customer.membership = tier
+                changed.append(customer)
+        Customer.objects.bulk_update(changed, ['membership'])
+        run.customers += len(ids)
+        run.changed += len(changed)
+
+    run.finished_at = timezone.now()
+    run.save()
+    return run
@@ -0,0 +1,84 @@
+import gzip
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+
+from store import snapshots
+
+PRODUCT_PARAMS = {'page_size', 'page', 'collection'}
+
+
+class CatalogSnapshotMiddleware:
+    """
+    Answers anonymous JSON reads of the catalog lists from the files written by
+    `store.snapshots`, without touching the database (or the catalog
+    throttle, which is there to protect it). Anything a snapshot does not
+    cover exactly, such as other query params, HTML or MessagePack, an
+    `Authorization` header, or a page not built yet, falls through to the
+    live viewsets. Not installed unless `CATALOG_SNAPSHOTS['ENABLED']` is set.
+    """
+
+    def __init__(self, get_response):
+        if not snapshots.enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.page_size = str(snapshots.get_page_size())
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and 'HTTP_AUTHORIZATION' not in request.META \
+                and self._accepts_json(request):
+            key = self._snapshot_key(request)
+            if key is not None:
+                response = self._serve(request, key)
+                if response is not None:
+                    return response
+        return self.get_response(request)
+
+    @staticmethod
+    def _media_types(header):
+        types = set()
+        for part in header.split(','):
+            media_type, *params = [token.strip() for token in part.split(';')]
+            if media_type and 'q=0' not in params and 'q=0.0' not in params:
+                types.add(media_type.lower())
+        return types
+
+    def _accepts_json(self, request):
+        accepted = self._media_types(request.META.get('HTTP_ACCEPT', '*/*'))
+        # Browsers get the browsable API and MessagePack clients their format.
+        return bool(accepted & {'application/json', 'application/*', '*/*'}) \
+            and not accepted & {'text/html', 'application/msgpack'}
+
+    def _snapshot_key(self, request):
+        params = request.GET
+        if request.path == '/store/collections/':
+            return () if not params else None
+        if request.path != '/store/products/' or not set(params) <= PRODUCT_PARAMS \
+                or any(len(params.getlist(name)) > 1 for name in params) or params.get('page_size') != self.page_size:
+            return None
+        page, collection = params.get('page', '1'), params.get('collection', '1')
+        if not self._is_number(page) or not self._is_number(collection):
+            return None
+        return params.get('collection', snapshots.ALL), int(page)
+
+    @staticmethod
+    def _is_number(value):
+        return value.isdigit() and str(int(value)) == value and int(value) > 0
+
+    def _serve(self, request, key):
+        accepted = self._media_types(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        encoding = next((encoding for encoding in snapshots.ENCODINGS if encoding in accepted), None)
+        path = snapshots.page_path(*key, encoding or 'gzip') if key else snapshots.collections_path(encoding or 'gzip')
+        try:
+            with open(path, 'rb') as file:
+                body = file.read()
+        except FileNotFoundError:
+            return None
+        if encoding is None:
+            body = gzip.decompress(body)
+        response = HttpResponse(body, content_type='application/json')
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Vary'] = 'Accept, Accept-Encoding, Authorization'
+        response['X-Snapshot'] = 'hit'
+        return response
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.22 on 2026-10-19 17:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_product_changes_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCooccurrence',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='cooccurrence', serialize=False, to='store.product')),
+                ('neighbours', models.JSONField(default=list)),
+            ],
+        ),
+    ]
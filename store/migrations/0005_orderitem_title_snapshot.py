@@ -0,0 +1,33 @@
+# Generated by Django 3.2.22 on 2026-10-19 17:27
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+BATCH_SIZE = 10000
+
+
+def backfill_titles(apps, schema_editor):
+    OrderItem = apps.get_model('store', 'OrderItem')
+    Product = apps.get_model('store', 'Product')
+    last_id = OrderItem.objects.aggregate(Max('id'))['id__max'] or 0
+    title = Subquery(Product.objects.filter(id=OuterRef('product_id')).values('title')[:1])
+    for start in range(0, last_id, BATCH_SIZE):
+        OrderItem.objects.filter(id__gt=start, id__lte=start + BATCH_SIZE, title='').update(title=title)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('store', '0004_product_cooccurrence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='title',
+            field=models.CharField(blank=True, max_length=128),
+        ),
+        migrations.RunPython(backfill_titles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.22 on 2026-10-19 17:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_facet_counts(apps, schema_editor):
+    from store import facets
+    facets.rebuild(apps.get_model('store', 'Product'), apps.get_model('store', 'ProductFacetCount'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_orderitem_title_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_bucket', models.PositiveSmallIntegerField()),
+                ('stock_band', models.CharField(max_length=1)),
+                ('count', models.IntegerField(default=0)),
+                ('collection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.collection')),
+            ],
+            options={
+                'unique_together': {('collection', 'price_bucket', 'stock_band')},
+            },
+        ),
+        migrations.RunPython(populate_facet_counts, migrations.RunPython.noop),
+    ]
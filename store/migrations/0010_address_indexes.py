@@ -0,0 +1,21 @@
+# Generated by Django 3.2.22 on 2026-10-19 18:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_order_archive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='address',
+            index=models.Index(fields=['customer', 'label'], name='store_addre_custome_5eab35_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='address',
+            index=models.Index(fields=['country', 'state', 'city'], name='store_addre_country_94da83_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.22 on 2026-10-19 18:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_address_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='membership_locked',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='customer',
+            name='membership',
+            field=models.CharField(choices=[('b', 'Bronze'), ('s', 'Silver'), ('g', 'Gold')], default='b', max_length=1),
+        ),
+    ]
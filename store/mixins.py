@@ -0,0 +1,58 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.serializers import ListSerializer
+
+
+class SparseFieldsetMixin:
+    """
+    Lets read requests pick serializer fields with `?fields=` or `?exclude=`
+    (comma separated) and trims the SQL to match. `sparse_fieldset_queries`
+    maps every serializer field to the columns, joins and prefetches it needs:
+        {'title': {'only': ['title']},
+         'collection': {'only': ['collection', 'collection__title'], 'select_related': ['collection']}}
+    """
+    sparse_fieldset_queries = {}
+
+    def get_sparse_fields(self):
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = self._parse_sparse_fields()
+        return self._sparse_fields
+
+    def _parse_sparse_fields(self):
+        params = self.request.query_params
+        if self.request.method not in SAFE_METHODS or not ('fields' in params or 'exclude' in params):
+            return None
+        available = list(self.get_serializer_class().Meta.fields)
+        fields = [name for name in params.get('fields', '').split(',') if name]
+        exclude = [name for name in params.get('exclude', '').split(',') if name]
+        unknown = [name for name in fields + exclude if name not in available]
+        if unknown:
+            raise ValidationError({'error': f"Unknown fields: {', '.join(unknown)}."})
+        return [name for name in available if (not fields or name in fields) and name not in exclude]
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            target = serializer.child if isinstance(serializer, ListSerializer) else serializer
+            for name in set(target.fields) - set(fields):
+                target.fields.pop(name)
+        return serializer
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        fields = self.get_sparse_fields()
+        if fields is None or any(name not in self.sparse_fieldset_queries for name in fields):
+            return queryset
+        only, select_related, prefetch_related = ['pk'], [], []
+        for name in fields:
+            query = self.sparse_fieldset_queries[name]
+            only += query.get('only', [])
+            select_related += query.get('select_related', [])
+            prefetch_related += query.get('prefetch_related', [])
+        queryset = queryset.select_related(None).prefetch_related(None).only(*dict.fromkeys(only))
+        if select_related:
+            queryset = queryset.select_related(*dict.fromkeys(select_related))
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*dict.fromkeys(prefetch_related))
+        return queryset
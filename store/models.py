@@ -1,7 +1,6 @@
 import uuid
 
 from django.conf import settings
-from django.contrib import admin
 from django.core.validators import MinValueValidator
 from django.db import models
 
@@ -26,15 +25,17 @@ class Customer(models.Model):
     phone = models.PositiveIntegerField(blank=True,null=True)
     birth_date = models.DateField(blank=True,null=True)
     sex = models.CharField(choices=SEX_CHOICES,default=SEX_MALE,max_length=1)
-    membership = models.CharField(choices=MEMBERSHIP_CHOICES,default=MEMBERSHIP_SILVER, max_length=1)
+    membership = models.CharField(choices=MEMBERSHIP_CHOICES,default=MEMBERSHIP_BRONZE, max_length=1)
+    # Set when staff pick the tier by hand; store.membership leaves it alone.
+    membership_locked = models.BooleanField(default=False)
 
-    @admin.display(ordering='user__first_name')
     def first_name(self):
         return self.user.first_name
+    first_name.admin_order_field = 'user__first_name'
 
-    @admin.display(ordering='user__last_name')
     def last_name(self):
         return self.user.last_name
+    last_name.admin_order_field = 'user__last_name'
     
     def __str__(self):
         return f'{self.user.first_name} {self.user.last_name}' 
@@ -63,14 +64,65 @@ class Product(models.Model):
 
     def __str__(self) -> str:
         return f'{self.title}'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # post_save receivers compare against the values before this save.
+        self._loaded_values = {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields}
     
     class Meta:
         ordering = ['title']
+        indexes = [models.Index(fields=['update_at','id'])]
+
+class ProductTombstone(models.Model):
+    product_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['deleted_at','product_id'])]
+
+class ProductCooccurrence(models.Model):
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='cooccurrence')
+    neighbours = models.JSONField(default=list)
+
+class ProductFacetCount(models.Model):
+    collection = models.ForeignKey(Collection, on_delete=models.CASCADE, related_name='+')
+    price_bucket = models.PositiveSmallIntegerField()
+    stock_band = models.CharField(max_length=1)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [['collection','price_bucket','stock_band']]
+
+class StockFeedBatch(models.Model):
+    batch_id = models.CharField(max_length=64,unique=True)
+    records = models.PositiveIntegerField(default=0)
+    applied = models.PositiveIntegerField(default=0)
+    rejected = models.PositiveIntegerField(default=0)
+    rejections = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True,blank=True)
+
+    def __str__(self):
+        return f'Stock feed {self.batch_id}'
+
+class MembershipRecalculation(models.Model):
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True,blank=True)
+    incremental = models.BooleanField(default=False)
+    customers = models.PositiveIntegerField(default=0)
+    changed = models.PositiveIntegerField(default=0)
 
 class Cart(models.Model):
     id = models.UUIDField(default=uuid.uuid4,primary_key=True,editable=False)
     customer = models.OneToOneField(Customer, on_delete=models.CASCADE,blank=True,null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True,db_index=True)
 
     def __str__(self):
         return f'Cart #{self.id}'
@@ -93,8 +145,8 @@ class Order(models.Model):
         (STATUS_CONFIRM,'Confirm'),
     ]
     customer = models.ForeignKey(Customer, on_delete=models.PROTECT)
-    created_at = models.DateTimeField(auto_now_add=True)
-    update_at = models.DateTimeField(auto_now=True)
+    created_at = models.DateTimeField(auto_now_add=True,db_index=True)
+    update_at = models.DateTimeField(auto_now=True,db_index=True)
     status = models.CharField(choices=STATUS_COICHES,default=STATUS_PENDING,max_length=1)
 
     def __str__(self) -> str:
@@ -103,12 +155,38 @@ class Order(models.Model):
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.PROTECT,related_name='items')
     product = models.ForeignKey(Product, on_delete=models.PROTECT,related_name='orderitems')
+    title = models.CharField(max_length=128,blank=True)
     unit_price = models.DecimalField(max_digits=10,decimal_places=2)
     quantity = models.PositiveSmallIntegerField(validators=[MinValueValidator(1)])
+
+    def save(self, *args, **kwargs):
+        if not self.title:
+            self.title = self.product.title
+        return super().save(*args, **kwargs)
     
     class Meta:
         unique_together = ['order','product']
 
+class ArchivedOrder(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(Customer, on_delete=models.PROTECT,related_name='archived_orders')
+    created_at = models.DateTimeField(db_index=True)
+    update_at = models.DateTimeField()
+    status = models.CharField(choices=Order.STATUS_COICHES,max_length=1)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return f'Archived order #{self.id} by {self.customer}'
+
+class ArchivedOrderItem(models.Model):
+    # No foreign key to Product, so archived history does not keep products alive.
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE,related_name='items')
+    product_id = models.BigIntegerField(db_index=True)
+    title = models.CharField(max_length=128)
+    unit_price = models.DecimalField(max_digits=10,decimal_places=2)
+    quantity = models.PositiveSmallIntegerField()
+
 class Address(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE,related_name='addresses')
     label = models.CharField(max_length=32)
@@ -119,4 +197,21 @@ class Address(models.Model):
     COUTNRY_COICHES = [
         (COUTNRY_BD,'Bangladesh'),
     ]
-    country = models.CharField(choices=COUTNRY_COICHES,default=COUTNRY_BD,max_length=2)
\ No newline at end of file
+    country = models.CharField(choices=COUTNRY_COICHES,default=COUTNRY_BD,max_length=2)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # post_save receivers compare against the values before this save.
+        self._loaded_values = {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields}
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer','label']),
+            models.Index(fields=['country','state','city']),
+        ]
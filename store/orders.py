@@ -0,0 +1,61 @@
+from django.db import models, transaction
+from django.db.models import Case, F, Sum, Value, When
+from django.utils import timezone
+
+from store.models import Order, OrderItem, Product
+from store.signals import stock_changed
+
+ALLOWED_TRANSITIONS = {
+    Order.STATUS_PENDING: {Order.STATUS_CONFIRM, Order.STATUS_FAILED},
+}
+
+OUTCOME_UPDATED = 'updated'
+OUTCOME_INVALID = 'invalid_transition'
+OUTCOME_NOT_FOUND = 'not_found'
+
+
+def restore_stock(order_ids, now=None):
+    """Give the quantities of the given orders back to stock in one UPDATE."""
+    quantities = OrderItem.objects.filter(order_id__in=order_ids).order_by()\
+        .values_list('product_id').annotate(Sum('quantity'))
+    if not quantities:
+        return 0
+    with transaction.atomic():
+        restored = Product.objects.filter(id__in=[product_id for (product_id, _) in quantities]).update(
+            stock=F('stock') + Case(
+                *[When(id=product_id, then=Value(quantity)) for (product_id, quantity) in quantities],
+                output_field=models.PositiveIntegerField(),
+            ),
+            update_at=now or timezone.now(),
+        )
+        stock_changed.send(sender=Product, changes=dict(quantities))
+    return restored
+
+
+def transition_orders(queryset, status):
+    """
+    Move the orders in `queryset` to `status` with one conditional UPDATE,
+    restoring stock when they fail. Returns `{order_id: (outcome, status)}`
+    where `status` is the order's status after the call.
+    """
+    sources = [source for source, targets in ALLOWED_TRANSITIONS.items() if status in targets]
+    now = timezone.now()
+    with transaction.atomic():
+        current = dict(queryset.select_for_update().order_by().values_list('id', 'status'))
+        eligible = [order_id for order_id, order_status in current.items() if order_status in sources]
+        if eligible:
+            updated_count = Order.objects.filter(id__in=eligible, status__in=sources).update(status=status, update_at=now)
+            if updated_count < len(eligible):
+                # A concurrent call moved some of them first (select_for_update
+                # does not lock on SQLite); only the rows stamped here changed.
+                changed = set(Order.objects.filter(id__in=eligible, status=status, update_at=now)
+                              .values_list('id', flat=True))
+                current.update(Order.objects.filter(id__in=set(eligible) - changed).values_list('id', 'status'))
+                eligible = list(changed)
+            if eligible and status == Order.STATUS_FAILED:
+                restore_stock(eligible, now)
+    eligible = set(eligible)
+    return {
+        order_id: (OUTCOME_UPDATED, status) if order_id in eligible else (OUTCOME_INVALID, order_status)
+        for order_id, order_status in current.items()
+    }
@@ -0,0 +1,95 @@
+import base64
+import binascii
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimate_row_count(queryset):
+    """
+    Cheap row count estimate for the table behind an unfiltered queryset,
+    read from the database statistics instead of a full COUNT(*).
+    Returns None when the backend has no cheap estimate; on SQLite that is
+    until `ANALYZE` (or `PRAGMA optimize`) has gathered statistics.
+    """
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute('SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s', [table])
+        elif connection.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            # Each stat row of the table starts with the row count ANALYZE saw.
+            cursor.execute("SELECT CAST(stat AS INTEGER) FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for large admin changelists. Unfiltered querysets use the
+    estimated table size once it is above `estimate_threshold`, filtered
+    ones and small tables keep the exact count.
+    """
+    estimate_threshold = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where and not queryset.query.distinct:
+            estimate = estimate_row_count(queryset)
+            if estimate is not None and estimate > self.estimate_threshold:
+                return estimate
+        return super().count
+
+
+def encode_cursor(timestamp, pk):
+    """Opaque cursor for a `(timestamp, id)` keyset position."""
+    return base64.urlsafe_b64encode(f'{timestamp.isoformat()}|{pk}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Inverse of `encode_cursor`; raises ValueError on malformed input."""
+    try:
+        timestamp, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        timestamp = parse_datetime(timestamp)
+        pk = int(pk)
+    except (binascii.Error, UnicodeError, ValueError) as error:
+        raise ValueError('Invalid cursor.') from error
+    if timestamp is None:
+        raise ValueError('Invalid cursor.')
+    return timestamp, pk
+
+
+class CatalogPagination(PageNumberPagination):
+    """
+    Opt-in page numbers: lists stay unpaginated unless `?page_size=` is given.
+    Links are relative, so a page does not depend on the Host it was served for.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_next_link(self):
+        if not self.page.has_next():
+            return None
+        return replace_query_param(self.request.get_full_path(), self.page_query_param, self.page.next_page_number())
+
+    def get_previous_link(self):
+        if not self.page.has_previous():
+            return None
+        url = self.request.get_full_path()
+        if self.page.previous_page_number() == 1:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.page.previous_page_number())
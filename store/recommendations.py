@@ -0,0 +1,114 @@
+"""
+"Frequently bought together" recommendations from products that share an
+order. Each product keeps its top `TOP_K` neighbours as `[product_id, count]`
+pairs in `ProductCooccurrence.neighbours`, ordered by count.
+"""
+import heapq
+import logging
+from collections import Counter, defaultdict
+from itertools import combinations
+
+from django.db import DatabaseError, transaction
+
+from store.models import ArchivedOrderItem, OrderItem, Product, ProductCooccurrence
+
+TOP_K = 10
+
+logger = logging.getLogger(__name__)
+
+
+def _top_neighbours(counts, k=TOP_K):
+    return [[product_id, count] for product_id, count in
+            heapq.nsmallest(k, counts.items(), key=lambda item: (-item[1], item[0]))]
+
+
+def _count_pairs(pairs, product_ids):
+    for first, second in combinations(set(product_ids), 2):
+        pairs[first][second] += 1
+        pairs[second][first] += 1
+
+
+def _orders(rows, chunk_size):
+    """Product ids per order from `(order_id, product_id)` rows sorted by order id."""
+    current_order, product_ids = None, []
+    for order_id, product_id in rows.iterator(chunk_size=chunk_size):
+        if order_id != current_order:
+            if product_ids:
+                yield product_ids
+            current_order, product_ids = order_id, []
+        product_ids.append(product_id)
+    if product_ids:
+        yield product_ids
+
+
+def rebuild_cooccurrence(chunk_size=10000, batch_size=1000):
+    """
+    Rebuild every product's neighbours in one pass over OrderItem and
+    ArchivedOrderItem (archived orders keep their ids, so the two never share
+    an order), streamed in order id order so only the current order's
+    products are held at a time. Archived items of deleted products are
+    skipped. Returns the number of orders, products and distinct pairs seen.
+    """
+    pairs = defaultdict(Counter)
+    orders_count = 0
+    with transaction.atomic():
+        # One transaction, so orders archived mid-rebuild are read exactly once.
+        for model in (OrderItem, ArchivedOrderItem):
+            for product_ids in _orders(model.objects.order_by('order_id').values_list('order_id', 'product_id'),
+                                       chunk_size):
+                _count_pairs(pairs, product_ids)
+                orders_count += 1
+    existing = set(Product.objects.filter(id__in=list(pairs)).values_list('id', flat=True)) if pairs else set()
+    for product_id in list(pairs):
+        if product_id not in existing:
+            del pairs[product_id]
+            continue
+        for neighbour_id in [neighbour_id for neighbour_id in pairs[product_id] if neighbour_id not in existing]:
+            del pairs[product_id][neighbour_id]
+
+    with transaction.atomic():
+        ProductCooccurrence.objects.all().delete()
+        ProductCooccurrence.objects.bulk_create(
+            (ProductCooccurrence(product_id=product_id, neighbours=_top_neighbours(counts))
+             for product_id, counts in pairs.items() if counts),
+            batch_size=batch_size,
+        )
+    return {
+        'orders': orders_count,
+        'products': len(pairs),
+        'pairs': sum(len(counts) for counts in pairs.values()) // 2,
+    }
+
+
+def record_order(product_ids):
+    """
+    Fold one new order into the stored neighbours. Counts outside a product's
+    top-K are not kept, so a neighbour that was previously cut off re-enters
+    with only its new count; `rebuild_cooccurrence` restores exact counts.
+    Runs after checkout commits, so database errors are logged, not raised.
+    """
+    pairs = defaultdict(Counter)
+    _count_pairs(pairs, product_ids)
+    if not pairs:
+        return
+    try:
+        _merge_pairs(pairs)
+    except DatabaseError:
+        logger.exception('Could not record order in product co-occurrence.')
+
+
+def _merge_pairs(pairs):
+    with transaction.atomic():
+        existing = ProductCooccurrence.objects.select_for_update().in_bulk(list(pairs))
+        created, updated = [], []
+        for product_id, increments in pairs.items():
+            row = existing.get(product_id)
+            if row is None:
+                created.append(ProductCooccurrence(product_id=product_id, neighbours=_top_neighbours(increments)))
+                continue
+            counts = Counter(dict(row.neighbours))
+            counts.update(increments)
+            row.neighbours = _top_neighbours(counts)
+            updated.append(row)
+        ProductCooccurrence.objects.bulk_create(created, ignore_conflicts=True)
+        ProductCooccurrence.objects.bulk_update(updated, ['neighbours'])
@@ -1,9 +1,13 @@
-from django.db import transaction
-from django.db.models import F
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
 from rest_framework import serializers
 
-from store.models import (Address, Cart, CartItem, Collection, Customer, Order,
-                          OrderItem, Product)
+from store import address_cache, cart_cache, orders, recommendations
+from store.models import (Address, ArchivedOrder, ArchivedOrderItem, Cart,
+                          CartItem, Collection, Customer, Order, OrderItem,
+                          Product)
+from store.signals import stock_changed
 
 
 class SimpleCustomerSerializer(serializers.ModelSerializer):
@@ -20,9 +24,11 @@ class AddressSerializer(serializers.ModelSerializer):
         model = Address
         fields = ['id','customer','label','street','city','state','country']
     def create(self, validated_data):
-        user_id = self.context['user_id']
-        customer_id = Customer.objects.only('id').prefetch_related('user').get(user_id=user_id)
-        self.instance = Address.objects.prefetch_related('customer').create(customer=customer_id,**validated_data)
+        customer_id = address_cache.get_customer_id(self.context['user_id'])
+        if customer_id is None:
+            raise serializers.ValidationError({'error': 'The user is not associated with any customer account. Please create a customer profile.'})
+        address = Address.objects.create(customer_id=customer_id,**validated_data)
+        self.instance = Address.objects.select_related('customer__user').get(id=address.id)
         return self.instance
 
 class MinifyCustomerSerializer(serializers.ModelSerializer):
@@ -80,16 +86,26 @@ class AddCartItemSerializer(serializers.ModelSerializer):
         model = CartItem
         fields = ['id','product_id','quantity']
 
+    def validate_product_id(self, value):
+        if not Product.objects.filter(id=value).exists():
+            raise serializers.ValidationError(f'No product found with the given ID {value}.')
+        return value
+
     def save(self, **kwargs):
         cart_id = self.context['cart_id']
         quantity = self.validated_data['quantity']
         product_id = self.validated_data['product_id']
-        try: 
-            cart_item = CartItem.objects.prefetch_related('cart').select_related('product').get(cart_id=cart_id,product_id=product_id)
-            cart_item.quantity += quantity
-            self.instance = cart_item.save()
-        except CartItem.DoesNotExist:
-            self.instance = CartItem.objects.prefetch_related('cart').select_related('product').create(cart_id=cart_id,**self.validated_data)
+        cart_items = CartItem.objects.filter(cart_id=cart_id,product_id=product_id)
+        # One transaction, so a concurrent checkout cannot remove the item before it is read back.
+        with transaction.atomic():
+            if not cart_items.update(quantity=F('quantity') + quantity):
+                try:
+                    with transaction.atomic():
+                        CartItem.objects.create(cart_id=cart_id,**self.validated_data)
+                except IntegrityError:
+                    # A concurrent request added the same product first.
+                    cart_items.update(quantity=F('quantity') + quantity)
+            self.instance = cart_items.select_related('product').get()
         return self.instance
 
 class UpdateCartItemSerializer(serializers.ModelSerializer):
@@ -128,21 +144,23 @@ class MergeAnonymousCartSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError(\
                     {'error': 'Authenticated and anonymous user carts cannot be merged because they have the same ID.'})
 
-            if anon_cart.customer:
+            if anon_cart.customer_id:
                 raise serializers.ValidationError(\
                     {'error': 'The provided cart is not an anonymous cart.'})
 
             with transaction.atomic():
-                for anon_item in anon_cart.items.all():
-                    try:
-                        auth_item = auth_cart.items.get(product=anon_item.product)
-                        auth_item.quantity = F('quantity') + anon_item.quantity
-                        auth_item.save(update_fields=['quantity'])
-                    except CartItem.DoesNotExist:
-                        CartItem.objects.create(cart=auth_cart, product=anon_item.product, quantity=anon_item.quantity)
-                    anon_item.delete()
+                quantities = dict(anon_cart.items.values_list('product_id','quantity'))
+                auth_items = list(auth_cart.items.filter(product_id__in=quantities))
+                for auth_item in auth_items:
+                    auth_item.quantity = F('quantity') + quantities.pop(auth_item.product_id)
+                CartItem.objects.bulk_update(auth_items,['quantity'])
+                CartItem.objects.bulk_create([
+                    CartItem(cart=auth_cart, product_id=product_id, quantity=quantity)
+                    for product_id, quantity in quantities.items()
+                ])
                 anon_cart.delete()
-                self.instance = auth_cart
+                self.instance = Cart.objects.select_related('customer__user').prefetch_related('items__product')\
+                    .get(id=auth_cart.id)
                 return self.instance
         raise serializers.ValidationError(\
             {'error': 'An authenticated or anonymous user cart is missing, and the merge cannot be completed.'})
@@ -160,13 +178,20 @@ class MergeAnonymousCartSerializer(serializers.ModelSerializer):
         model = Cart
         fields = []
     
+class OrderedProductSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='product_id')
+
+    class Meta:
+        model = OrderItem
+        fields = ['id','title','unit_price']
+
 class OrderItemSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(read_only=True)
-    product = SimpleProductSerializer(read_only=True)
+    product = OrderedProductSerializer(source='*',read_only=True)
     sub_total_price = serializers.SerializerMethodField()
 
     def get_sub_total_price(self,orderitem:OrderItem):
-        return orderitem.product.unit_price * orderitem.quantity
+        return orderitem.unit_price * orderitem.quantity
     
     class Meta:
         model = OrderItem
@@ -183,7 +208,7 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = ['id','customer','items','status','total_price']
 
     def get_total_price(self,order:Order):
-        return sum([item.product.unit_price * item.quantity for item in order.items.all()])
+        return sum([item.unit_price * item.quantity for item in order.items.all()])
 
     def create(self, validated_data):
         user_id = self.context['user_id']
@@ -198,27 +223,119 @@ class OrderSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({'error': 'No cart was found for this customer. Please add items to your cart before creating an order.'})
 
         with transaction.atomic():
-            items = cart.items.all()
+            items = cart.items.select_related('product').order_by('product_id')
             if not items:
                 raise serializers.ValidationError({'error': 'The cart is empty. Please add products to your cart before creating an order.'})
             
-            for item in items:
-                if item.product.stock < item.quantity:
-                    raise serializers.ValidationError({'error': f'Product #<{item.id}> - <{item.product}> does not have enough stock available. Please adjust the quantity in your cart.'})
-                item.product.stock -= item.quantity
-                item.product.save()
+            # Rows are locked in product id order so concurrent checkouts lock them consistently,
+            # and the decrement stays conditional so it never oversells where rows are not locked.
+            quantities = {item.product_id: item.quantity for item in items}
+            stocks = dict(Product.objects.select_for_update().filter(id__in=quantities).order_by('id')
+                          .values_list('id','stock'))
+            short = next((item for item in items if stocks[item.product_id] < item.quantity), None)
+            if short is None:
+                quantity = Case(*[When(id=product_id,then=Value(quantity)) for product_id, quantity in quantities.items()],
+                                output_field=models.IntegerField())
+                in_stock = Product.objects.filter(id__in=quantities,stock__gte=quantity)\
+                    .update(stock=F('stock') - quantity,update_at=timezone.now())
+                if in_stock < len(quantities):
+                    stocks = dict(Product.objects.filter(id__in=quantities).values_list('id','stock'))
+                    short = next((item for item in items if stocks[item.product_id] < item.quantity), items[0])
+            if short is not None:
+                raise serializers.ValidationError({'error': f'Product #<{short.id}> - <{short.product}> does not have enough stock available. Please adjust the quantity in your cart.'})
+            stock_changed.send(sender=Product,changes={item.product_id: -item.quantity for item in items})
 
             order = Order.objects.create(customer=customer)
             order_items = [
                 OrderItem(
                     order=order,
                     product=item.product,
+                    title=item.product.title,
                     unit_price=item.product.unit_price,
                     quantity=item.quantity
                 ) for item in items
             ]
             OrderItem.objects.bulk_create(order_items)
             items.delete()
+            cart_cache.refresh_cart(cart.id)
+            product_ids = [order_item.product_id for order_item in order_items]
+            transaction.on_commit(lambda: recommendations.record_order(product_ids))
             self.instance = order
             
-        return self.instance
\ No newline at end of file
+        return self.instance
+
+class ArchivedOrderItemSerializer(serializers.ModelSerializer):
+    product = OrderedProductSerializer(source='*',read_only=True)
+    sub_total_price = serializers.SerializerMethodField()
+
+    def get_sub_total_price(self,orderitem:ArchivedOrderItem):
+        return orderitem.unit_price * orderitem.quantity
+
+    class Meta:
+        model = ArchivedOrderItem
+        fields = ['id','product','quantity','sub_total_price']
+
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    items = ArchivedOrderItemSerializer(many=True,read_only=True)
+    customer = MinifyCustomerSerializer(read_only=True)
+    total_price = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ArchivedOrder
+        fields = ['id','customer','items','status','total_price','created_at','archived_at']
+
+    def get_total_price(self,order:ArchivedOrder):
+        return sum([item.unit_price * item.quantity for item in order.items.all()])
+
+class OrderFilterSerializer(serializers.Serializer):
+    customer = serializers.IntegerField(required=False)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError({'error': 'The filter needs at least one condition.'})
+        return attrs
+
+class BulkOrderTransitionSerializer(serializers.Serializer):
+    # Filters matching more orders than this are rejected rather than applied.
+    MAX_FILTERED_ORDERS = 10000
+
+    status = serializers.ChoiceField(choices=[Order.STATUS_CONFIRM,Order.STATUS_FAILED])
+    ids = serializers.ListField(child=serializers.IntegerField(),required=False,allow_empty=False,max_length=10000)
+    filter = OrderFilterSerializer(required=False)
+
+    def validate(self, attrs):
+        if ('ids' in attrs) == ('filter' in attrs):
+            raise serializers.ValidationError({'error': 'Provide either a list of order ids or a filter.'})
+        return attrs
+
+    def save(self, **kwargs):
+        status = self.validated_data['status']
+        if 'ids' in self.validated_data:
+            ids = self.validated_data['ids']
+            queryset = Order.objects.filter(id__in=ids)
+        else:
+            conditions = self.validated_data['filter']
+            queryset = Order.objects.filter(status__in=[
+                source for source, targets in orders.ALLOWED_TRANSITIONS.items() if status in targets
+            ])
+            if 'customer' in conditions:
+                queryset = queryset.filter(customer_id=conditions['customer'])
+            if 'created_after' in conditions:
+                queryset = queryset.filter(created_at__gte=conditions['created_after'])
+            if 'created_before' in conditions:
+                queryset = queryset.filter(created_at__lt=conditions['created_before'])
+            matched = list(queryset.order_by('id').values_list('id',flat=True)[:self.MAX_FILTERED_ORDERS + 1])
+            if len(matched) > self.MAX_FILTERED_ORDERS:
+                raise serializers.ValidationError(
+                    {'error': f'The filter matches more than {self.MAX_FILTERED_ORDERS} orders; narrow it down.'})
+            queryset = Order.objects.filter(id__in=matched)
+            ids = None
+        outcomes = orders.transition_orders(queryset, status)
+        if ids is not None:
+            outcomes.update({
+                order_id: (orders.OUTCOME_NOT_FOUND, None) for order_id in ids if order_id not in outcomes
+            })
+        self.instance = outcomes
+        return self.instance
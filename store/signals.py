@@ -1,8 +1,14 @@
 from django.conf import settings
-from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
 
-from store.models import Cart, Customer
+from store import address_cache, cart_cache, facets, snapshots
+from store.models import (Address, Cart, CartItem, Collection, Customer,
+                          Product, ProductTombstone)
+
+# Sent by bulk stock UPDATEs that bypass the model signals, inside their
+# transaction, with `changes={product_id: stock delta}`.
+stock_changed = Signal()
 
 
 @receiver(post_save,sender=settings.AUTH_USER_MODEL)
@@ -13,4 +19,117 @@ def create_customer_for_new_user(sender,**kwargs):
 @receiver(post_save,sender=Customer)
 def create_cart_for_new_customer(sender,**kwargs):
     if kwargs['created']:
-        Cart.objects.create(customer=kwargs['instance'])
\ No newline at end of file
+        Cart.objects.create(customer=kwargs['instance'])
+
+@receiver(post_delete,sender=Product)
+def record_product_tombstone(sender,**kwargs):
+    ProductTombstone.objects.create(product_id=kwargs['instance'].id)
+
+@receiver(post_save,sender=CartItem)
+@receiver(post_delete,sender=CartItem)
+def invalidate_cart_for_item(sender,**kwargs):
+    cart_cache.invalidate_cart(kwargs['instance'].cart_id)
+
+@receiver(post_delete,sender=Cart)
+def invalidate_deleted_cart(sender,**kwargs):
+    cart_cache.invalidate_cart(kwargs['instance'].id)
+
+@receiver(post_save,sender=Product)
+def invalidate_carts_for_product(sender,**kwargs):
+    product = kwargs['instance']
+    loaded = getattr(product,'_loaded_values',None)
+    if not kwargs['created'] and (loaded is None or any(
+        field not in loaded or loaded[field] != getattr(product,field) for field in ('title','unit_price')
+    )):
+        cart_cache.invalidate_carts_with_product(product.id)
+def _changes_facets(kwargs):
+    update_fields = kwargs['update_fields']
+    return update_fields is None or {'collection','unit_price','stock'} & set(update_fields)
+
+@receiver(pre_save,sender=Product)
+def read_facet_row_for_product(sender,**kwargs):
+    product = kwargs['instance']
+    loaded = getattr(product,'_loaded_values',None)
+    if product.pk is None or not _changes_facets(kwargs) or (
+        loaded is not None and all(field in loaded for field in facets.FACET_FIELDS)
+    ):
+        return
+    # Loaded without the faceted fields, so read the old row before it changes.
+    product._facet_values = Product.objects.filter(pk=product.pk).values(*facets.FACET_FIELDS).first()
+
+@receiver(post_save,sender=Product)
+def update_facets_for_saved_product(sender,**kwargs):
+    product = kwargs['instance']
+    if not _changes_facets(kwargs):
+        return
+    old = product.__dict__.pop('_facet_values',getattr(product,'_loaded_values',None))
+    if kwargs['created'] or old is None:
+        facets.record_product_change(None,facets.product_cell(product))
+    else:
+        facets.record_product_change(facets.product_cell(old),facets.product_cell(product))
+
+@receiver(post_delete,sender=Product)
+def update_facets_for_deleted_product(sender,**kwargs):
+    facets.record_product_change(facets.product_cell(kwargs['instance']),None)
+
+@receiver(stock_changed)
+def update_facets_for_stock_changes(sender,changes,**kwargs):
+    facets.record_stock_changes(changes)
+
+@receiver(post_save,sender=Product)
+def refresh_snapshots_for_saved_product(sender,**kwargs):
+    if not snapshots.enabled():
+        return
+    product = kwargs['instance']
+    loaded = getattr(product,'_loaded_values',None)
+    reorder = kwargs['created'] or loaded is None or any(
+        field not in loaded or loaded[field] != getattr(product,field) for field in ('title','collection_id')
+    )
+    snapshots.schedule_refresh(product_ids=[product.id],reorder=reorder)
+
+@receiver(post_delete,sender=Product)
+def refresh_snapshots_for_deleted_product(sender,**kwargs):
+    if snapshots.enabled():
+        snapshots.schedule_refresh(reorder=True)
+
+@receiver(post_save,sender=Collection)
+def refresh_snapshots_for_saved_collection(sender,**kwargs):
+    if snapshots.enabled():
+        snapshots.schedule_refresh(collection_ids=[kwargs['instance'].id],reorder=kwargs['created'])
+
+@receiver(post_delete,sender=Collection)
+def refresh_snapshots_for_deleted_collection(sender,**kwargs):
+    if snapshots.enabled():
+        snapshots.schedule_refresh(reorder=True)
+
+@receiver(stock_changed)
+def refresh_snapshots_for_stock_changes(sender,changes,**kwargs):
+    if snapshots.enabled():
+        snapshots.schedule_refresh(product_ids=list(changes))
+
+@receiver(pre_save,sender=Address)
+def read_customer_for_address(sender,**kwargs):
+    address = kwargs['instance']
+    if address.pk is not None and 'customer_id' not in (getattr(address,'_loaded_values',None) or {}):
+        # Not loaded from the database, so read who it belonged to before it moves.
+        address._previous_customer_id = Address.objects.filter(pk=address.pk).values_list('customer_id',flat=True).first()
+
+@receiver(post_save,sender=Address)
+@receiver(post_delete,sender=Address)
+def invalidate_addresses_for_address(sender,**kwargs):
+    address = kwargs['instance']
+    previous = address.__dict__.pop('_previous_customer_id',(getattr(address,'_loaded_values',None) or {}).get('customer_id'))
+    for customer_id in {address.customer_id,previous} - {None}:
+        address_cache.invalidate_addresses(customer_id)
+
+@receiver(post_save,sender=settings.AUTH_USER_MODEL)
+def invalidate_addresses_for_user(sender,**kwargs):
+    update_fields = kwargs['update_fields']
+    if kwargs['created'] or update_fields is not None and not {'first_name','last_name'} & set(update_fields):
+        return
+    address_cache.invalidate_user(kwargs['instance'].id)
+
+@receiver(post_delete,sender=Customer)
+def forget_addresses_for_customer(sender,**kwargs):
+    customer = kwargs['instance']
+    address_cache.forget_customer(customer.user_id,customer.id)
@@ -0,0 +1,295 @@
+"""
+Pre-rendered catalog snapshots for anonymous reads.
+
+`build` renders `/store/collections/` and every page of `/store/products/`
+(all products, and each collection's) through the live viewsets and writes
+the bodies gzip- and, when the `brotli` package is installed,
+brotli-compressed under `CATALOG_SNAPSHOTS['DIRECTORY']`. A manifest keeps
+the product ids of each listing, so `refresh` re-renders only the pages a
+change touches: pages holding a changed product, pages whose products
+moved, and every page of a listing whose length (and so `count`) changed.
+`store.middleware.CatalogSnapshotMiddleware` serves the files.
+
+Commits do not render anything: `schedule_refresh` only appends the change
+to a dirty journal, and `refresh_dirty` (`manage.py build_catalog_snapshots
+--watch`, every `REFRESH_INTERVAL` seconds) applies everything queued in one
+`refresh`. Snapshots may lag the database by that long.
+
+Snapshots are plain files on local disk, so every host builds its own, and
+`refresh` only maintains snapshots that `build` created.
+"""
+import fcntl
+import gzip
+import json
+import logging
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.http import HttpRequest, QueryDict
+
+from store.models import Collection, Product
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+ALL = 'all'
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+
+def get_setting(name, default):
+    return getattr(settings, 'CATALOG_SNAPSHOTS', {}).get(name, default)
+
+
+def enabled():
+    return get_setting('ENABLED', False)
+
+
+def get_directory():
+    return Path(get_setting('DIRECTORY', settings.BASE_DIR / '.cache' / 'catalog'))
+
+
+def get_page_size():
+    return get_setting('PAGE_SIZE', 50)
+
+
+def collections_path(encoding):
+    return get_directory() / f'collections.json.{encoding}'
+
+
+def page_path(listing, page, encoding):
+    return get_directory() / 'products' / listing / f'{page}.json.{encoding}'
+
+
+def _listings():
+    """Product ids of every listing, in the order the product list returns them."""
+    listings = {ALL: []}
+    listings.update((str(collection_id), []) for collection_id in Collection.objects.values_list('id', flat=True))
+    for product_id, collection_id in Product.objects.order_by('title', 'id').values_list('id', 'collection_id'):
+        listings[ALL].append(product_id)
+        listings[str(collection_id)].append(product_id)
+    return listings
+
+
+def _pages(product_ids, page_size):
+    # An empty listing still has a first page, as the live list does.
+    return [product_ids[start:start + page_size] for start in range(0, len(product_ids), page_size)] or [[]]
+
+
+def _render(path, params):
+    from store.views import CollectionViewset, ProductViewset
+    viewset = CollectionViewset if path == '/store/collections/' else ProductViewset
+    request = HttpRequest()
+    request.method = 'GET'
+    request.path = request.path_info = path
+    request.META = {'HTTP_ACCEPT': 'application/json', 'QUERY_STRING': urlencode(params),
+                    'SERVER_NAME': 'localhost', 'SERVER_PORT': '80'}
+    request.GET = QueryDict(request.META['QUERY_STRING'])
+    request.user = AnonymousUser()
+    response = viewset.as_view({'get': 'list'}, throttle_classes=[])(request)
+    response.render()
+    if response.status_code != 200:
+        raise RuntimeError(f'{request.get_full_path()} returned {response.status_code}')
+    return response.content
+
+
+def _write(path, body):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    for encoding in ENCODINGS:
+        if encoding == 'br':
+            data = brotli.compress(body, quality=get_setting('BROTLI_QUALITY', 11))
+        else:
+            data = gzip.compress(body, compresslevel=get_setting('GZIP_LEVEL', 9), mtime=0)
+        _replace(path.with_name(f'{path.name}.{encoding}'), data)
+
+
+def _replace(path, data):
+    # Readers see either the old file or the new one, never a partial write.
+    fd, temporary = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as file:
+        file.write(data)
+    os.replace(temporary, path)
+
+
+def _write_collections():
+    _write(get_directory() / 'collections.json', _render('/store/collections/', {}))
+
+
+def _write_page(listing, page, page_size):
+    params = {'page_size': page_size}
+    if page > 1:
+        params['page'] = page
+    if listing != ALL:
+        params['collection'] = listing
+    _write(get_directory() / 'products' / listing / f'{page}.json', _render('/store/products/', params))
+
+
+def _remove_pages(listing, first_page):
+    directory = get_directory() / 'products' / listing
+    if not directory.is_dir():
+        return
+    for path in directory.glob('*.json.*'):
+        if int(path.name.split('.')[0]) >= first_page:
+            path.unlink(missing_ok=True)
+    if listing != ALL and not any(directory.iterdir()):
+        directory.rmdir()
+
+
+@contextmanager
+def _locked():
+    directory = get_directory()
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+@contextmanager
+def _dirty_journal():
+    # Held only to append or take the queued changes, never while rendering.
+    with open(get_directory() / 'dirty.jsonl', 'a+') as journal:
+        fcntl.flock(journal, fcntl.LOCK_EX)
+        try:
+            yield journal
+        finally:
+            fcntl.flock(journal, fcntl.LOCK_UN)
+
+
+def _take_dirty():
+    with _dirty_journal() as journal:
+        journal.seek(0)
+        lines = journal.read().splitlines()
+        journal.truncate(0)
+    changes = {'product_ids': set(), 'collection_ids': set(), 'reorder': False}
+    for line in lines:
+        change = json.loads(line)
+        changes['product_ids'].update(change['product_ids'])
+        changes['collection_ids'].update(change['collection_ids'])
+        changes['reorder'] = changes['reorder'] or change['reorder']
+    return changes if lines else None
+
+
+def _read_manifest():
+    try:
+        with open(get_directory() / 'manifest.json') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(page_size, listings):
+    _replace(get_directory() / 'manifest.json', json.dumps({'page_size': page_size, 'listings': listings}).encode())
+
+
+def build():
+    """Render every snapshot from scratch. Returns the number of pages written."""
+    page_size = get_page_size()
+    with _locked():
+        # Everything queued so far is rendered below.
+        _take_dirty()
+        listings = _listings()
+        old = _read_manifest()
+        for listing in set(old['listings'] if old else ()) - set(listings):
+            _remove_pages(listing, 1)
+        _write_collections()
+        written = 1
+        for listing, product_ids in listings.items():
+            pages = _pages(product_ids, page_size)
+            for page in range(1, len(pages) + 1):
+                _write_page(listing, page, page_size)
+            _remove_pages(listing, len(pages) + 1)
+            written += len(pages)
+        _write_manifest(page_size, listings)
+    return written
+
+
+def refresh(product_ids=(), collection_ids=(), reorder=False):
+    """
+    Re-render the snapshots affected by changes to `product_ids` and
+    `collection_ids`. `reorder` says products or collections were added,
+    removed, retitled or moved between collections, which may shift or
+    resize listings. Returns the number of pages written.
+    """
+    page_size = get_page_size()
+    with _locked():
+        manifest = _read_manifest()
+        if manifest is None or manifest['page_size'] != page_size:
+            return 0
+        old = manifest['listings']
+        product_ids = set(product_ids)
+        for collection_id in collection_ids:
+            # The collection's title is embedded in each of its products.
+            product_ids.update(old.get(str(collection_id), ()))
+        new = _listings() if reorder else old
+
+        written = 0
+        if reorder or collection_ids:
+            _write_collections()
+            written += 1
+        for listing in set(old) - set(new):
+            _remove_pages(listing, 1)
+        for listing, ids in new.items():
+            pages, old_pages = _pages(ids, page_size), _pages(old.get(listing, []), page_size)
+            resized = listing not in old or len(ids) != len(old[listing])
+            for page, page_ids in enumerate(pages, 1):
+                if resized or page_ids != old_pages[page - 1] or not product_ids.isdisjoint(page_ids):
+                    _write_page(listing, page, page_size)
+                    written += 1
+            if len(pages) < len(old_pages):
+                _remove_pages(listing, len(pages) + 1)
+        if reorder:
+            _write_manifest(page_size, new)
+    return written
+
+
+def clear():
+    """Remove every snapshot, so requests fall back to the live views."""
+    with _locked():
+        (get_directory() / 'manifest.json').unlink(missing_ok=True)
+        for encoding in ('br', 'gzip'):
+            collections_path(encoding).unlink(missing_ok=True)
+        shutil.rmtree(get_directory() / 'products', ignore_errors=True)
+
+
+def mark_dirty(product_ids=(), collection_ids=(), reorder=False):
+    """Queue a change for `refresh_dirty`, unless there are no snapshots to maintain."""
+    if not (get_directory() / 'manifest.json').exists():
+        return
+    change = {'product_ids': list(product_ids), 'collection_ids': list(collection_ids), 'reorder': reorder}
+    with _dirty_journal() as journal:
+        journal.write(json.dumps(change) + '\n')
+
+
+def refresh_dirty():
+    """
+    Apply every queued change in one `refresh`. Returns the number of pages
+    written. A failed refresh clears the snapshots rather than leave stale
+    ones served; `build` restores them.
+    """
+    changes = _take_dirty() if get_directory().is_dir() else None
+    if changes is None:
+        return 0
+    try:
+        return refresh(**changes)
+    except Exception:
+        logger.exception('Catalog snapshot refresh failed for %s', changes)
+        clear()
+        return 0
+
+
+def schedule_refresh(**changes):
+    """Queue the change for `refresh_dirty` once the current transaction commits."""
+    transaction.on_commit(lambda: mark_dirty(**changes))
@@ -0,0 +1,154 @@
+"""
+Warehouse stock feeds: streams of `{"product_id": 1, "delta": -3}` records
+(one JSON object or `product_id,delta` pair per line) applied as relative
+stock updates.
+
+Records are applied in chunks. Each chunk locks its products, accepts
+records in order while the running stock stays at or above zero, and writes
+the accepted deltas in one UPDATE. The UPDATE also clamps at zero, so a
+concurrent checkout can never push stock negative. Progress is committed
+with each chunk in a `StockFeedBatch`, so re-sending a feed under the same
+batch ID applies nothing twice and resumes an interrupted run.
+"""
+import json
+import time
+from collections import Counter
+
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from store.models import Product, StockFeedBatch
+from store.signals import stock_changed
+
+CHUNK_SIZE = 1000
+MAX_REJECTIONS = 1000
+
+REASON_INVALID = 'invalid_record'
+REASON_UNKNOWN_PRODUCT = 'unknown_product'
+REASON_INSUFFICIENT_STOCK = 'insufficient_stock'
+
+
+def _whole_number(value):
+    # int() would truncate 2.5 and accept true/false from JSON.
+    if isinstance(value, bool) or isinstance(value, float) and not value.is_integer():
+        raise ValueError(value)
+    return int(value)
+
+
+def parse_record(line):
+    """`(product_id, delta)` from one feed line, or None if it is malformed."""
+    try:
+        if isinstance(line, bytes):
+            line = line.decode()
+        line = line.strip()
+        if line.startswith('{'):
+            record = json.loads(line)
+            product_id, delta = record['product_id'], record['delta']
+        else:
+            product_id, delta = line.split(',')
+        product_id, delta = _whole_number(product_id), _whole_number(delta)
+    except (ValueError, KeyError, TypeError):
+        return None
+    return product_id, delta
+
+
+def _chunks(lines, chunk_size):
+    chunk = []
+    for line in lines:
+        if not line.strip():
+            continue
+        chunk.append(parse_record(line))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def apply_feed(batch_id, lines, chunk_size=CHUNK_SIZE):
+    """
+    Apply the feed records in `lines` under `batch_id` and return a report.
+    Records already processed for this batch ID are skipped.
+    """
+    start = time.perf_counter()
+    batch, _ = StockFeedBatch.objects.get_or_create(batch_id=batch_id)
+    duplicate = batch.completed_at is not None
+    position = processed = 0
+    if not duplicate:
+        for chunk in _chunks(lines, chunk_size):
+            processed += _apply_chunk(batch.id, position, chunk)
+            position += len(chunk)
+        batch = StockFeedBatch.objects.get(id=batch.id)
+        if batch.completed_at is None:
+            batch.completed_at = timezone.now()
+            batch.save(update_fields=['completed_at'])
+    elapsed = time.perf_counter() - start
+    return {
+        'batch_id': batch.batch_id,
+        'duplicate': duplicate,
+        'records': batch.records,
+        'applied': batch.applied,
+        'rejected': batch.rejected,
+        'rejections': batch.rejections,
+        'processed_now': processed,
+        'elapsed_ms': round(elapsed * 1000, 3),
+        'records_per_second': round(processed / elapsed, 1) if elapsed else None,
+    }
+
+
+def _apply_chunk(batch_id, position, chunk):
+    with transaction.atomic():
+        # Writing first takes the write lock on SQLite too, where
+        # select_for_update does nothing, so the stock read below is the
+        # stock the UPDATE starts from.
+        StockFeedBatch.objects.filter(id=batch_id).update(records=F('records'))
+        batch = StockFeedBatch.objects.select_for_update().get(id=batch_id)
+        # Skip what an earlier or concurrent run of this batch already applied.
+        chunk = list(enumerate(chunk, position + 1))[max(batch.records - position, 0):]
+        if not chunk:
+            return 0
+        product_ids = sorted({record[0] for (_, record) in chunk if record})
+        stocks = dict(Product.objects.select_for_update().filter(id__in=product_ids)
+                      .order_by('id').values_list('id', 'stock'))
+        before = dict(stocks)
+
+        deltas, rejections = Counter(), []
+        for number, record in chunk:
+            reason = None
+            if record is None:
+                reason = REASON_INVALID
+            elif record[0] not in stocks:
+                reason = REASON_UNKNOWN_PRODUCT
+            elif stocks[record[0]] + record[1] < 0:
+                reason = REASON_INSUFFICIENT_STOCK
+            if reason:
+                product_id, delta = record or (None, None)
+                rejections.append({'record': number, 'product_id': product_id, 'delta': delta, 'reason': reason})
+                continue
+            product_id, delta = record
+            stocks[product_id] += delta
+            deltas[product_id] += delta
+
+        deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+        if deltas:
+            Product.objects.filter(id__in=list(deltas)).update(
+                stock=Greatest(F('stock') + Case(
+                    *[When(id=product_id, then=Value(delta)) for product_id, delta in deltas.items()],
+                    output_field=models.IntegerField(),
+                ), 0),
+                update_at=timezone.now(),
+            )
+            # Announce what the UPDATE applied after the clamp, not what was requested.
+            after = Product.objects.filter(id__in=list(deltas)).values_list('id', 'stock')
+            stock_changed.send(sender=Product, changes={
+                product_id: stock - before[product_id] for product_id, stock in after if stock != before[product_id]
+            })
+
+        batch.records += len(chunk)
+        batch.applied += len(chunk) - len(rejections)
+        batch.rejected += len(rejections)
+        batch.rejections = (batch.rejections + rejections)[:MAX_REJECTIONS]
+        batch.save(update_fields=['records', 'applied', 'rejected', 'rejections'])
+    return len(chunk)
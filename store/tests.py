@@ -1,3 +1,843 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+import gzip
+import json
+import os
+import tempfile
+from itertools import count
+import time
+from threading import Barrier, Event, Thread, get_ident
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import User
+from core.testing import QueryCountTestCase
+from store import (archive, cart_cache, cart_writer, facets, membership, orders,
+                   recommendations, snapshots, stock_feed, throttling)
+from store.pagination import EstimatedCountPaginator, estimate_row_count
+from store.serializers import BulkOrderTransitionSerializer
+from store.signals import stock_changed
+from store.models import (Address, ArchivedOrder, ArchivedOrderItem, Cart,
+                          CartItem, Collection, Customer, Order, OrderItem,
+                          Product, ProductCooccurrence, ProductFacetCount)
+
+sequence = count(1)
+
+
+def create_user(**kwargs):
+    number = next(sequence)
+    return User.objects.create_user(f'user{number}', f'user{number}@example.com', 'password',
+                                    first_name=f'First{number}', last_name=f'Last{number}', **kwargs)
+
+
+def create_products(count, collection=None):
+    collection = collection or Collection.objects.create(title=f'Collection {next(sequence)}')
+    return [
+        Product.objects.create(title=f'Product {next(sequence)}', collection=collection, unit_price=Decimal('10.00'),
+                               old_unit_price=Decimal('12.00'), stock=100, description='')
+        for _ in range(count)
+    ]
+
+
+def create_order(customer, items):
+    order = Order.objects.create(customer=customer)
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=product, title=product.title, unit_price=product.unit_price, quantity=2)
+        for product in create_products(items)
+    ])
+    return order
+
+
+def create_archived_order(customer, items, created_at=None):
+    # Archived rows keep the ids they had, so pick ones clear of the live tables.
+    order = ArchivedOrder.objects.create(id=10 ** 6 + next(sequence), customer=customer,
+                                         created_at=created_at or timezone.now(), update_at=timezone.now(),
+                                         status=Order.STATUS_CONFIRM)
+    ArchivedOrderItem.objects.bulk_create([
+        ArchivedOrderItem(id=10 ** 6 + next(sequence), order=order, product_id=product.id, title=product.title,
+                          unit_price=product.unit_price, quantity=2)
+        for product in create_products(items)
+    ])
+    return order
+
+
+class StoreQueryCountTests(QueryCountTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        cls.customer = Customer.objects.get(user=cls.user)
+        cls.staff = create_user(is_staff=True, is_superuser=True)
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.staff_api = APIClient()
+        self.staff_api.force_authenticate(self.staff)
+
+    def customers(self, count):
+        return [Customer.objects.get(user=create_user()) for _ in range(count)]
+
+    def test_collection_list(self):
+        self.assertQueriesConstant(
+            lambda count: [create_products(2) for _ in range(count)],
+            lambda: self.api.get('/store/collections/'),
+        )
+
+    def test_product_list(self):
+        self.assertQueriesConstant(
+            lambda count: [create_products(1) for _ in range(count)],
+            lambda: self.api.get('/store/products/'),
+        )
+
+    def test_product_list_page(self):
+        self.assertQueriesConstant(
+            lambda count: [create_products(1) for _ in range(count)],
+            lambda: self.api.get('/store/products/?page_size=10&stock=h'),
+        )
+
+    def test_product_facets(self):
+        self.assertQueriesConstant(
+            lambda count: [create_products(1) for _ in range(count)],
+            lambda: self.api.get('/store/products/facets/'),
+        )
+
+    def test_product_changes(self):
+        self.assertQueriesConstant(
+            lambda count: [product.delete() for product in create_products(count)],
+            lambda: self.api.get('/store/products/changes/'),
+        )
+
+    def test_customer_list(self):
+        self.assertQueriesConstant(self.customers, lambda: self.staff_api.get('/store/customers/'))
+
+    def addresses(self, count, customer=None):
+        return [
+            Address.objects.create(customer=customer or self.customer, label=f'Address {index}', street='1 Main St',
+                                   city='Dhaka', state='Dhaka', country=Address.COUTNRY_BD)
+            for index in range(count)
+        ]
+
+    def test_address_list(self):
+        self.assertQueriesConstant(self.addresses, lambda: self.api.get('/store/addresses/'))
+
+    def test_address_list_staff(self):
+        self.assertQueriesConstant(
+            lambda count: [self.addresses(1, customer) for customer in self.customers(count)],
+            lambda: self.staff_api.get('/store/addresses/'),
+        )
+
+    def test_order_list(self):
+        self.assertQueriesConstant(
+            lambda count: [create_order(customer, 2) for customer in self.customers(count)],
+            lambda: self.staff_api.get('/store/orders/'),
+        )
+
+    def test_order_retrieve(self):
+        orders = []
+        self.assertQueriesConstant(
+            lambda count: orders.append(create_order(self.customer, count)),
+            lambda: self.api.get(f'/store/orders/{orders[-1].id}/'),
+        )
+
+    def test_order_history(self):
+        def seed(count):
+            for _ in range(count):
+                create_order(self.customer, 2)
+                create_archived_order(self.customer, 2, created_at=timezone.now() - timedelta(days=800))
+        self.assertQueriesConstant(seed, lambda: self.api.get('/store/orders/history/'))
+
+    def test_archived_order_list(self):
+        self.assertQueriesConstant(
+            lambda count: [create_archived_order(customer, 2) for customer in self.customers(count)],
+            lambda: self.staff_api.get('/store/archived-orders/'),
+        )
+
+    def test_order_create(self):
+        def seed(count):
+            cart = Cart.objects.get(customer=self.customer)
+            CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=1)
+                                          for product in create_products(count)])
+        self.assertQueriesConstant(seed, lambda: self.api.post('/store/orders/', {}))
+
+    def test_order_bulk_transition(self):
+        orders = []
+        self.assertQueriesConstant(
+            lambda count: orders.__setitem__(slice(None), [create_order(self.customer, 1) for _ in range(count)]),
+            lambda: self.staff_api.post('/store/orders/bulk_transition/',
+                                        {'status': Order.STATUS_FAILED, 'ids': [order.id for order in orders]},
+                                        format='json'),
+        )
+
+    def test_cart_retrieve(self):
+        carts = []
+        def seed(count):
+            cart = Cart.objects.create()
+            CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=1)
+                                          for product in create_products(count)])
+            carts.append(cart)
+        self.assertQueriesConstant(seed, lambda: self.api.get(f'/store/carts/{carts[-1].id}/'))
+
+    def test_cart_item_list(self):
+        carts = []
+        def seed(count):
+            cart = Cart.objects.create()
+            CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=1)
+                                          for product in create_products(count)])
+            carts.append(cart)
+        self.assertQueriesConstant(seed, lambda: self.api.get(f'/store/carts/{carts[-1].id}/items/'))
+
+    def test_cart_merge(self):
+        carts = []
+        def seed(count):
+            products = create_products(count * 2)
+            cart = Cart.objects.get(customer=self.customer)
+            # Half of the anonymous items are already in the user's cart.
+            CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=1)
+                                          for product in products[:count]])
+            anonymous = Cart.objects.create()
+            CartItem.objects.bulk_create([CartItem(cart=anonymous, product=product, quantity=1)
+                                          for product in products])
+            carts.append(anonymous)
+        self.assertQueriesConstant(seed, lambda: self.api.post(f'/store/carts/{carts[-1].id}/merge_carts/'))
+
+
+class StoreAdminQueryCountTests(QueryCountTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = create_user(is_staff=True, is_superuser=True)
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def customers(self, count):
+        return [Customer.objects.get(user=create_user()) for _ in range(count)]
+
+    def test_customer_changelist(self):
+        self.assertQueriesConstant(self.customers, lambda: self.client.get('/admin/store/customer/'))
+
+    def test_collection_changelist(self):
+        self.assertQueriesConstant(
+            lambda count: [create_products(2) for _ in range(count)],
+            lambda: self.client.get('/admin/store/collection/'),
+        )
+
+    def test_product_changelist(self):
+        self.assertQueriesConstant(create_products, lambda: self.client.get('/admin/store/product/'))
+
+    def test_cart_changelist(self):
+        self.assertQueriesConstant(
+            lambda count: [Cart.objects.create() for _ in range(count)] + self.customers(count),
+            lambda: self.client.get('/admin/store/cart/'),
+        )
+
+    def test_order_changelist(self):
+        self.assertQueriesConstant(
+            lambda count: [create_order(customer, 1) for customer in self.customers(count)],
+            lambda: self.client.get('/admin/store/order/'),
+        )
+
+    def test_archived_order_changelist(self):
+        self.assertQueriesConstant(
+            lambda count: [create_archived_order(customer, 1) for customer in self.customers(count)],
+            lambda: self.client.get('/admin/store/archivedorder/'),
+        )
+
+    def test_address_changelist(self):
+        self.assertQueriesConstant(
+            lambda count: Address.objects.bulk_create([
+                Address(customer=customer, label='Home', street='1 Main St', city='Dhaka', state='Dhaka',
+                        country=Address.COUTNRY_BD)
+                for customer in self.customers(count)
+            ]),
+            lambda: self.client.get('/admin/store/address/'),
+        )
+
+
+class AddressCacheTests(QueryCountTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        cls.customer = Customer.objects.get(user=cls.user)
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.address = Address.objects.create(customer=self.customer, label='Home', street='1 Main St',
+                                              city='Dhaka', state='Dhaka')
+
+    def labels(self):
+        return [address['label'] for address in self.api.get('/store/addresses/').data]
+
+    def test_list_is_served_from_the_cache(self):
+        self.assertEqual(self.labels(), ['Home'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.labels(), ['Home'])
+
+    def test_create_needs_no_customer_lookup(self):
+        self.labels()
+        with self.assertNumQueries(2):
+            response = self.api.post('/store/addresses/', {'label': 'Work', 'street': '2 Side St', 'city': 'Dhaka',
+                                                           'state': 'Dhaka'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['customer'], str(self.customer))
+        self.assertEqual(self.labels(), ['Home', 'Work'])
+
+    def test_writes_invalidate_the_list(self):
+        self.labels()
+        self.api.patch(f'/store/addresses/{self.address.id}/', {'label': 'Office'})
+        self.assertEqual(self.labels(), ['Office'])
+        self.api.delete(f'/store/addresses/{self.address.id}/')
+        self.assertEqual(self.labels(), [])
+
+    def test_moving_an_address_invalidates_both_lists(self):
+        other_user = create_user()
+        other = APIClient()
+        other.force_authenticate(other_user)
+        self.assertEqual((self.labels(), other.get('/store/addresses/').data), (['Home'], []))
+
+        address = Address.objects.get(id=self.address.id)
+        address.customer = Customer.objects.get(user=other_user)
+        address.save()
+        self.assertEqual((self.labels(), len(other.get('/store/addresses/').data)), ([], 1))
+
+        # Built without loading the row, so the old owner is read before saving.
+        Address(id=self.address.id, customer=self.customer, label='Home', street='1 Main St', city='Dhaka',
+                state='Dhaka').save()
+        self.assertEqual((self.labels(), other.get('/store/addresses/').data), (['Home'], []))
+
+    def test_renaming_the_user_invalidates_the_list(self):
+        self.labels()
+        self.user.first_name = 'Renamed'
+        self.user.save()
+        self.assertEqual(self.api.get('/store/addresses/').data[0]['customer'], f'Renamed {self.user.last_name}')
+
+
+class SparseFieldsetTests(QueryCountTestCase):
+    def setUp(self):
+        self.products = create_products(2)
+
+    def test_fields_and_exclude_trim_the_payload_and_the_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/store/products/', {'fields': 'id,title'})
+        self.assertEqual([set(product) for product in response.json()], [{'id', 'title'}] * 2)
+        sql = queries.captured_queries[-1]['sql']
+        self.assertIn('"store_product"."title"', sql)
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn('"store_collection"', sql)
+        response = self.client.get('/store/products/', {'exclude': 'description,collection'})
+        self.assertEqual(set(response.json()[0]), {'id', 'title', 'unit_price', 'old_unit_price', 'stock'})
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get('/store/products/', {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/store/products/', {'exclude': 'secret'}).status_code, 400)
+
+    def test_cached_carts_are_trimmed(self):
+        cart = Cart.objects.create()
+        CartItem.objects.create(cart=cart, product=self.products[0], quantity=2)
+        path = f'/store/carts/{cart.id}/'
+        # A sparse miss is not cached, since the snapshot must hold every field.
+        self.assertEqual(set(self.client.get(path, {'fields': 'id'}).json()), {'id'})
+        self.assertIsNone(cart_cache.get_cart_data(cart.id))
+        self.client.get(path)
+        with self.assertNumQueries(0):
+            response = self.client.get(path, {'fields': 'id,total_price'})
+        self.assertEqual(response.json(), {'id': str(cart.id), 'total_price': 20.0})
+
+
+@override_settings(CART_WRITES={'GROUP_COMMIT': True, 'WINDOW': 0, 'MAX_BATCH': 256, 'TIMEOUT': 10.0},
+                   CACHES={**settings.CACHES, 'carts': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CartWriterTests(TransactionTestCase):
+    def setUp(self):
+        self.cart = Cart.objects.create()
+        self.products = create_products(3)
+        self.api = APIClient()
+        self.path = f'/store/carts/{self.cart.id}/items/'
+
+    def tearDown(self):
+        cart_writer.writer.stop()
+
+    def quantities(self):
+        return dict(CartItem.objects.filter(cart=self.cart).values_list('product_id','quantity'))
+
+    def test_item_writes_go_through_the_writer(self):
+        writes = cart_writer.writer.writes
+        response = self.api.post(self.path, {'product_id': self.products[0].id, 'quantity': 2})
+        self.assertEqual(response.data['quantity'], 2)
+        self.api.post(self.path, {'product_id': self.products[0].id, 'quantity': 3})
+        item_id = CartItem.objects.get(cart=self.cart).id
+        self.assertEqual(self.api.patch(f'{self.path}{item_id}/', {'quantity': 1}).data['quantity'], 1)
+        self.assertEqual(self.api.delete(f'{self.path}{item_id}/').status_code, 204)
+        self.assertEqual(self.quantities(), {})
+        self.assertEqual(cart_writer.writer.writes - writes, 4)
+
+    def test_concurrent_writes_share_a_batch_and_fail_alone(self):
+        outcomes, busy, release = {}, Event(), Event()
+        submitted = Barrier(len(self.products) + 1)
+
+        def add(product):
+            submitted.wait()
+            outcomes[product.id] = cart_writer.write(
+                lambda: (CartItem.objects.create(cart=self.cart, product=product, quantity=1), get_ident())[1])
+
+        def fail():
+            def write():
+                CartItem.objects.filter(cart=self.cart).delete()
+                raise ValueError('rejected')
+            submitted.wait()
+            try:
+                cart_writer.write(write)
+            except ValueError as error:
+                outcomes['failed'] = error
+
+        # Hold the writer on a batch of its own until every write is queued behind it.
+        blocker = Thread(target=cart_writer.write, args=(lambda: busy.set() or release.wait(10),))
+        blocker.start()
+        self.assertTrue(busy.wait(10))
+        batches = cart_writer.writer.batches
+        threads = [Thread(target=add, args=(product,)) for product in self.products] + [Thread(target=fail)]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 10
+        while cart_writer.writer._queue.qsize() < len(threads) and time.monotonic() < deadline:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads + [blocker]:
+            thread.join()
+        self.assertEqual(self.quantities(), {product.id: 1 for product in self.products})
+        self.assertIsInstance(outcomes['failed'], ValueError)
+        self.assertEqual(len({outcomes[product.id] for product in self.products}), 1)
+        # The blocker's batch, then one for the four queued writes.
+        self.assertEqual(cart_writer.writer.batches - batches, 2)
+
+
+class TokenBucketTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = f'{directory.name}/throttle.buckets'
+        self.store = throttling.TokenBucketStore(self.path, 64)
+
+    def test_a_full_bucket_allows_its_capacity_then_refills(self):
+        self.assertEqual([self.store.consume('key', 3, 1, now=100)[0] for _ in range(4)], [True, True, True, False])
+        self.assertEqual(self.store.consume('key', 3, 1, now=100), (False, 1))
+        self.assertEqual(self.store.consume('key', 3, 1, now=100.5)[0], False)
+        self.assertEqual(self.store.consume('key', 3, 1, now=101)[0], True)
+        self.assertEqual(self.store.consume('other', 3, 1, now=101)[0], True)
+
+    def test_stores_on_the_same_file_share_buckets(self):
+        other = throttling.TokenBucketStore(self.path, 64)
+        self.assertTrue(self.store.consume('key', 1, 0.1, now=100)[0])
+        self.assertEqual(other.consume('key', 1, 0.1, now=100), (False, 10))
+
+    def test_full_windows_evict_the_least_recently_used(self):
+        store = throttling.TokenBucketStore(f'{self.path}.small', throttling.PROBES)
+        for index in range(throttling.PROBES):
+            store.consume(f'key{index}', 1, 0.001, now=100 + index)
+        self.assertTrue(store.consume('new', 1, 0.001, now=200)[0])
+        # key0 was evicted, so it starts again from a full bucket.
+        self.assertTrue(store.consume('key0', 1, 0.001, now=201)[0])
+        self.assertFalse(store.consume('new', 1, 0.001, now=202)[0])
+
+    def test_cart_creation_is_throttled_per_client(self):
+        with mock.patch.multiple(throttling, _store=self.store, _store_pid=os.getpid()):
+            statuses = [self.client.post('/store/carts/').status_code for _ in range(21)]
+            response = self.client.post('/store/carts/', REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(statuses, [201] * 20 + [429])
+        self.assertEqual(response.status_code, 201)
+
+    def test_parse_rate(self):
+        self.assertEqual(throttling.parse_rate('20/min'), (20, 20 / 60))
+        self.assertEqual(throttling.parse_rate('5/s'), (5, 5))
+
+
+class OrderTransitionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.get(user=create_user())
+        cls.staff = create_user(is_staff=True, is_superuser=True)
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.staff)
+
+    def stock(self, order):
+        return sorted(order.items.values_list('product__stock', flat=True))
+
+    def test_failing_restores_stock_once(self):
+        order = create_order(self.customer, 2)
+        outcomes = orders.transition_orders(Order.objects.filter(id=order.id), Order.STATUS_FAILED)
+        self.assertEqual(outcomes, {order.id: (orders.OUTCOME_UPDATED, Order.STATUS_FAILED)})
+        self.assertEqual(self.stock(order), [102, 102])
+        outcomes = orders.transition_orders(Order.objects.filter(id=order.id), Order.STATUS_FAILED)
+        self.assertEqual(outcomes, {order.id: (orders.OUTCOME_INVALID, Order.STATUS_FAILED)})
+        self.assertEqual(self.stock(order), [102, 102])
+
+    def test_orders_moved_concurrently_are_not_restored_again(self):
+        moved, kept = create_order(self.customer, 1), create_order(self.customer, 1)
+        raced = []
+
+        def concurrent_confirm(execute, sql, params, many, context):
+            # Another call confirms `moved` between the read and the UPDATE.
+            if sql.startswith('UPDATE "store_order"') and not raced:
+                raced.append(execute('UPDATE "store_order" SET "status" = %s WHERE "id" = %s',
+                                     [Order.STATUS_CONFIRM, moved.id], False, context))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(concurrent_confirm):
+            outcomes = orders.transition_orders(Order.objects.filter(id__in=[moved.id, kept.id]), Order.STATUS_FAILED)
+        self.assertEqual(outcomes, {
+            moved.id: (orders.OUTCOME_INVALID, Order.STATUS_CONFIRM),
+            kept.id: (orders.OUTCOME_UPDATED, Order.STATUS_FAILED),
+        })
+        self.assertEqual(self.stock(moved), [100])
+        self.assertEqual(self.stock(kept), [102])
+
+    def test_bulk_transition_by_ids(self):
+        order = create_order(self.customer, 1)
+        response = self.api.post('/store/orders/bulk_transition/',
+                                 {'status': Order.STATUS_CONFIRM, 'ids': [order.id, 10 ** 9]}, format='json')
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual([result['outcome'] for result in response.data['results']],
+                         [orders.OUTCOME_UPDATED, orders.OUTCOME_NOT_FOUND])
+
+    def test_bulk_transition_filter_needs_a_condition(self):
+        order = create_order(self.customer, 1)
+        response = self.api.post('/store/orders/bulk_transition/',
+                                 {'status': Order.STATUS_FAILED, 'filter': {}}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.get(id=order.id).status, Order.STATUS_PENDING)
+
+    def test_bulk_transition_filter_is_capped(self):
+        for _ in range(3):
+            create_order(self.customer, 1)
+        request = {'status': Order.STATUS_FAILED, 'filter': {'customer': self.customer.id}}
+        with mock.patch.object(BulkOrderTransitionSerializer, 'MAX_FILTERED_ORDERS', 2):
+            self.assertEqual(self.api.post('/store/orders/bulk_transition/', request, format='json').status_code, 400)
+        self.assertFalse(Order.objects.exclude(status=Order.STATUS_PENDING).exists())
+        response = self.api.post('/store/orders/bulk_transition/', request, format='json')
+        self.assertEqual(response.data['updated'], 3)
+
+
+class CatalogSnapshotTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(CATALOG_SNAPSHOTS={'ENABLED': True, 'DIRECTORY': directory.name, 'PAGE_SIZE': 2})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.products = create_products(3)
+        for product, title in zip(self.products, ['B', 'C', 'D']):
+            product.title = title
+            product.save()
+        snapshots.build()
+
+    def titles(self, page):
+        with open(snapshots.page_path(snapshots.ALL, page, 'gzip'), 'rb') as file:
+            return [product['title'] for product in json.loads(gzip.decompress(file.read()))['results']]
+
+    def test_commits_only_queue_changes(self):
+        product = self.products[0]
+        with self.captureOnCommitCallbacks(execute=True), mock.patch.object(snapshots, '_render') as render:
+            product.unit_price = Decimal('20.00')
+            product.save()
+        render.assert_not_called()
+        # Its page in the full list and in its collection's.
+        self.assertEqual(snapshots.refresh_dirty(), 2)
+        self.assertEqual(snapshots.refresh_dirty(), 0)
+
+    def test_refresh_applies_queued_reorders(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[2].title = 'A first'
+            self.products[2].save()
+        self.assertEqual(self.titles(1), [product.title for product in self.products[:2]])
+        snapshots.refresh_dirty()
+        self.assertEqual(self.titles(1), ['A first', self.products[0].title])
+        self.assertEqual(self.titles(2), [self.products[1].title])
+
+
+@override_settings(MEMBERSHIP={'WINDOW_DAYS': 30, 'SILVER_SPEND': 30, 'GOLD_SPEND': 100})
+class MembershipTests(TestCase):
+    def customer(self, *order_sizes, age=timedelta(0)):
+        customer = Customer.objects.get(user=create_user())
+        for items in order_sizes:
+            order = create_order(customer, items)
+            # Each item is 2 x 10.00.
+            Order.objects.filter(id=order.id).update(status=Order.STATUS_CONFIRM, created_at=timezone.now() - age)
+        return customer
+
+    def tiers(self, *customers):
+        return [Customer.objects.get(id=customer.id).membership for customer in customers]
+
+    def test_new_customers_start_on_the_zero_spend_tier(self):
+        customer = self.customer()
+        self.assertEqual(customer.membership, membership.tier_for_spend(Decimal(0)))
+        self.assertEqual(membership.recalculate().changed, 0)
+
+    def test_tiers_follow_confirmed_spend_in_the_window(self):
+        silver, gold, expired = self.customer(2), self.customer(3, 2), self.customer(5, age=timedelta(days=31))
+        pending = self.customer()
+        create_order(pending, 5)
+        run = membership.recalculate()
+        self.assertEqual(run.changed, 2)
+        self.assertEqual(self.tiers(silver, gold, expired, pending), [
+            Customer.MEMBERSHIP_SILVER, Customer.MEMBERSHIP_GOLD, Customer.MEMBERSHIP_BRONZE, Customer.MEMBERSHIP_BRONZE,
+        ])
+
+    def test_incremental_run_visits_changed_customers(self):
+        unchanged = self.customer(2)
+        membership.recalculate()
+        customer = self.customer(5)
+        run = membership.recalculate(incremental=True)
+        self.assertTrue(run.incremental)
+        self.assertEqual((run.customers, run.changed), (1, 1))
+        self.assertEqual(self.tiers(unchanged, customer), [Customer.MEMBERSHIP_SILVER, Customer.MEMBERSHIP_GOLD])
+
+    def test_tiers_set_by_staff_are_kept(self):
+        customer = self.customer()
+        Customer.objects.filter(id=customer.id).update(membership=Customer.MEMBERSHIP_GOLD, membership_locked=True)
+        membership.recalculate()
+        self.assertEqual(self.tiers(customer), [Customer.MEMBERSHIP_GOLD])
+
+    def test_admin_edits_lock_the_tier(self):
+        staff = create_user(is_staff=True, is_superuser=True)
+        customer = self.customer()
+        self.client.force_login(staff)
+        response = self.client.post('/admin/store/customer/', {
+            'form-TOTAL_FORMS': 1, 'form-INITIAL_FORMS': 1, 'form-0-id': customer.id,
+            'form-0-membership': Customer.MEMBERSHIP_GOLD, '_save': 'Save',
+        })
+        self.assertEqual(response.status_code, 302)
+        customer.refresh_from_db()
+        self.assertEqual((customer.membership, customer.membership_locked), (Customer.MEMBERSHIP_GOLD, True))
+
+
+class CooccurrenceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.get(user=create_user())
+
+    def order(self, products, archived=False):
+        if archived:
+            order = ArchivedOrder.objects.create(id=10 ** 6 + next(sequence), customer=self.customer,
+                                                 created_at=timezone.now(), update_at=timezone.now(),
+                                                 status=Order.STATUS_CONFIRM)
+            ArchivedOrderItem.objects.bulk_create([
+                ArchivedOrderItem(id=10 ** 6 + next(sequence), order=order, product_id=product.id,
+                                  title=product.title, unit_price=product.unit_price, quantity=1)
+                for product in products
+            ])
+        else:
+            order = Order.objects.create(customer=self.customer)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, title=product.title, unit_price=product.unit_price, quantity=1)
+                for product in products
+            ])
+
+    def neighbours(self, product):
+        return self.client.get(f'/store/products/{product.id}/frequently_bought_together/').json()
+
+    def test_rebuild_includes_archived_orders(self):
+        first, second, third, deleted = create_products(4)
+        self.order([first, second])
+        self.order([first, second], archived=True)
+        self.order([first, third, deleted], archived=True)
+        deleted.delete()
+        stats = recommendations.rebuild_cooccurrence()
+        self.assertEqual(stats['orders'], 3)
+        self.assertEqual(self.neighbours(first), [{'id': second.id, 'count': 2}, {'id': third.id, 'count': 1}])
+        self.assertFalse(ProductCooccurrence.objects.filter(product_id=deleted.id).exists())
+
+    def test_unknown_products_are_not_found(self):
+        self.assertEqual(self.client.get('/store/products/999999/frequently_bought_together/').status_code, 404)
+        self.assertEqual(self.client.get('/store/products/abc/frequently_bought_together/').status_code, 404)
+
+
+class ArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        cls.customer = Customer.objects.get(user=cls.user)
+
+    def order(self, status, days_ago, items=2):
+        order = create_order(self.customer, items)
+        Order.objects.filter(id=order.id).update(status=status, created_at=timezone.now() - timedelta(days=days_ago))
+        return order
+
+    def test_cold_orders_move_with_their_ids(self):
+        confirmed = self.order(Order.STATUS_CONFIRM, 800)
+        failed = self.order(Order.STATUS_FAILED, 800, items=1)
+        pending = self.order(Order.STATUS_PENDING, 800)
+        recent = self.order(Order.STATUS_CONFIRM, 30)
+        item_ids = set(OrderItem.objects.filter(order__in=[confirmed, failed]).values_list('id', flat=True))
+        totals = archive.archive_orders(months=18)
+        self.assertEqual((totals['orders'], totals['items']), (2, 3))
+        self.assertEqual(set(Order.objects.values_list('id', flat=True)), {pending.id, recent.id})
+        self.assertEqual(set(ArchivedOrder.objects.values_list('id', 'status')),
+                         {(confirmed.id, Order.STATUS_CONFIRM), (failed.id, Order.STATUS_FAILED)})
+        self.assertEqual(set(ArchivedOrderItem.objects.values_list('id', flat=True)), item_ids)
+        self.assertFalse(OrderItem.objects.filter(id__in=item_ids).exists())
+        self.assertEqual(archive.archive_orders(months=18)['orders'], 0)
+        api = APIClient()
+        api.force_authenticate(self.user)
+        self.assertEqual(api.get(f'/store/archived-orders/{confirmed.id}/').data['id'], confirmed.id)
+
+    def test_the_admin_cannot_delete_archived_orders(self):
+        order = self.order(Order.STATUS_CONFIRM, 800)
+        archive.archive_orders(months=18)
+        self.client.force_login(create_user(is_staff=True, is_superuser=True))
+        self.assertEqual(self.client.get(f'/admin/store/archivedorder/{order.id}/delete/').status_code, 403)
+        response = self.client.get('/admin/store/archivedorder/')
+        # Delete was the only action, so the changelist offers none.
+        self.assertIsNone(response.context['action_form'])
+        self.client.post('/admin/store/archivedorder/', {'action': 'delete_selected', '_selected_action': [order.id],
+                                                        'post': 'yes'})
+        self.assertTrue(ArchivedOrder.objects.filter(id=order.id).exists())
+
+    def test_the_membership_window_is_never_archived(self):
+        self.order(Order.STATUS_CONFIRM, 300)
+        self.assertEqual(archive.archive_orders(months=1)['orders'], 0)
+        self.assertLessEqual(archive.get_cutoff(1), timezone.now() - timedelta(days=365))
+
+    def test_batches_are_bounded(self):
+        for _ in range(3):
+            self.order(Order.STATUS_CONFIRM, 800)
+        totals = archive.archive_orders(months=18, batch_size=2, max_batches=1)
+        self.assertEqual((totals['orders'], totals['batches']), (2, 1))
+        self.assertEqual(archive.archive_orders(months=18, batch_size=2)['orders'], 1)
+
+    def test_months_ago_clamps_the_day(self):
+        moment = timezone.now().replace(year=2024, month=3, day=31)
+        self.assertEqual(archive.months_ago(moment, 1).date(), moment.replace(month=2, day=29).date())
+        self.assertEqual(archive.months_ago(moment, 15).date(), moment.replace(year=2022, month=12).date())
+
+
+class CartCacheTests(QueryCountTestCase):
+    def test_a_read_does_not_replace_a_newer_snapshot(self):
+        cart = Cart.objects.create()
+        product = create_products(1)[0]
+        stale = self.client.get(f'/store/carts/{cart.id}/').json()
+        CartItem.objects.create(cart=cart, product=product, quantity=1)
+        # A read that missed before the write committed fills after its refresh.
+        with self.captureOnCommitCallbacks(execute=True):
+            cart_cache.refresh_cart(cart.id)
+        cart_cache.add_cart_data(cart.id, stale)
+        self.assertEqual(len(self.client.get(f'/store/carts/{cart.id}/').json()['items']), 1)
+
+
+class FacetTestCase(TestCase):
+    def setUp(self):
+        self.products = create_products(3)
+
+    def assertFacetsExact(self):
+        stored = set(ProductFacetCount.objects.filter(count__gt=0)
+                     .values_list('collection_id', 'price_bucket', 'stock_band', 'count'))
+        self.assertEqual(stored, set(facets.grouped_counts(Product.objects.all())))
+
+
+class FacetTests(FacetTestCase):
+    def test_saves_update_counts_without_a_rebuild(self):
+        with mock.patch.object(facets, 'rebuild', side_effect=AssertionError('rebuilt')):
+            product = Product.objects.only('id', 'title').get(id=self.products[0].id)
+            product.stock = 5
+            product.save()
+            product = Product.objects.defer('unit_price').get(id=self.products[1].id)
+            product.unit_price = Decimal('300.00')
+            product.save()
+            Product.objects.get(id=self.products[2].id).delete()
+        self.assertFacetsExact()
+
+    def test_facet_search_is_paged(self):
+        with mock.patch('store.views.ProductViewset.facet_page_size', 2):
+            response = self.client.get('/store/products/facets/')
+            self.assertEqual((response.data['count'], len(response.data['results'])), (3, 2))
+            self.assertEqual(len(self.client.get(response.data['next']).data['results']), 1)
+        self.assertEqual(sum(row['count'] for row in response.data['facets']['stock']), 3)
+
+
+class StockFeedTests(FacetTestCase):
+    def feed(self, batch_id, *records):
+        return stock_feed.apply_feed(batch_id, [f'{product.id},{delta}' for product, delta in records])
+
+    def stocks(self):
+        return [Product.objects.get(id=product.id).stock for product in self.products]
+
+    def test_resent_batches_apply_nothing_twice(self):
+        report = self.feed('feed-1', (self.products[0], -60), (self.products[1], 5), (self.products[0], -50))
+        self.assertEqual((report['applied'], report['rejected']), (2, 1))
+        self.assertEqual(report['rejections'][0]['reason'], stock_feed.REASON_INSUFFICIENT_STOCK)
+        self.assertTrue(self.feed('feed-1', (self.products[0], -60))['duplicate'])
+        self.assertEqual(self.stocks(), [40, 105, 100])
+        self.assertFacetsExact()
+
+    def test_interrupted_batches_resume(self):
+        records = [(self.products[0], -1), (self.products[1], -1), (self.products[2], -1)]
+        apply_chunk = stock_feed._apply_chunk
+
+        def fail_second_chunk(batch_id, position, chunk):
+            if position == 1:
+                raise RuntimeError('interrupted')
+            return apply_chunk(batch_id, position, chunk)
+
+        with mock.patch.object(stock_feed, '_apply_chunk', fail_second_chunk), self.assertRaises(RuntimeError):
+            stock_feed.apply_feed('feed-2', [f'{product.id},{delta}' for product, delta in records], chunk_size=1)
+        stock_feed.apply_feed('feed-2', [f'{product.id},{delta}' for product, delta in records], chunk_size=1)
+        # The first record is not applied again.
+        self.assertEqual(self.stocks(), [99, 99, 99])
+
+    def test_announces_the_stock_change_applied(self):
+        product = self.products[0]
+        announced = []
+        receiver = lambda sender, changes, **kwargs: announced.append(changes)
+        stock_changed.connect(receiver)
+        self.addCleanup(stock_changed.disconnect, receiver)
+
+        def lower_stock(execute, sql, params, many, context):
+            # Stock drops behind the feed's back, so the clamp at zero applies.
+            if sql.startswith('UPDATE "store_product"') and not announced:
+                execute('UPDATE "store_product" SET "stock" = 10 WHERE "id" = %s', [product.id], False, context)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(lower_stock):
+            self.feed('feed-3', (product, -60))
+        self.assertEqual(self.stocks()[0], 0)
+        self.assertEqual(announced, [{product.id: -100}])
+        self.assertFacetsExact()
+
+    def test_malformed_lines_are_rejected(self):
+        staff = APIClient()
+        staff.force_authenticate(create_user(is_staff=True))
+        product = self.products[0]
+        body = b'\n'.join([b'\xff,1', b'{"product_id": %d, "delta": 2.5}' % product.id,
+                            b'{"product_id": %d, "delta": true}' % product.id, b'%d,-3' % product.id])
+        response = staff.post('/store/products/stock-feed/?batch_id=feed-4', body, content_type='text/plain')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['applied'], response.data['rejected']), (1, 3))
+        self.assertEqual({rejection['reason'] for rejection in response.data['rejections']},
+                         {stock_feed.REASON_INVALID})
+        self.assertEqual(stock_feed.parse_record('{"product_id": 1, "delta": 2.0}'), (1, 2))
+        self.assertEqual(self.stocks()[0], 97)
+
+
+class EstimatedCountTests(TestCase):
+    @skipUnless(connection.vendor == 'sqlite', 'Reads the SQLite statistics.')
+    def test_estimates_come_from_sqlite_statistics(self):
+        carts = [Cart.objects.create() for _ in range(5)]
+        # Deleted rows leave gaps that a rowid bound would still count.
+        Cart.objects.filter(id__in=[cart.id for cart in carts[:3]]).delete()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(estimate_row_count(Cart.objects.all()), 2)
+
+    def test_filtered_lists_keep_the_exact_count(self):
+        for _ in range(3):
+            Cart.objects.create()
+        with mock.patch('store.pagination.estimate_row_count', return_value=10 ** 6):
+            self.assertEqual(EstimatedCountPaginator(Cart.objects.order_by('id'), 10).count, 10 ** 6)
+            self.assertEqual(EstimatedCountPaginator(Cart.objects.filter(customer=None).order_by('id'), 10).count, 3)
@@ -0,0 +1,115 @@
+"""
+Token-bucket throttling shared by every worker on a host.
+
+Buckets live in a memory-mapped file (`THROTTLING['PATH']`) of fixed-size
+slots. A key hashes to a window of `PROBES` consecutive slots; the window is
+guarded by an fcntl byte-range lock (between processes) and a thread lock
+(within one), so all workers enforce one limit without a network cache.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+SLOT = struct.Struct('<Qdd')
+PROBES = 8
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+class TokenBucketStore:
+    def __init__(self, path, slots):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.slots = slots
+        size = slots * SLOT.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, rate, now=None):
+        """
+        Take one token from `key`'s bucket, refilled at `rate` tokens per second
+        up to `capacity`. Returns `(allowed, seconds until a token is available)`.
+        """
+        now = time.time() if now is None else now
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+        start = digest % (self.slots - PROBES + 1)
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, PROBES * SLOT.size, start * SLOT.size)
+            try:
+                offset = self._find_slot(digest, start)
+                owner, tokens, updated_at = SLOT.unpack_from(self._map, offset)
+                if owner != digest:
+                    tokens, updated_at = capacity, now
+                tokens = min(capacity, tokens + max(now - updated_at, 0) * rate)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                SLOT.pack_into(self._map, offset, digest, tokens, now)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, PROBES * SLOT.size, start * SLOT.size)
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+    def _find_slot(self, digest, start):
+        # The key's own slot, else an empty one, else the least recently used.
+        oldest = None
+        for index in range(start, start + PROBES):
+            offset = index * SLOT.size
+            owner, _, updated_at = SLOT.unpack_from(self._map, offset)
+            if owner == digest or owner == 0:
+                return offset
+            if oldest is None or updated_at < oldest[1]:
+                oldest = (offset, updated_at)
+        return oldest[0]
+
+
+_store = None
+_store_pid = None
+
+
+def get_store():
+    global _store, _store_pid
+    if _store is None or _store_pid != os.getpid():
+        config = getattr(settings, 'THROTTLING', {})
+        _store = TokenBucketStore(config.get('PATH', settings.BASE_DIR / '.cache' / 'throttle.buckets'),
+                                  config.get('SLOTS', 65536))
+        _store_pid = os.getpid()
+    return _store
+
+
+def parse_rate(rate):
+    """'20/min' -> (capacity 20, 20/60 tokens per second)."""
+    count, period = rate.split('/')
+    return int(count), int(count) / PERIODS[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttles per user when authenticated and per client IP otherwise.
+    Views map actions to scopes with `throttle_scopes`, e.g.
+    `{'create': 'cart_create'}`; the rate for each scope comes from
+    `REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']`. Unmapped actions are not throttled.
+    """
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scopes', {}).get(getattr(view, 'action', None))
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope) if scope else None
+        if rate is None:
+            return True
+        ident = f'user:{request.user.pk}' if request.user.is_authenticated else f'ip:{self.get_ident(request)}'
+        capacity, refill = parse_rate(rate)
+        allowed, self._wait = get_store().consume(f'{scope}:{ident}', capacity, refill)
+        return allowed
+
+    def wait(self):
+        return self._wait
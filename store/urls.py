@@ -11,6 +11,7 @@ router.register('addresses',views.AddressViewset,basename='address')
 router.register('collections',views.CollectionViewset)
 router.register('products',views.ProductViewset)
 router.register('orders',views.OrderViewset,basename='order')
+router.register('archived-orders',views.ArchivedOrderViewset,basename='archived-order')
 
 
 router.register('carts',views.CartViewset)
@@ -1,24 +1,41 @@
-from django.db.models import Q
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Prefetch, Q
 from django.db.models.aggregates import Count
 from rest_framework.decorators import action
-from rest_framework.exceptions import MethodNotAllowed
+from rest_framework.exceptions import MethodNotAllowed, ValidationError
 from rest_framework.mixins import (CreateModelMixin, ListModelMixin,
                                    RetrieveModelMixin, UpdateModelMixin)
-from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+from rest_framework.permissions import (SAFE_METHODS, IsAdminUser,
+                                        IsAuthenticated)
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet, ModelViewSet
 
-from store.models import (Address, Cart, CartItem, Collection, Customer, Order,
-                          Product)
+from likes.trending import engine as trending_engine
+from store import address_cache, cart_cache, cart_writer, facets, orders, stock_feed
+from store.mixins import SparseFieldsetMixin
+from store.models import (Address, ArchivedOrder, Cart, CartItem, Collection,
+                          Customer, Order, Product, ProductCooccurrence,
+                          ProductTombstone)
+from store.pagination import CatalogPagination, decode_cursor, encode_cursor
 from store.permissions import (AllowUnauthenticatedForCart, IsAdminOrReadOnly,
                                StaffUpdatePermission)
 from store.serializers import (AddCartItemSerializer, AddProductSerializer,
-                               AddressSerializer, CartItemSerializer,
+                               AddressSerializer, ArchivedOrderSerializer,
+                               BulkOrderTransitionSerializer, CartItemSerializer,
                                CartSerializer, CollectionSerializer,
                                MergeAnonymousCartSerializer, OrderSerializer,
                                ProductSerializer, SimpleCustomerSerializer,
+                               SimpleProductSerializer,
                                UpdateCartItemSerializer)
+from store.throttling import TokenBucketThrottle
 
+CUSTOMER_FIELDSET_QUERY = {
+    'only': ['customer','customer__user','customer__user__first_name','customer__user__last_name'],
+    'select_related': ['customer__user'],
+}
+CART_ITEMS_FIELDSET_QUERY = {
+    'prefetch_related': [Prefetch('items__product',queryset=Product.objects.only('id','title','unit_price'))],
+}
 
 # Create your views here.
 class AddressViewset(ModelViewSet):
@@ -30,7 +47,13 @@ class AddressViewset(ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         common_query = Address.objects.select_related('customer__user').all()
-        return common_query.filter(Q() if user.is_staff else Q(customer__user=user.id) )
+        return common_query if user.is_staff else common_query.filter(customer_id=address_cache.get_customer_id(user.id))
+
+    def list(self, request, *args, **kwargs):
+        if request.user.is_staff:
+            return super().list(request, *args, **kwargs)
+        customer_id = address_cache.get_customer_id(request.user.id)
+        return Response(address_cache.get_addresses(customer_id) if customer_id is not None else [])
 
 class CustomerViewset(ModelViewSet):
     serializer_class = SimpleCustomerSerializer
@@ -61,23 +84,149 @@ class CollectionViewset(ModelViewSet):
     serializer_class = CollectionSerializer
     queryset = Collection.objects.all().annotate(products_count=Count('products'))
     permission_classes = [IsAdminOrReadOnly]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scopes = {'list': 'catalog_list'}
 
-class ProductViewset(ModelViewSet):
+class ProductViewset(SparseFieldsetMixin,ModelViewSet):
+    sparse_fieldset_queries = {
+        'id': {},
+        'title': {'only': ['title']},
+        'collection': {'only': ['collection','collection__title'], 'select_related': ['collection']},
+        'unit_price': {'only': ['unit_price']},
+        'old_unit_price': {'only': ['old_unit_price']},
+        'stock': {'only': ['stock']},
+        'description': {'only': ['description']},
+    }
     def get_serializer_class(self): 
         method = self.request.method
         if method not in SAFE_METHODS:
             return AddProductSerializer
         return ProductSerializer
-    queryset = Product.objects.select_related('collection').all()
+    queryset = Product.objects.select_related('collection').order_by('title','id')
     permission_classes = [IsAdminOrReadOnly]
+    pagination_class = CatalogPagination
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scopes = {'list': 'catalog_list', 'facet_search': 'catalog_list'}
+    facet_page_size = 50
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'list':
+            try:
+                queryset = facets.filter_products(queryset, facets.parse_filters(self.request.query_params))
+            except ValueError:
+                raise ValidationError({'error': 'Unknown collection, price or stock filter.'})
+        return queryset
+
+    @action(detail=False, url_path='facets')
+    def facet_search(self, request):
+        try:
+            filters = facets.parse_filters(request.query_params)
+        except ValueError:
+            raise ValidationError({'error': 'Unknown collection, price or stock filter.'})
+        queryset = facets.filter_products(self.filter_queryset(self.get_queryset()), filters)
+        # Always paged, unlike the opt-in list.
+        self.paginator.page_size = self.facet_page_size
+        page = self.paginate_queryset(queryset)
+        data = self.paginator.get_paginated_response(self.get_serializer(page, many=True).data).data
+        data['facets'] = facets.counts(filters)
+        return Response(data)
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser], url_path='stock-feed')
+    def stock_feed(self, request):
+        batch_id = request.query_params.get('batch_id', '')
+        if not 0 < len(batch_id) <= 64:
+            raise ValidationError({'error': 'A batch_id of at most 64 characters is required.'})
+        # Read line by line rather than through the parsers, so large feeds are not held in memory.
+        stream = request.stream
+        lines = iter(stream.readline, b'') if stream is not None else []
+        return Response(stock_feed.apply_feed(batch_id, lines))
+
+    @action(detail=False)
+    def changes(self, request):
+        try:
+            cursor = request.query_params.get('cursor')
+            after = decode_cursor(cursor) if cursor else None
+            limit = int(request.query_params.get('limit', 100))
+            if not 1 <= limit <= 500:
+                raise ValueError
+        except ValueError:
+            raise ValidationError({'error': 'The cursor is invalid or the limit is not between 1 and 500.'})
 
-class CartViewset(RetrieveModelMixin,CreateModelMixin,GenericViewSet):
+        products = Product.objects.select_related('collection').order_by('update_at','id')
+        tombstones = ProductTombstone.objects.order_by('deleted_at','product_id')
+        if after:
+            timestamp, pk = after
+            products = products.filter(Q(update_at__gt=timestamp) | Q(update_at=timestamp,id__gt=pk))
+            tombstones = tombstones.filter(Q(deleted_at__gt=timestamp) | Q(deleted_at=timestamp,product_id__gt=pk))
+        changes = sorted(
+            [(product.update_at, product.id, product) for product in products[:limit + 1]] +
+            [(tombstone.deleted_at, tombstone.product_id, None) for tombstone in tombstones[:limit + 1]],
+            key=lambda change: change[:2]
+        )
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        return Response({
+            'results': [
+                {
+                    'id': pk,
+                    'deleted': product is None,
+                    'update_at': timestamp,
+                    'product': ProductSerializer(product).data if product else None,
+                } for (timestamp, pk, product) in changes
+            ],
+            'next_cursor': encode_cursor(*changes[-1][:2]) if changes else cursor,
+            'has_more': has_more,
+        })
+
+    @action(detail=False)
+    def trending(self, request):
+        try:
+            limit = max(min(int(request.query_params.get('limit', 10)), 100), 1)
+        except ValueError:
+            raise ValidationError({'error': 'The limit must be an integer.'})
+        ranking = trending_engine.top(ContentType.objects.get_for_model(Product).id, limit)
+        products = Product.objects.only('id','title','unit_price').in_bulk([object_id for (object_id, _) in ranking])
+        return Response([
+            {**SimpleProductSerializer(products[object_id]).data, 'score': round(score, 3)}
+            for (object_id, score) in ranking if object_id in products
+        ])
+
+    @action(detail=True)
+    def frequently_bought_together(self, request, pk):
+        product = self.get_object()
+        neighbours = ProductCooccurrence.objects.filter(product_id=product.id).values_list('neighbours',flat=True).first()
+        return Response([
+            {'id': product_id, 'count': count} for (product_id, count) in neighbours or []
+        ])
+
+class CartViewset(SparseFieldsetMixin,RetrieveModelMixin,CreateModelMixin,GenericViewSet):
     serializer_class = CartSerializer
+    sparse_fieldset_queries = {
+        'id': {},
+        'customer': CUSTOMER_FIELDSET_QUERY,
+        'items': CART_ITEMS_FIELDSET_QUERY,
+        'total_price': CART_ITEMS_FIELDSET_QUERY,
+    }
     queryset = Cart.objects.select_related('customer__user').prefetch_related('items__product').all()
     def get_serializer_context(self):
         return {'user_id':self.request.user.id}
     permission_classes = [AllowUnauthenticatedForCart]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scopes = {'create': 'cart_create', 'retrieve': 'cart_retrieve'}
     
+    def retrieve(self, request, *args, **kwargs):
+        data = cart_cache.get_cart_data(kwargs['pk'])
+        fields = self.get_sparse_fields()
+        if data is None:
+            response = super().retrieve(request, *args, **kwargs)
+            if fields is None:
+                cart_cache.add_cart_data(kwargs['pk'],response.data)
+            return response
+        if fields is not None:
+            data = {name: data[name] for name in fields}
+        return Response(data)
+
     @action(detail=True, methods=['post'])
     def merge_carts(self, request,pk):
         if request.method == 'POST':
@@ -85,6 +234,7 @@ class CartViewset(RetrieveModelMixin,CreateModelMixin,GenericViewSet):
             serializer = MergeAnonymousCartSerializer(cart,data=request.data,context={'auth_cart_id':cart.id,'anon_cart_id':pk})
             serializer.is_valid(raise_exception=True)
             merge_cart = serializer.save()
+            cart_cache.refresh_cart(merge_cart.id)
             serializer = CartSerializer(merge_cart)
             return Response(serializer.data)
 
@@ -97,25 +247,41 @@ class CartItemViewset(ModelViewSet):
         return CartItemSerializer
     
     def get_queryset(self):
-        return CartItem.objects.prefetch_related('cart').filter(cart_id=self.kwargs['cart_pk'])
+        return CartItem.objects.select_related('product').filter(cart_id=self.kwargs['cart_pk'])
 
     def create(self, request, *args, **kwargs):
         cart_item = CartItem.objects.filter(cart_id=self.kwargs['cart_pk'])
         if request.method =='POST':
             serializer = AddCartItemSerializer(cart_item,data=request.data,context={'cart_id':self.kwargs['cart_pk']})
             serializer.is_valid(raise_exception=True)
-            cart_item = serializer.save()
+            cart_item = cart_writer.write(serializer.save)
+            cart_cache.refresh_cart(self.kwargs['cart_pk'])
             serializer = CartItemSerializer(cart_item)
             return Response(serializer.data)
 
-class OrderViewset(ListModelMixin,RetrieveModelMixin,CreateModelMixin,UpdateModelMixin,GenericViewSet):
+    def perform_update(self, serializer):
+        cart_writer.write(serializer.save)
+        cart_cache.refresh_cart(self.kwargs['cart_pk'])
+
+    def perform_destroy(self, instance):
+        cart_writer.write(instance.delete)
+        cart_cache.refresh_cart(self.kwargs['cart_pk'])
+
+class OrderViewset(SparseFieldsetMixin,ListModelMixin,RetrieveModelMixin,CreateModelMixin,UpdateModelMixin,GenericViewSet):
     serializer_class = OrderSerializer
+    sparse_fieldset_queries = {
+        'id': {},
+        'customer': CUSTOMER_FIELDSET_QUERY,
+        'items': {'prefetch_related': ['items']},
+        'status': {'only': ['status']},
+        'total_price': {'prefetch_related': ['items']},
+    }
     permission_classes = [IsAuthenticated,StaffUpdatePermission]
     def check_permissions(self, request):
         return super().check_permissions(request)
     def get_queryset(self):
         user = self.request.user
-        common_query = Order.objects.select_related('customer__user').prefetch_related('items__product')
+        common_query = Order.objects.select_related('customer__user').prefetch_related('items')
         queryset = common_query.filter(
             Q() if user.is_staff else Q(customer__user=user)
         )
@@ -126,4 +292,61 @@ class OrderViewset(ListModelMixin,RetrieveModelMixin,CreateModelMixin,UpdateMode
             serializer.is_valid(raise_exception=True)
             order = serializer.save()
             serializer = OrderSerializer(order)
-            return Response(serializer.data)
\ No newline at end of file
+            return Response(serializer.data)
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def bulk_transition(self, request):
+        serializer = BulkOrderTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        outcomes = serializer.save()
+        return Response({
+            'updated': sum(1 for (outcome, _) in outcomes.values() if outcome == orders.OUTCOME_UPDATED),
+            'results': [
+                {'id': order_id, 'outcome': outcome, 'status': status}
+                for order_id, (outcome, status) in sorted(outcomes.items())
+            ],
+        })
+
+    @action(detail=False)
+    def history(self, request):
+        """The user's orders, recent and archived, newest first."""
+        try:
+            cursor = request.query_params.get('cursor')
+            before = decode_cursor(cursor) if cursor else None
+            limit = int(request.query_params.get('limit', 50))
+            if not 1 <= limit <= 500:
+                raise ValueError
+        except ValueError:
+            raise ValidationError({'error': 'The cursor is invalid or the limit is not between 1 and 500.'})
+
+        sources = [
+            (Order.objects.all(), OrderSerializer, False),
+            (ArchivedOrder.objects.all(), ArchivedOrderSerializer, True),
+        ]
+        entries = []
+        for queryset, serializer_class, archived in sources:
+            queryset = queryset.select_related('customer__user').prefetch_related('items')\
+                .filter(customer__user=request.user).order_by('-created_at','-id')
+            if before:
+                timestamp, pk = before
+                queryset = queryset.filter(Q(created_at__lt=timestamp) | Q(created_at=timestamp,id__lt=pk))
+            entries += [(order.created_at, order.id, order, serializer_class, archived) for order in queryset[:limit + 1]]
+        entries.sort(key=lambda entry: entry[:2], reverse=True)
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        return Response({
+            'results': [
+                {**serializer_class(order).data, 'created_at': created_at, 'archived': archived}
+                for (created_at, _, order, serializer_class, archived) in entries
+            ],
+            'next_cursor': encode_cursor(*entries[-1][:2]) if entries else cursor,
+            'has_more': has_more,
+        })
+
+class ArchivedOrderViewset(ListModelMixin,RetrieveModelMixin,GenericViewSet):
+    serializer_class = ArchivedOrderSerializer
+    permission_classes = [IsAuthenticated]
+    def get_queryset(self):
+        user = self.request.user
+        common_query = ArchivedOrder.objects.select_related('customer__user').prefetch_related('items')
+        return common_query.filter(Q() if user.is_staff else Q(customer__user=user))
\ No newline at end of file
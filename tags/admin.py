@@ -6,4 +6,6 @@ from tags.models import Tag
 # Register your models here.
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
+    list_display = ['label','usage_count']
+    readonly_fields = ['usage_count']
     search_fields = ['label']
\ No newline at end of file
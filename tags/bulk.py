@@ -0,0 +1,49 @@
+from django.db import transaction
+
+from tags import object_tags, usage
+from tags.models import TaggedItem
+
+
+def _existing(triples):
+    # One query over the (tag, content type, object) bounding set, narrowed in Python.
+    rows = TaggedItem.objects.filter(
+        tag_id__in={tag_id for (tag_id, _, _) in triples},
+        content_type_id__in={content_type_id for (_, content_type_id, _) in triples},
+        object_id__in={object_id for (_, _, object_id) in triples},
+    ).values_list('id', 'tag_id', 'content_type_id', 'object_id')
+    wanted = set(triples)
+    return {(tag_id, content_type_id, object_id): pk
+            for (pk, tag_id, content_type_id, object_id) in rows
+            if (tag_id, content_type_id, object_id) in wanted}
+
+
+def attach(triples):
+    """Tag every `(tag_id, content_type_id, object_id)`; returns `(created, existing)`."""
+    triples = list(dict.fromkeys(triples))
+    with transaction.atomic():
+        existing = _existing(triples)
+        created = [triple for triple in triples if triple not in existing]
+        TaggedItem.objects.bulk_create([
+            TaggedItem(tag_id=tag_id, content_type_id=content_type_id, object_id=object_id)
+            for (tag_id, content_type_id, object_id) in created
+        ], ignore_conflicts=True)
+        _changed(created)
+    return created, [triple for triple in triples if triple in existing]
+
+
+def detach(triples):
+    """Untag every `(tag_id, content_type_id, object_id)`; returns `(deleted, missing)`."""
+    triples = list(dict.fromkeys(triples))
+    with transaction.atomic():
+        existing = _existing(triples)
+        TaggedItem.objects.filter(id__in=existing.values()).delete()
+        _changed(existing)
+    return [triple for triple in triples if triple in existing], [triple for triple in triples if triple not in existing]
+
+
+def _changed(triples):
+    # Bulk writes skip the model hooks, and rows a concurrent request inserted
+    # first are skipped silently, so recount rather than add deltas.
+    if triples:
+        usage.recount({tag_id for (tag_id, _, _) in triples})
+        object_tags.invalidate({(content_type_id, object_id) for (_, content_type_id, object_id) in triples})
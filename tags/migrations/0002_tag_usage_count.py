@@ -0,0 +1,28 @@
+# Generated by Django 3.2.22 on 2026-10-19 17:58
+
+from django.db import migrations, models
+
+
+def populate_usage_counts(apps, schema_editor):
+    from tags import usage
+    usage.recount(tag_model=apps.get_model('tags', 'Tag'), item_model=apps.get_model('tags', 'TaggedItem'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tags', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='usage_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['usage_count'], name='tags_tag_usage_c_8c75d9_idx'),
+        ),
+        migrations.RunPython(populate_usage_counts, migrations.RunPython.noop),
+    ]
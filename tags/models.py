@@ -6,14 +6,44 @@ from django.db import models
 
 class Tag(models.Model):
     label = models.CharField(max_length=255)
+    # Maintained by tags.usage; the number of items carrying the tag.
+    usage_count = models.PositiveIntegerField(default=0)
     def __str__(self):
         return self.label
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Never write back a stale copy of the maintained count.
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name != 'usage_count']
+        super().save(*args, **kwargs)
+
+    class Meta:
+        indexes = [models.Index(fields=['usage_count'])]
+
 class TaggedItem(models.Model):
     tag = models.ForeignKey(Tag, on_delete=models.CASCADE,related_name='items')
     content_type = models.ForeignKey(ContentType,on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # post_save receivers compare against the values before this save.
+        self._loaded_values = {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields}
+
+    def delete(self, *args, **kwargs):
+        from tags import object_tags, usage
+        result = super().delete(*args, **kwargs)
+        usage.apply_deltas({self.tag_id: -1})
+        object_tags.invalidate([(self.content_type_id, self.object_id)])
+        return result
+
     class Meta:
         unique_together = ['tag','content_type','object_id']
\ No newline at end of file
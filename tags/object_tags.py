@@ -0,0 +1,95 @@
+"""
+In-process LRU cache of the tags on each object, keyed by
+`(content_type_id, object_id)` and holding at most
+`TAGS['OBJECT_CACHE_SIZE']` objects.
+
+Tagging changes made through the models or `tags.bulk` evict the objects
+they touch, now and again once they commit; relabelled or deleted tags
+clear the whole cache. Other workers keep their copies for at most
+`TAGS['OBJECT_CACHE_TTL']` seconds.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+
+from tags.models import TaggedItem
+
+
+def get_setting(name, default):
+    return getattr(settings, 'TAGS', {}).get(name, default)
+
+
+class ObjectTagCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # Bumped by every eviction, so a lookup that raced one is not cached.
+        self._generation = 0
+
+    def get_many(self, content_type_id, object_ids):
+        """`{object_id: [{'id', 'label'}, ...]}` for `object_ids`, loading the misses in one query."""
+        now = time.monotonic()
+        found, missing = {}, []
+        with self._lock:
+            generation = self._generation
+            for object_id in dict.fromkeys(object_ids):
+                key = (content_type_id, object_id)
+                entry = self._entries.get(key)
+                if entry is None or entry[0] <= now:
+                    missing.append(object_id)
+                    continue
+                self._entries.move_to_end(key)
+                found[object_id] = entry[1]
+        if missing:
+            loaded = {object_id: [] for object_id in missing}
+            for object_id, tag_id, label in TaggedItem.objects.filter(
+                content_type_id=content_type_id, object_id__in=missing,
+            ).order_by('tag__label', 'tag_id').values_list('object_id', 'tag_id', 'tag__label'):
+                loaded[object_id].append((tag_id, label))
+            self._store(content_type_id, loaded, generation, now + get_setting('OBJECT_CACHE_TTL', 60))
+            found.update(loaded)
+        return {object_id: [{'id': tag_id, 'label': label} for (tag_id, label) in tags]
+                for object_id, tags in found.items()}
+
+    def get(self, content_type_id, object_id):
+        return self.get_many(content_type_id, [object_id])[object_id]
+
+    def _store(self, content_type_id, loaded, generation, expires_at):
+        size = get_setting('OBJECT_CACHE_SIZE', 10000)
+        with self._lock:
+            if generation != self._generation:
+                return
+            for object_id, tags in loaded.items():
+                self._entries[(content_type_id, object_id)] = (expires_at, tuple(tags))
+                self._entries.move_to_end((content_type_id, object_id))
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def evict(self, keys):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+cache = ObjectTagCache()
+
+
+def invalidate(keys):
+    """Evict `(content_type_id, object_id)` keys now and once the transaction commits."""
+    keys = list(keys)
+    cache.evict(keys)
+    transaction.on_commit(lambda: cache.evict(keys))
+
+
+def invalidate_all():
+    cache.clear()
+    transaction.on_commit(cache.clear)
@@ -1,12 +1,15 @@
+from django.contrib.contenttypes.models import ContentType
 from rest_framework import serializers
 
+from tags import bulk
 from tags.models import Tag, TaggedItem
 
 
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
-        fields = ['id','label']
+        fields = ['id','label','usage_count']
+        read_only_fields = ['usage_count']
 
 class TaggedItemSerializer(serializers.ModelSerializer):
     
@@ -25,4 +28,57 @@ class TaggedItemSerializer(serializers.ModelSerializer):
         (self.instance, created) = TaggedItem.objects.get_or_create(tag_id=tag_id, **validated_data)
         if not created:
             raise serializers.ValidationError({'error': f"A TaggedItem with tag ID {tag_id}, object ID {object_id}, and content type '{content_type}' already exists."})
-        return self.instance
\ No newline at end of file
+        return self.instance
+
+class ObjectReferenceSerializer(serializers.Serializer):
+    content_type = serializers.IntegerField()
+    object_id = serializers.IntegerField(min_value=0)
+
+    def validate_content_type(self, value):
+        try:
+            ContentType.objects.get_for_id(value)
+        except ContentType.DoesNotExist:
+            raise serializers.ValidationError(f"Content type with ID {value} does not exist.")
+        return value
+
+class BulkTaggingMixin:
+    """Attach and detach for serializers whose `get_triples` gives `(tag_id, content_type_id, object_id)`."""
+
+    def attach(self):
+        created, existing = bulk.attach(self.get_triples())
+        return {'created': self._as_items(created), 'existing': self._as_items(existing)}
+
+    def detach(self):
+        deleted, missing = bulk.detach(self.get_triples())
+        return {'deleted': self._as_items(deleted), 'missing': self._as_items(missing)}
+
+    def _as_items(self, triples):
+        return [{'tag': tag_id, 'content_type': content_type_id, 'object_id': object_id}
+                for (tag_id, content_type_id, object_id) in triples]
+
+class BulkTaggedItemSerializer(BulkTaggingMixin, serializers.Serializer):
+    """One tag (`context['tag_id']`) to or from many objects."""
+    items = ObjectReferenceSerializer(many=True,allow_empty=False,max_length=10000)
+
+    def validate(self, attrs):
+        if not Tag.objects.filter(id=self.context['tag_id']).exists():
+            raise serializers.ValidationError({'error':"Tag with the given ID does not exist."})
+        return attrs
+
+    def get_triples(self):
+        tag_id = self.context['tag_id']
+        return [(tag_id, item['content_type'], item['object_id']) for item in self.validated_data['items']]
+
+class BulkObjectTagsSerializer(BulkTaggingMixin, ObjectReferenceSerializer):
+    """Many tags to or from one object."""
+    tags = serializers.ListField(child=serializers.IntegerField(),allow_empty=False,max_length=1000)
+
+    def validate_tags(self, value):
+        missing = set(value) - set(Tag.objects.filter(id__in=value).values_list('id',flat=True))
+        if missing:
+            raise serializers.ValidationError(f"Tags with IDs {sorted(missing)} do not exist.")
+        return value
+
+    def get_triples(self):
+        content_type_id, object_id = self.validated_data['content_type'], self.validated_data['object_id']
+        return [(tag_id, content_type_id, object_id) for tag_id in self.validated_data['tags']]
@@ -0,0 +1,34 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from tags import object_tags, usage
+from tags.models import Tag, TaggedItem
+
+# TaggedItem deletes are counted by TaggedItem.delete rather than a
+# post_delete receiver, which would make every queryset delete send a
+# signal per row; tags.bulk recounts after its own deletes.
+
+
+@receiver(post_save,sender=TaggedItem)
+def update_usage_for_saved_item(sender,**kwargs):
+    item = kwargs['instance']
+    loaded = getattr(item,'_loaded_values',None)
+    keys = {(item.content_type_id,item.object_id)}
+    if kwargs['created']:
+        usage.apply_deltas({item.tag_id: 1})
+    elif loaded is None or any(field not in loaded for field in ('tag_id','content_type_id','object_id')):
+        # Loaded without the tagging fields, so the old row is unknown.
+        usage.recount()
+        object_tags.invalidate_all()
+        return
+    else:
+        if loaded['tag_id'] != item.tag_id:
+            usage.apply_deltas({loaded['tag_id']: -1, item.tag_id: 1})
+        keys.add((loaded['content_type_id'],loaded['object_id']))
+    object_tags.invalidate(keys)
+
+@receiver(post_save,sender=Tag)
+@receiver(post_delete,sender=Tag)
+def invalidate_object_tags_for_tag(sender,**kwargs):
+    if not kwargs.get('created'):
+        object_tags.invalidate_all()
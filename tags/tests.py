@@ -1,3 +1,99 @@
-from django.test import TestCase
+from django.contrib.contenttypes.models import ContentType
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from core.models import User
+from core.testing import QueryCountTestCase
+from store.models import Collection, Product
+from tags import object_tags
+from tags.models import Tag, TaggedItem
+
+
+class TagsTestCase(QueryCountTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        cls.content_type = ContentType.objects.get_for_model(Product)
+        cls.collection = Collection.objects.create(title='Collection')
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.staff)
+        self.tags, self.products = [], []
+
+    def products_and_tags(self, count):
+        self.tags[:] = [Tag.objects.create(label=f'Tag {index}') for index in range(count)]
+        self.products[:] = [
+            Product.objects.create(title=f'Product {index}', collection=self.collection, unit_price=10,
+                                   old_unit_price=12, stock=10, description='')
+            for index in range(count)
+        ]
+
+    def tagged(self, count):
+        self.products_and_tags(count)
+        TaggedItem.objects.bulk_create([
+            TaggedItem(tag=self.tags[0], content_type=self.content_type, object_id=product.id)
+            for product in self.products
+        ])
+
+    def items(self):
+        return [{'content_type': self.content_type.id, 'object_id': product.id} for product in self.products]
+
+
+class TagsQueryCountTests(TagsTestCase):
+    def test_tag_list(self):
+        self.assertQueriesConstant(self.products_and_tags, lambda: self.api.get('/tags/tag/'))
+
+    def test_tagged_item_list(self):
+        self.assertQueriesConstant(self.tagged, lambda: self.api.get(f'/tags/tag/{self.tags[0].id}/items/'))
+
+    def test_tag_attach_objects(self):
+        self.assertQueriesConstant(
+            self.products_and_tags,
+            lambda: self.api.post(f'/tags/tag/{self.tags[0].id}/items/attach/', {'items': self.items()}, format='json'),
+        )
+
+    def test_tag_detach_objects(self):
+        self.assertQueriesConstant(
+            self.tagged,
+            lambda: self.api.post(f'/tags/tag/{self.tags[0].id}/items/detach/', {'items': self.items()}, format='json'),
+        )
+
+    def test_object_attach_tags(self):
+        self.assertQueriesConstant(
+            self.products_and_tags,
+            lambda: self.api.post('/tags/tag/attach/', {
+                'content_type': self.content_type.id, 'object_id': self.products[0].id,
+                'tags': [tag.id for tag in self.tags],
+            }, format='json'),
+        )
+
+    def test_tag_cloud(self):
+        self.assertQueriesConstant(self.tagged, lambda: self.api.get('/tags/tag/cloud/'))
+
+    def test_object_tags(self):
+        object_tags.cache.clear()
+        self.assertQueriesConstant(
+            self.tagged,
+            lambda: self.api.get('/tags/tag/objects/', {
+                'content_type': self.content_type.id, 'object_id': [product.id for product in self.products],
+            }),
+        )
+
+
+class BulkTaggingTests(TagsTestCase):
+    def test_attach_and_detach_report_each_item(self):
+        self.products_and_tags(2)
+        path = f'/tags/tag/{self.tags[0].id}/items/'
+        TaggedItem.objects.create(tag=self.tags[0], content_type=self.content_type, object_id=self.products[0].id)
+        response = self.api.post(f'{path}attach/', {'items': self.items()}, format='json')
+        self.assertEqual([item['object_id'] for item in response.data['created']], [self.products[1].id])
+        self.assertEqual([item['object_id'] for item in response.data['existing']], [self.products[0].id])
+        response = self.api.post(f'{path}detach/', {'items': self.items()}, format='json')
+        self.assertEqual(len(response.data['deleted']), 2)
+        self.assertEqual(Tag.objects.get(id=self.tags[0].id).usage_count, 0)
+
+    def test_non_integer_tag_ids_are_rejected(self):
+        self.products_and_tags(1)
+        self.assertEqual(self.api.get('/tags/tag/abc/items/').status_code, 400)
+        self.assertEqual(self.api.post('/tags/tag/abc/items/attach/', {'items': self.items()},
+                                       format='json').status_code, 400)
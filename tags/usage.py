@@ -0,0 +1,44 @@
+"""
+Per-tag usage counts for the tag cloud, kept in `Tag.usage_count`.
+
+Single `TaggedItem` saves and deletes adjust the counts with `F()` updates
+from `tags.signals`. The bulk paths in `tags.bulk` may skip rows that a
+concurrent request inserted first, so they `recount` the tags they touched
+instead, and `recount()` with no ids rebuilds every count.
+"""
+import math
+
+from django.db import models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from tags.models import Tag, TaggedItem
+
+CLOUD_WEIGHTS = 5
+
+
+def apply_deltas(deltas):
+    """Add `{tag_id: delta}` to the usage counts."""
+    for tag_id, delta in deltas.items():
+        if delta:
+            Tag.objects.filter(id=tag_id).update(usage_count=F('usage_count') + delta)
+
+
+def recount(tag_ids=None, tag_model=None, item_model=None):
+    """Recompute the usage counts of `tag_ids`, or of every tag, in one UPDATE."""
+    tag_model, item_model = tag_model or Tag, item_model or TaggedItem
+    counts = item_model.objects.filter(tag_id=OuterRef('id')).order_by().values('tag_id').annotate(count=Count('id'))
+    tags = tag_model.objects.all() if tag_ids is None else tag_model.objects.filter(id__in=set(tag_ids))
+    tags.update(usage_count=Coalesce(Subquery(counts.values('count'), output_field=models.IntegerField()), 0))
+
+
+def cloud(limit):
+    """The `limit` most used tags, with a weight from 1 to `CLOUD_WEIGHTS` on a log scale."""
+    tags = list(Tag.objects.filter(usage_count__gt=0).order_by('-usage_count', 'label', 'id')
+                .values('id', 'label', 'usage_count')[:limit])
+    if tags:
+        low, high = math.log(tags[-1]['usage_count']), math.log(tags[0]['usage_count'])
+        for tag in tags:
+            scale = (math.log(tag['usage_count']) - low) / (high - low) if high > low else 1
+            tag['weight'] = 1 + round(scale * (CLOUD_WEIGHTS - 1))
+    return tags
@@ -1,8 +1,14 @@
+from django.contrib.contenttypes.models import ContentType
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
 from store.permissions import IsAdminOrReadOnly
+from tags import object_tags, usage
 from tags.models import Tag, TaggedItem
-from tags.serializers import TaggedItemSerializer, TagSerializer
+from tags.serializers import (BulkObjectTagsSerializer, BulkTaggedItemSerializer,
+                              TaggedItemSerializer, TagSerializer)
 
 # Create your views here.
 
@@ -11,10 +17,64 @@ class TagViewset(ModelViewSet):
     permission_classes = [IsAdminOrReadOnly]
     serializer_class = TagSerializer
 
+    @action(detail=False)
+    def cloud(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 50))
+            if not 1 <= limit <= 500:
+                raise ValueError
+        except ValueError:
+            raise ValidationError({'error': 'The limit must be between 1 and 500.'})
+        return Response(usage.cloud(limit))
+
+    @action(detail=False)
+    def objects(self, request):
+        """Tags of up to 500 objects of one content type, by object id."""
+        try:
+            content_type_id = int(request.query_params['content_type'])
+            ContentType.objects.get_for_id(content_type_id)
+            object_ids = [int(value) for param in request.query_params.getlist('object_id')
+                          for value in param.split(',') if value]
+            if not 1 <= len(object_ids) <= 500:
+                raise ValueError
+        except (KeyError, ValueError, ContentType.DoesNotExist):
+            raise ValidationError({'error': 'Provide a valid content_type and 1 to 500 object_id values.'})
+        return Response(object_tags.cache.get_many(content_type_id, object_ids))
+
+    @action(detail=False, methods=['post'])
+    def attach(self, request):
+        serializer = BulkObjectTagsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.attach())
+
+    @action(detail=False, methods=['post'])
+    def detach(self, request):
+        serializer = BulkObjectTagsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.detach())
+
 class TaggedItemViewset(ModelViewSet):
     def get_queryset(self):
-        return TaggedItem.objects.select_related('tag').filter(tag=self.kwargs['tag_pk'])
+        return TaggedItem.objects.select_related('tag').filter(tag=self.get_tag_id())
     permission_classes = [IsAdminOrReadOnly]
     serializer_class = TaggedItemSerializer
     def get_serializer_context(self):
-        return {'tag_id':self.kwargs['tag_pk']}
+        return {'tag_id':self.get_tag_id()}
+
+    def get_tag_id(self):
+        try:
+            return int(self.kwargs['tag_pk'])
+        except ValueError:
+            raise ValidationError({'error':'The tag ID must be an integer.'})
+
+    @action(detail=False, methods=['post'])
+    def attach(self, request, tag_pk):
+        serializer = BulkTaggedItemSerializer(data=request.data,context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.attach())
+
+    @action(detail=False, methods=['post'])
+    def detach(self, request, tag_pk):
+        serializer = BulkTaggedItemSerializer(data=request.data,context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.detach())